@@ -0,0 +1,277 @@
+"""
+This module contains vectorized aggregation functions for WeatherStore data,
+which group daily temperatures into monthly and yearly buckets and compute
+percentiles and box plot statistics, so the plotting layer only receives summaries.
+"""
+
+import numpy as np
+
+MONTH_LABELS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+def grouped_quantiles(groups, values, group_count, quantiles):
+    """ Returns an array of shape (group_count, len(quantiles)) holding the quantiles of the values
+    in each group, using linear interpolation like numpy.percentile. Empty groups are NaN.
+    Groups must be integers in range(group_count) and values must not contain NaN. """
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    positions = starts[:, None] + np.asarray(quantiles)[None, :] * np.maximum(counts - 1, 0)[:, None]
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, np.maximum(starts + counts - 1, 0)[:, None])
+    fraction = positions - lower
+
+    if len(sorted_values) == 0:
+        return np.full((group_count, len(quantiles)), np.nan)
+
+    lower = np.clip(lower, 0, len(sorted_values) - 1)
+    upper = np.clip(upper, 0, len(sorted_values) - 1)
+    result = sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+    result[counts == 0] = np.nan
+    return result
+
+def grouped_boxplot_stats(groups, values, group_count, labels=None, whis=1.5):
+    """ Returns a list of box plot statistics for each group, in the format accepted by
+    matplotlib's Axes.bxp: quartiles, whiskers at the furthest points within whis * IQR,
+    outliers beyond them, and the mean. """
+    present = ~np.isnan(values)
+    groups = np.asarray(groups, dtype=np.int64)[present]
+    values = np.asarray(values, dtype=np.float64)[present]
+
+    q1, median, q3 = grouped_quantiles(groups, values, group_count, [0.25, 0.5, 0.75]).T
+    counts = np.bincount(groups, minlength=group_count)
+    sums = np.bincount(groups, weights=values, minlength=group_count)
+    low_bound = q1 - whis * (q3 - q1)
+    high_bound = q3 + whis * (q3 - q1)
+
+    inside = (values >= low_bound[groups]) & (values <= high_bound[groups])
+    whislo = np.full(group_count, np.inf)
+    whishi = np.full(group_count, -np.inf)
+    np.minimum.at(whislo, groups[inside], values[inside])
+    np.maximum.at(whishi, groups[inside], values[inside])
+
+    outliers = ~inside
+    flier_order = np.argsort(groups[outliers], kind="stable")
+    flier_groups = groups[outliers][flier_order]
+    fliers = np.split(values[outliers][flier_order],
+                      np.searchsorted(flier_groups, np.arange(1, group_count)))
+
+    stats = []
+    for index in range(group_count):
+        empty = counts[index] == 0
+        stats.append({
+            'label': labels[index] if labels else str(index + 1),
+            'count': int(counts[index]),
+            'mean': np.nan if empty else sums[index] / counts[index],
+            'med': median[index],
+            'q1': q1[index],
+            'q3': q3[index],
+            'whislo': np.nan if empty else whislo[index],
+            'whishi': np.nan if empty else whishi[index],
+            'fliers': fliers[index],
+        })
+    return stats
+
+def monthly_boxplot_stats(store, start_year, end_year, whis=1.5):
+    """ Returns box plot statistics of mean temperatures for each calendar month
+    across the given span of years. """
+    span = store.year_span(start_year, end_year)
+    return grouped_boxplot_stats(span.months() - 1, span.mean, 12, MONTH_LABELS, whis)
+
+def monthly_boxplot_stats_by_location(stores, start_year, end_year, whis=1.5):
+    """ Accepts a dictionary of location: WeatherStore pairs and
+    returns a dictionary of location: monthly box plot statistics. """
+    return {location: monthly_boxplot_stats(store, start_year, end_year, whis)
+            for location, store in stores.items()}
+
+def yearly_summary(store):
+    """ Returns a dictionary of arrays holding the year, day count,
+    mean, minimum and maximum of the mean temperatures for each year in the store. """
+    present = ~np.isnan(store.mean)
+    years = store.years()[present]
+    values = store.mean[present].astype(np.float64)
+    if len(years) == 0:
+        return {'year': years, 'count': years, 'mean': values, 'min': values, 'max': values}
+
+    first_year = years.min()
+    groups = years - first_year
+    group_count = int(groups.max()) + 1
+    counts = np.bincount(groups, minlength=group_count)
+    sums = np.bincount(groups, weights=values, minlength=group_count)
+    lows = np.full(group_count, np.inf)
+    highs = np.full(group_count, -np.inf)
+    np.minimum.at(lows, groups, values)
+    np.maximum.at(highs, groups, values)
+
+    keep = counts > 0
+    return {
+        'year': np.arange(first_year, first_year + group_count)[keep],
+        'count': counts[keep],
+        'mean': sums[keep] / counts[keep],
+        'min': lows[keep],
+        'max': highs[keep],
+    }
+
+def daily_series(store, year, month):
+    """ Returns the (days, mean temperatures) series of a single month. """
+    span = store.month(year, month)
+    return span.days(), span.mean
+
+class DayColumns:
+    """ Represents the weather table rows written by one transaction as float64 columns in date order,
+    with NaN for missing values, so the monthly summaries of months which hold no other days
+    can be computed without reading the rows back. Months are indexed as year * 12 + month - 1. """
+    def __init__(self):
+        """ Initializes an empty instance of the DayColumns class. """
+        self.chunks = []
+        self.columns = None
+        self.groups = {}
+        self.whole_months = set()
+
+    def add(self, rows):
+        """ Adds a chunk of (date, location, min, max, mean, quality) weather table rows. """
+        dates, _, min_temps, max_temps, mean_temps, quality = zip(*rows)
+        flagged = np.zeros(len(rows), dtype=bool)
+        flagged[[index for index, code in enumerate(quality) if code is not None]] = True
+        self.chunks.append((np.array(dates, dtype="datetime64[D]").astype(np.int64),
+                            np.array(min_temps, dtype=np.float64),
+                            np.array(max_temps, dtype=np.float64),
+                            np.array(mean_temps, dtype=np.float64),
+                            flagged))
+        self.columns = None
+        self.groups = {}
+
+    def covers(self, months):
+        """ Returns the 'YYYY-MM' months among the given ones whose stored days are all held here,
+        as recorded in whole_months by the writer. """
+        return set(months) & self.whole_months
+
+    def group(self, months):
+        """ Returns (keys, groups, columns) for the days of the given 'YYYY-MM' months: the sorted
+        month indexes, the position of each day's month in keys, and a dictionary of the
+        "min", "max", "mean" and "flagged" columns. Results are kept for the next call with the same months. """
+        months = frozenset(months)
+        if months in self.groups:
+            return self.groups[months]
+
+        if self.columns is None:
+            chunks = self.chunks or [(np.array([], dtype=np.int64), np.array([]), np.array([]), np.array([]),
+                                      np.array([], dtype=bool))]
+            days, *columns = (np.concatenate(column) for column in zip(*chunks))
+            order = np.argsort(days, kind="stable")
+            month_index = days[order].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) + 1970 * 12
+            self.columns = [month_index] + [column[order] for column in columns]
+
+        month_index, min_temps, max_temps, mean_temps, flagged = self.columns
+        wanted = np.array([int(month[:4]) * 12 + int(month[5:7]) - 1 for month in months], dtype=np.int64)
+        selected = np.isin(month_index, wanted)
+        keys, groups = np.unique(month_index[selected], return_inverse=True)
+        self.groups[months] = keys, groups, {"min": min_temps[selected], "max": max_temps[selected],
+                                             "mean": mean_temps[selected], "flagged": flagged[selected]}
+        return self.groups[months]
+
+    def flagged_counts(self, months):
+        """ Returns a dictionary of (year, month): number of days with a quality flag
+        for the given 'YYYY-MM' months. """
+        keys, groups, columns = self.group(months)
+        counts = np.bincount(groups[columns["flagged"]], minlength=len(keys))
+        return {(int(key) // 12, int(key) % 12 + 1): int(count) for key, count in zip(keys, counts)}
+
+def encode_sketch(values):
+    """ Encodes temperatures as a compact quantile sketch: the distinct values in tenths of a degree
+    with their counts, stored as little-endian int32 pairs. Temperatures are recorded to a tenth
+    of a degree, so quantiles computed from the sketch match those of the raw values. """
+    tenths = np.round(np.asarray(values, dtype=np.float64) * 10).astype(np.int64)
+    distinct, counts = np.unique(tenths, return_counts=True)
+    return np.column_stack((distinct, counts)).astype("<i4").tobytes()
+
+def encode_month_sketches(months, values):
+    """ Accepts the month index and temperature of each day, with no NaN temperatures, and returns
+    a dictionary of month index: quantile sketch of the month's temperatures, encoded like encode_sketch. """
+    # Each (month, tenths) pair is packed into one integer, so a single unique call counts them all.
+    keys = np.asarray(months, dtype=np.int64) << 32 | np.round(np.asarray(values) * 10).astype(np.int64) + 2 ** 31
+    keys, counts = np.unique(keys, return_counts=True)
+    months = keys >> 32
+    pairs = np.column_stack(((keys & 0xFFFFFFFF) - 2 ** 31, counts)).astype("<i4")
+    starts = np.flatnonzero(np.diff(months, prepend=-1))
+    ends = np.append(starts[1:], len(months))
+    return {month: pairs[start:end].tobytes()
+            for month, start, end in zip(months[starts].tolist(), starts.tolist(), ends.tolist())}
+
+def month_rollups(days, months):
+    """ Returns the weather_monthly rows of the given 'YYYY-MM' months held in a DayColumns,
+    as (year, month, day_count, mean_sum, mean_min, mean_max, sketch) tuples for the months with means. """
+    keys, groups, columns = days.group(months)
+    present = ~np.isnan(columns["mean"])
+    means = columns["mean"][present]
+    counts = np.bincount(groups[present], minlength=len(keys))
+    sums = np.bincount(groups[present], weights=means, minlength=len(keys))
+    lows = np.full(len(keys), np.inf)
+    highs = np.full(len(keys), -np.inf)
+    np.minimum.at(lows, groups[present], means)
+    np.maximum.at(highs, groups[present], means)
+    sketches = encode_month_sketches(keys[groups[present]], means)
+
+    return [(int(key) // 12, int(key) % 12 + 1, int(count), float(total), float(low), float(high), sketches[int(key)])
+            for key, count, total, low, high in zip(keys, counts, sums, lows, highs) if count]
+
+def decode_sketch(blob):
+    """ Decodes a quantile sketch into arrays of (values, counts). """
+    pairs = np.frombuffer(blob, dtype="<i4").reshape(-1, 2)
+    return pairs[:, 0] / 10.0, pairs[:, 1].astype(np.int64)
+
+def merge_sketches(blobs):
+    """ Merges quantile sketches into one set of sorted (values, counts) arrays. """
+    pairs = [np.frombuffer(blob, dtype="<i4").reshape(-1, 2) for blob in blobs if blob]
+    if not pairs:
+        return np.array([], dtype=np.float64), np.array([], dtype=np.int64)
+
+    pairs = np.concatenate(pairs)
+    distinct, inverse = np.unique(pairs[:, 0], return_inverse=True)
+    counts = np.bincount(inverse, weights=pairs[:, 1], minlength=len(distinct)).astype(np.int64)
+    return distinct / 10.0, counts
+
+def histogram_quantiles(values, counts, quantiles):
+    """ Returns quantiles of a sorted histogram of values, interpolating like numpy.percentile. """
+    total = counts.sum()
+    if total == 0:
+        return np.full(len(quantiles), np.nan)
+
+    cumulative = np.cumsum(counts)
+    positions = np.asarray(quantiles) * (total - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, total - 1)
+    lower_values = values[np.searchsorted(cumulative, lower, side="right")]
+    upper_values = values[np.searchsorted(cumulative, upper, side="right")]
+    return lower_values + (upper_values - lower_values) * (positions - lower)
+
+def rollup_boxplot_stats(rollups, whis=1.5):
+    """ Accepts monthly rollup rows of (month, day_count, mean_sum, sketch)
+    and returns box plot statistics for each calendar month, merged across years. """
+    by_month = [[] for _ in range(12)]
+    for month, day_count, mean_sum, sketch in rollups:
+        by_month[month - 1].append((day_count, mean_sum, sketch))
+
+    stats = []
+    for index, rows in enumerate(by_month):
+        values, counts = merge_sketches(sketch for _, _, sketch in rows)
+        count = int(counts.sum())
+        q1, median, q3 = histogram_quantiles(values, counts, [0.25, 0.5, 0.75])
+        low_bound = q1 - whis * (q3 - q1)
+        high_bound = q3 + whis * (q3 - q1)
+        inside = (values >= low_bound) & (values <= high_bound)
+        outside = ~inside
+
+        stats.append({
+            'label': MONTH_LABELS[index],
+            'count': count,
+            'mean': sum(mean_sum for _, mean_sum, _ in rows) / count if count else np.nan,
+            'med': median,
+            'q1': q1,
+            'q3': q3,
+            'whislo': values[inside].min() if inside.any() else np.nan,
+            'whishi': values[inside].max() if inside.any() else np.nan,
+            'fliers': np.repeat(values[outside], counts[outside]),
+        })
+    return stats
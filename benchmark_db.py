@@ -0,0 +1,70 @@
+"""
+This module compares the rows/sec of the original one-execute-per-row insert
+with the batched DBOperations.save_data path, using synthetic daily rows.
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+from db_operations import DBOperations
+from synthetic_data import synthetic_day
+from weather_logger import WeatherLogger
+
+# Benchmark runs log to a temporary directory rather than the application's log file.
+WeatherLogger.log_file = os.path.join(tempfile.gettempdir(), "weather_benchmark.log")
+
+def synthetic_rows(days, station_id=27174):
+    """ Yields (date, values) pairs for the given number of consecutive synthetic days. """
+    day = date(1840, 3, 1)
+    for _ in range(days):
+        max_temp, min_temp, mean_temp = synthetic_day(station_id, day.year, day.month, day.day)
+        yield day.isoformat(), {'Max': max_temp, 'Min': min_temp, 'Mean': mean_temp}
+        day += timedelta(days=1)
+
+def legacy_save(db_name, weather_data, location="Winnipeg, MB"):
+    """ Inserts rows the way save_data originally did, with one execute per row. """
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    for sample_date, data in weather_data.items():
+        cursor.execute('''
+            INSERT OR IGNORE INTO weather
+                (sample_date, location, min_temp, max_temp, avg_temp)
+            VALUES
+                (?, ?, ?, ?, ?)
+        ''', (sample_date, location, data.get('Min'), data.get('Max'), data.get('Mean')))
+    conn.commit()
+    conn.close()
+
+def time_insert(save, weather_data):
+    """ Runs an insert into a fresh database and returns the elapsed seconds. """
+    with tempfile.TemporaryDirectory() as directory:
+        db_ops = DBOperations(os.path.join(directory, "bench.sqlite"))
+        db_ops.initialize_db()
+        start = time.perf_counter()
+        save(db_ops, weather_data)
+        return time.perf_counter() - start
+
+def main():
+    """ Runs the insert benchmark and prints rows/sec for each path. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=60000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    weather_data = dict(synthetic_rows(args.rows))
+    paths = [
+        ("legacy", lambda db_ops, data: legacy_save(db_ops.db_name, data)),
+        ("bulk", lambda db_ops, data: db_ops.save_data(data, chunk_size=args.chunk_size)),
+        ("stream", lambda db_ops, data: db_ops.save_data(iter(data.items()),
+                                                         chunk_size=args.chunk_size)),
+    ]
+
+    for name, save in paths:
+        elapsed = time_insert(save, weather_data)
+        print(f"{name:>7} {args.rows / elapsed:>12.0f} rows/sec")
+
+if __name__ == "__main__":
+    main()
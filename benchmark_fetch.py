@@ -0,0 +1,48 @@
+"""
+This module measures the scraping throughput of the WeatherScraper class
+against a LocalWeatherServer as the number of concurrent requests goes up.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from synthetic_data import LocalWeatherServer
+from scrape_weather import WeatherScraper
+from weather_logger import WeatherLogger
+
+# Benchmark runs log to a temporary directory rather than the application's log file.
+WeatherLogger.log_file = os.path.join(tempfile.gettempdir(), "weather_benchmark.log")
+
+def run_benchmark(levels, years, latency):
+    """ Scrapes the given number of years of synthetic pages at each
+    concurrency level and returns a list of (concurrency, pages, seconds) tuples. """
+    today = time.localtime()
+    first_month = (today.tm_year - years, today.tm_mon)
+    results = []
+
+    for concurrency in levels:
+        with LocalWeatherServer(first_month=first_month, latency=latency) as server:
+            scraper = WeatherScraper(base_url=server.base_url, concurrency=concurrency)
+            start = time.perf_counter()
+            scraper.scrape_weather_data()
+            elapsed = time.perf_counter() - start
+            results.append((concurrency, server.requests, elapsed))
+
+    return results
+
+def main():
+    """ Runs the fetch benchmark and prints a table of results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="simulated server latency per page, in seconds")
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'pages':>6} {'seconds':>8} {'pages/sec':>10}")
+    for concurrency, pages, elapsed in run_benchmark(args.levels, args.years, args.latency):
+        print(f"{concurrency:>11} {pages:>6} {elapsed:>8.2f} {pages / elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+This module compares the parsing throughput of the streaming DailyTableParser
+with the HTMLParser-based WeatherScraper over saved month pages.
+Pages are read from a PageCache directory if one is given, otherwise synthetic pages are used.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from page_cache import PageCache
+from scrape_weather import WeatherScraper
+from synthetic_data import synthetic_month_page
+from weather_logger import WeatherLogger
+
+# Benchmark runs log to a temporary directory rather than the application's log file.
+WeatherLogger.log_file = os.path.join(tempfile.gettempdir(), "weather_benchmark.log")
+
+def load_pages(cache_dir, station_id, months):
+    """ Returns a list of raw month pages from the page cache, or synthetic pages if none are cached. """
+    if cache_dir:
+        cache = PageCache(cache_dir)
+        pages = [cache.get(station_id, year, month) for year, month in cache.months(station_id)]
+        pages = [page for page in pages if page is not None]
+        if pages:
+            return pages
+
+    return [synthetic_month_page(station_id, 1900 + i // 12, i % 12 + 1).encode()
+            for i in range(months)]
+
+def time_parser(parser, pages, rounds):
+    """ Parses every page the given number of times and
+    returns the best pages/sec and the parsed data of the last round. """
+    scraper = WeatherScraper(parser=parser)
+    best = float("inf")
+    weather = {}
+
+    for _ in range(rounds):
+        weather = {}
+        start = time.perf_counter()
+        for page in pages:
+            weather.update(scraper.parse_page(page))
+        best = min(best, time.perf_counter() - start)
+
+    return len(pages) / best, weather
+
+def main():
+    """ Runs the parser benchmark and prints pages/sec for each parser. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cache-dir", help="page cache directory to read saved pages from")
+    parser.add_argument("--station", type=int, default=WeatherScraper.STATION_ID)
+    parser.add_argument("--months", type=int, default=600, help="number of synthetic pages")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.cache_dir, args.station, args.months)
+    html_rate, html_weather = time_parser("html", pages, args.rounds)
+    fast_rate, fast_weather = time_parser("fast", pages, args.rounds)
+
+    print(f"{len(pages)} pages, {len(fast_weather)} days")
+    print(f"{'html':>6} {html_rate:>10.1f} pages/sec")
+    print(f"{'fast':>6} {fast_rate:>10.1f} pages/sec ({fast_rate / html_rate:.1f}x)")
+    print(f"outputs match: {html_weather == fast_weather}")
+
+if __name__ == "__main__":
+    main()
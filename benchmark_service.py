@@ -0,0 +1,127 @@
+"""
+This module load tests the WeatherHTTPService on localhost.
+It starts the service in a separate process, then keeps a number of keep-alive
+client connections busy with a mix of range, monthly, yearly and plot requests,
+and reports requests/sec with p50 and p99 latency per endpoint and overall.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+def percentile(samples, fraction):
+    """ Returns the given percentile of a list of samples, using the nearest rank. """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def request_targets(first_year, last_year, count, plots):
+    """ Returns a random mix of request targets over the given span of years. """
+    targets = []
+    for _ in range(count):
+        year = random.randint(first_year, last_year)
+        month = random.randint(1, 12)
+        choices = [
+            f"/range?start={year:04d}-{month:02d}-01&end={year:04d}-{month:02d}-31",
+            f"/monthly?start_year={year}&end_year={min(year + 9, last_year)}",
+            f"/yearly?start_year={year}&end_year={last_year}",
+        ]
+        if plots:
+            choices.append(f"/plot/line?year={year}&month={month}")
+        targets.append(random.choice(choices))
+    return targets
+
+async def client(host, port, targets, latencies, errors):
+    """ Sends requests one after another over a single keep-alive connection, recording latencies. """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for target in targets:
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+
+            endpoint = target.split("?")[0]
+            latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+            if status != 200:
+                errors.append((target, status))
+    finally:
+        writer.close()
+
+async def load_test(host, port, targets, connections):
+    """ Spreads the targets over the given number of concurrent connections
+    and returns (latencies by endpoint, errors, elapsed seconds). """
+    latencies, errors = {}, []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, targets[index::connections], latencies, errors)
+                           for index in range(connections)))
+    return latencies, errors, time.perf_counter() - start
+
+def wait_for_port(host, port, timeout=30):
+    """ Waits until the service accepts connections. """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"The service did not start listening on {host}:{port}")
+
+def report(name, samples, elapsed=None):
+    """ Prints one row of the latency table. """
+    rate = f"{len(samples) / elapsed:>10.1f}" if elapsed else f"{'':>10}"
+    print(f"{name:>12} {len(samples):>8} {rate} {percentile(samples, 0.5) * 1000:>8.2f} "
+          f"{percentile(samples, 0.99) * 1000:>8.2f}")
+
+def main():
+    """ Starts the service, runs a cold and a warm pass over the same requests, and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="weather_data.sqlite")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--years", type=int, nargs=2, default=[1997, 2022], metavar=("FIRST", "LAST"))
+    parser.add_argument("--plots", action="store_true", help="include rendered line plots in the mix")
+    parser.add_argument("--plot-cache", default="plot_cache")
+    args = parser.parse_args()
+
+    host = "127.0.0.1"
+    service = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "weather_service.py"), "--db", args.db, "--port", str(args.port),
+                                "--threads", str(args.threads), "--plot-cache", args.plot_cache],
+                               stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(host, args.port)
+        targets = request_targets(*args.years, args.requests, args.plots)
+
+        # The first pass fills the response cache, the second is served from it.
+        for name in ("cold", "warm"):
+            latencies, errors, elapsed = asyncio.run(load_test(host, args.port, targets, args.connections))
+            print(f"\n{name} pass: {args.requests} requests over {args.connections} connections")
+            print(f"{'endpoint':>12} {'requests':>8} {'req/sec':>10} {'p50 ms':>8} {'p99 ms':>8}")
+            for endpoint, samples in sorted(latencies.items()):
+                report(endpoint, samples)
+            report("all", [sample for samples in latencies.values() for sample in samples], elapsed)
+            if errors:
+                print(f"{len(errors)} requests failed, e.g. {errors[0]}")
+    finally:
+        service.terminate()
+        service.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+This module measures the startup time of WeatherProcessor: how long importing
+the entry point takes, and how long it takes until the main menu is drawn.
+The menu latency is measured for the source run in fast-start and eager mode,
+and for the PyInstaller bundle in dist/weather_processor when it has been built.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(HERE, "dist", "weather_processor",
+                      "weather_processor.exe" if os.name == "nt" else "weather_processor")
+
+IMPORT_SCRIPT = ("import time; start = time.perf_counter(); import weather_processor; "
+                 "print(time.perf_counter() - start)")
+EAGER_SCRIPT = "from weather_processor import WeatherProcessor; WeatherProcessor(fast_start=False).run()"
+
+def time_import(cwd):
+    """ Returns the seconds taken to import weather_processor in a fresh interpreter. """
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=cwd,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def time_first_menu(command, cwd, marker=b"Welcome", timeout=60):
+    """ Launches the application and returns the seconds until the main menu title
+    is written to stdout, then stops the process. """
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        seen = b""
+        while marker not in seen:
+            chunk = process.stdout.read1(4096)
+            if not chunk:
+                raise RuntimeError(f"{command[0]} exited before drawing the menu")
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"{command[0]} did not draw the menu within {timeout} seconds")
+            seen = seen[-len(marker):] + chunk
+        return time.perf_counter() - start
+    finally:
+        process.kill()
+        process.wait()
+
+def summarize(name, samples):
+    """ Prints the median and best of a list of timings in milliseconds. """
+    print(f"{name:>22} {statistics.median(samples) * 1000:>10.1f} {min(samples) * 1000:>10.1f}")
+
+def main():
+    """ Runs the startup benchmark and prints the median and best time of each measurement. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--cwd", default=HERE, help="directory holding the weather database")
+    parser.add_argument("--exe", default=BUNDLE, help="path to the frozen bundle's executable")
+    args = parser.parse_args()
+
+    script = os.path.join(HERE, "weather_processor.py")
+    runs = [
+        ("first menu (source)", [sys.executable, script]),
+        ("first menu (eager)", [sys.executable, "-c", EAGER_SCRIPT]),
+    ]
+    if os.path.exists(args.exe):
+        runs.append(("first menu (bundle)", [args.exe]))
+
+    env_path = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = HERE if not env_path else os.pathsep.join((HERE, env_path))
+
+    print(f"{'':>22} {'median ms':>10} {'best ms':>10}")
+    summarize("import", [time_import(args.cwd) for _ in range(args.rounds)])
+    for name, command in runs:
+        summarize(name, [time_first_menu(command, args.cwd) for _ in range(args.rounds)])
+
+    if not os.path.exists(args.exe):
+        print(f"No frozen bundle at {args.exe}; build it with pyinstaller weather_processor.spec.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+This module compares full-history analytical scans served from the SQLite weather table
+with the same scans served from the memory-mapped columnar copy written by the storage module,
+using a synthetic database of one or more stations.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from aggregation import yearly_summary
+from benchmark_db import synthetic_rows
+from db_operations import DBOperations
+from storage import ColumnarBackend, SQLiteBackend, convert
+from weather_logger import WeatherLogger
+
+# Benchmark runs log to a temporary directory rather than the application's log file.
+WeatherLogger.log_file = os.path.join(tempfile.gettempdir(), "weather_benchmark.log")
+
+def best_of(rounds, function):
+    """ Returns the best elapsed seconds of several calls and the result of the last one. """
+    best = float("inf")
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    """ Builds the synthetic database, exports it and prints the scan times of each backend. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=66000, help="days per station (66000 is about 180 years)")
+    parser.add_argument("--stations", type=int, default=1)
+    parser.add_argument("--format", choices=("npy", "arrow"), default="npy")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_ops = DBOperations(os.path.join(directory, "bench.sqlite"))
+        db_ops.initialize_db()
+        locations = [f"Station {index}" for index in range(args.stations)]
+        for index, location in enumerate(locations):
+            db_ops.save_data(synthetic_rows(args.days, 27174 + index), location)
+
+        columnar = ColumnarBackend(os.path.join(directory, "columnar"), args.format)
+        export_time, days = best_of(1, lambda: convert(SQLiteBackend(db_ops), columnar))
+        print(f"exported {days} days in {export_time:.2f} s")
+
+        def scan(read):
+            """ Reads every location in full and summarizes each year. """
+            return [yearly_summary(read(location)) for location in locations]
+
+        sqlite_time, _ = best_of(args.rounds, lambda: scan(SQLiteBackend(db_ops).read))
+        columnar_time, _ = best_of(args.rounds, lambda: scan(columnar.read))
+        read_time, stores = best_of(args.rounds, lambda: [columnar.read(location) for location in locations])
+        megabytes = sum(store.nbytes for store in stores) / 1e6
+
+        print(f"{'path':>16} {'seconds':>9} {'days/sec':>14}")
+        for name, elapsed in (("sqlite scan", sqlite_time), ("columnar scan", columnar_time),
+                              ("columnar read", read_time)):
+            print(f"{name:>16} {elapsed:>9.4f} {days / elapsed:>14,.0f}")
+        print(f"columnar read of {megabytes:.1f} MB at {megabytes / read_time:,.0f} MB/s, "
+              f"scan {sqlite_time / columnar_time:.1f}x faster than SQLite")
+
+if __name__ == "__main__":
+    main()
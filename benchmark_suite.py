@@ -0,0 +1,240 @@
+"""
+This module runs the benchmark suite over reproducible synthetic fixtures and compares the results
+with stored baselines to catch regressions. The fixtures are SQLite databases of synthetic stations
+with about 180 years (66,000 days) each: scale 1 is one station, like the current database,
+scale 10 is ten stations and scale 100 a hundred. They are built once and reused from the
+fixture directory. Every case reports a throughput, so higher is better.
+
+Cases: scrape (month pages from a LocalWeatherServer), parse (month pages),
+insert (DBOperations.save_data), fetch_all (DBOperations.fetch_data),
+range (single-month range queries), boxplot_rollups and boxplot_store (box plot preparation
+from the monthly rollups and from a WeatherStore).
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from aggregation import monthly_boxplot_stats, rollup_boxplot_stats
+from benchmark_db import synthetic_rows
+from db_operations import DBOperations
+from scrape_weather import WeatherScraper
+from synthetic_data import LocalWeatherServer, synthetic_month_page
+from weather_logger import WeatherLogger
+
+# Benchmark runs log to a temporary directory rather than the application's log file.
+WeatherLogger.log_file = os.path.join(tempfile.gettempdir(), "weather_benchmark.log")
+
+DAYS_PER_STATION = 66000
+FIRST_STATION = 27174
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+
+def station_location(index):
+    """ Returns the location name of the synthetic station with the given index. """
+    return f"Synthetic {FIRST_STATION + index}"
+
+def build_fixture(directory, scale):
+    """ Returns the path of the fixture database for a scale, building it if it does not exist yet. """
+    path = os.path.join(directory, f"scale-{scale}.sqlite")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.building"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    db_ops = DBOperations(temp_path)
+    db_ops.initialize_db()
+    for index in range(scale):
+        print(f"building scale {scale} fixture: station {index + 1} of {scale}", file=sys.stderr)
+        db_ops.save_data(synthetic_rows(DAYS_PER_STATION, FIRST_STATION + index), station_location(index))
+
+    # Close the pooled connections, checkpointing the WAL, before moving the file into place.
+    from dbcm import ConnectionPool
+    ConnectionPool.release(temp_path)
+    os.replace(temp_path, path)
+    return path
+
+def best_of(rounds, function):
+    """ Calls a function several times and returns the best elapsed seconds and the last result. """
+    best = float("inf")
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench_scrape(rounds, years=10):
+    """ Returns month pages/sec scraped from a local server with no added latency. """
+    today = time.localtime()
+    results = []
+    for _ in range(rounds):
+        with LocalWeatherServer(first_month=(today.tm_year - years, today.tm_mon)) as server:
+            scraper = WeatherScraper(base_url=server.base_url, concurrency=8)
+            start = time.perf_counter()
+            scraper.scrape_weather_data()
+            results.append(server.requests / (time.perf_counter() - start))
+    return max(results), "pages/sec"
+
+def bench_parse(rounds, months=600):
+    """ Returns month pages/sec parsed by the scraper's parser. """
+    pages = [synthetic_month_page(FIRST_STATION, 1900 + i // 12, i % 12 + 1).encode() for i in range(months)]
+    scraper = WeatherScraper()
+    elapsed, _ = best_of(rounds, lambda: [scraper.parse_page(page) for page in pages])
+    return months / elapsed, "pages/sec"
+
+def bench_insert(rounds, fixture, scale):
+    """ Returns rows/sec inserted by save_data into an empty database, one station at a time.
+    Each station's rows are read from the fixture before its insert is timed, so only
+    one station is held in memory at once. """
+    from dbcm import ConnectionPool
+    source = DBOperations(fixture)
+    best = float("inf")
+
+    for _ in range(rounds):
+        with tempfile.TemporaryDirectory() as directory:
+            db_ops = DBOperations(os.path.join(directory, "insert.sqlite"))
+            db_ops.initialize_db()
+            elapsed = 0.0
+            rows = 0
+            for index in range(scale):
+                location = station_location(index)
+                station = source.fetch_range("0000-01-01", "9999-12-31", location, columnar=True).to_dict()
+                start = time.perf_counter()
+                db_ops.save_data(station, location)
+                elapsed += time.perf_counter() - start
+                rows += len(station)
+            best = min(best, elapsed)
+            ConnectionPool.release(db_ops.db_name)
+    return rows / best, "rows/sec"
+
+def bench_fetch_all(rounds, fixture, scale):
+    """ Returns rows/sec read by fetch_data into a WeatherStore for every station. """
+    db_ops = DBOperations(fixture)
+    locations = [station_location(index) for index in range(scale)]
+    elapsed, stores = best_of(rounds, lambda: [db_ops.fetch_data(location, columnar=True)
+                                               for location in locations])
+    return sum(len(store) for store in stores) / elapsed, "rows/sec"
+
+def bench_range(rounds, fixture, scale, queries=500):
+    """ Returns single-month range queries/sec over random stations and months. """
+    db_ops = DBOperations(fixture)
+    rng = random.Random(0)
+    months = [(station_location(rng.randrange(scale)), rng.randint(1841, 2019), rng.randint(1, 12))
+              for _ in range(queries)]
+    elapsed, _ = best_of(rounds, lambda: [db_ops.fetch_month(year, month, location, columnar=True)
+                                          for location, year, month in months])
+    return queries / elapsed, "queries/sec"
+
+def bench_boxplot_rollups(rounds, fixture):
+    """ Returns full-history box plot preparations/sec from the monthly rollups of one station. """
+    db_ops = DBOperations(fixture)
+    elapsed, _ = best_of(rounds, lambda: rollup_boxplot_stats(
+        db_ops.fetch_monthly_rollups(1840, 2030, station_location(0))))
+    return 1 / elapsed, "plots/sec"
+
+def bench_boxplot_store(rounds, fixture):
+    """ Returns full-history box plot preparations/sec from a WeatherStore of one station. """
+    store = DBOperations(fixture).fetch_range("0000-01-01", "9999-12-31", station_location(0), columnar=True)
+    elapsed, _ = best_of(rounds, lambda: monthly_boxplot_stats(store, 1840, 2030))
+    return 1 / elapsed, "plots/sec"
+
+def run_suite(scales, rounds, fixture_dir, cases=None):
+    """ Runs every case, or the named ones, and returns a dictionary of
+    "case@scale": {"value", "unit"} results. Scale-independent cases have no @scale suffix. """
+    results = {}
+
+    def record(name, outcome):
+        value, unit = outcome
+        results[name] = {"value": round(value, 1), "unit": unit}
+        print(f"{name:>24} {value:>14,.1f} {unit}")
+
+    if not cases or "scrape" in cases:
+        record("scrape", bench_scrape(rounds))
+    if not cases or "parse" in cases:
+        record("parse", bench_parse(rounds))
+
+    for scale in scales:
+        fixture = build_fixture(fixture_dir, scale)
+        scaled = {
+            "insert": lambda: bench_insert(rounds, fixture, scale),
+            "fetch_all": lambda: bench_fetch_all(rounds, fixture, scale),
+            "range": lambda: bench_range(rounds, fixture, scale),
+            "boxplot_rollups": lambda: bench_boxplot_rollups(rounds, fixture),
+            "boxplot_store": lambda: bench_boxplot_store(rounds, fixture),
+        }
+        for name, bench in scaled.items():
+            if not cases or name in cases:
+                record(f"{name}@{scale}", bench())
+    return results
+
+def compare(results, baseline, tolerance):
+    """ Prints each result next to its baseline and returns the names of the cases
+    which fell more than the tolerance (a fraction) below their baseline. """
+    regressions = []
+    if baseline.get("machine") != machine_info():
+        print("Note: the baselines were recorded on a different machine or Python version.")
+
+    print(f"\n{'case':>24} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, result in results.items():
+        expected = baseline.get("results", {}).get(name)
+        if expected is None:
+            print(f"{name:>24} {'-':>14} {result['value']:>14,.1f} {'new':>8}")
+            continue
+        change = result["value"] / expected["value"] - 1
+        flag = " REGRESSION" if change < -tolerance else ""
+        print(f"{name:>24} {expected['value']:>14,.1f} {result['value']:>14,.1f} {change:>+8.0%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def machine_info():
+    """ Returns a description of the machine and Python version, stored with the baselines. """
+    return {"platform": platform.platform(), "processor": platform.machine(),
+            "python": platform.python_version(), "cpus": os.cpu_count()}
+
+def main():
+    """ Runs the suite, optionally saving the results as the new baselines,
+    and exits with status 1 if any case regressed against the stored baselines. """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10], help="fixture scales, e.g. 1 10 100")
+    parser.add_argument("--cases", nargs="*", help="only run these cases")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--fixture-dir", default=os.path.join(tempfile.gettempdir(), "weather_benchmark_fixtures"))
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline before a case is a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baselines")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the fixtures")
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.isdir(args.fixture_dir):
+        shutil.rmtree(args.fixture_dir)
+
+    print(f"{'case':>24} {'throughput':>14}")
+    results = run_suite(args.scales, args.rounds, args.fixture_dir, args.cases)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+    if args.save_baseline:
+        baseline = {"machine": machine_info(), "results": {**baseline.get("results", {}), **results}}
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Saved baselines to {args.baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+This module contains the CheckpointedDownload class,
+which downloads the full history of a station month by month into a staging table,
+so an interrupted download can resume from its last completed month
+and the existing data is only replaced once the download has finished.
+"""
+
+from datetime import datetime
+from weather_logger import WeatherLogger
+
+class CheckpointedDownload:
+    """ Represents a resumable full download of one station's weather history. """
+    def __init__(self, scraper, db_ops, location="Winnipeg, MB", first_year=1840):
+        """ Initializes an instance of the CheckpointedDownload class. """
+        self.scraper = scraper
+        self.db_ops = db_ops
+        self.location = location
+        self.first_year = first_year
+        self.months_completed = 0
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    def run(self):
+        """ Downloads every month not yet staged, newest first, committing each month with its
+        checkpoint, then swaps the staged rows into place. Returns the number of rows swapped in.
+        If no month was staged, the existing data and the checkpoint are kept and 0 is returned.
+        Errors are raised and leave the checkpoint and the existing data untouched. """
+        self.db_ops.initialize_db()
+        current_month = datetime.now().strftime("%Y-%m")
+        resume_month = self.db_ops.start_download(self.location, self.scraper.station_id, current_month)
+        start_date = datetime.strptime(resume_month, "%Y-%m")
+
+        for (year, month), page in self.scraper.iter_month_pages(start_date):
+            month_key = f"{year:04d}-{month:02d}"
+            if year < self.first_year:
+                break
+            if page and not any(date.startswith(month_key) for date in page):
+                # The site answers months before the start of the record with the first month it has.
+                self.logger.info("Reached the start of the record at %s.", month_key)
+                break
+
+            self.db_ops.save_month(self.location, page, month_key)
+            self.months_completed += 1
+            self.logger.info("Finished scraping: %s", datetime(year, month, 1).strftime('%B - %Y'))
+
+        if self.months_completed == 0 and self.db_ops.count_staged(self.location) == 0:
+            # Swapping in an empty staging table would delete the location's stored history.
+            self.logger.warning("No months were downloaded for %s; the stored data is kept.", self.location)
+            return 0
+        return self.db_ops.finish_download(self.location)
@@ -0,0 +1,237 @@
+"""
+This module contains the ClimateStats class, which derives climate statistics from the weather table:
+climate normals over any span of years, rolling normals, daily and monthly anomalies,
+rolling means and heating and cooling degree days.
+Each location's days are summarized per month in the climate_monthly table, which is kept up to date
+by update_climate_months whenever DBOperations writes days, so the statistics are computed from a few
+hundred monthly rows, or from a bounded range of days, without scanning the full history again.
+"""
+
+import numpy as np
+from datetime import date, timedelta
+from aggregation import MONTH_LABELS
+from data_quality import month_runs
+from weather_store import EPOCH_ORDINAL
+
+BASE_TEMPERATURE = 18.0
+NORMAL_PERIOD = (1991, 2020)
+MONTH_LENGTHS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+MID_MONTH_DAYS = np.cumsum(MONTH_LENGTHS) - MONTH_LENGTHS / 2 + 0.5
+MONTHLY_COLUMNS = ("year", "month", "days", "mean_count", "mean_sum", "mean_sq_sum", "min_count", "min_sum",
+                   "low", "max_count", "max_sum", "high", "hdd", "cdd")
+
+def nullable(values, counts):
+    """ Returns an array of sums or extremes as a list, with None where no value was counted, like SQL. """
+    return [float(value) if count else None for value, count in zip(values, counts)]
+
+def climate_summaries(days, months):
+    """ Returns the climate_monthly rows of the given 'YYYY-MM' months held in a DayColumns of written days,
+    keyed by (year, month), with the same values update_climate_months reads from the weather table. """
+    keys, groups, columns = days.group(months)
+    summary = {"year": (keys // 12).tolist(), "month": (keys % 12 + 1).tolist(),
+               "days": np.bincount(groups, minlength=len(keys)).tolist()}
+    present = {field: ~np.isnan(columns[field]) for field in ("mean", "min", "max")}
+
+    def total(field, values=None):
+        """ Sums the present values of a field, or values computed from them, in each month. """
+        values = columns[field][present[field]] if values is None else values
+        return np.bincount(groups[present[field]], weights=values, minlength=len(keys))
+
+    def extreme(field, reduce, start):
+        """ Reduces the present values of a field in each month with np.minimum or np.maximum. """
+        bound = np.full(len(keys), start)
+        reduce.at(bound, groups[present[field]], columns[field][present[field]])
+        return bound
+
+    for field in ("mean", "min", "max"):
+        summary[f"{field}_count"] = np.bincount(groups[present[field]], minlength=len(keys)).tolist()
+        summary[f"{field}_sum"] = nullable(total(field), summary[f"{field}_count"])
+
+    means = columns["mean"][present["mean"]]
+    counts = summary["mean_count"]
+    summary["mean_sq_sum"] = nullable(total("mean", means ** 2), counts)
+    summary["hdd"] = nullable(total("mean", np.maximum(BASE_TEMPERATURE - means, 0)), counts)
+    summary["cdd"] = nullable(total("mean", np.maximum(means - BASE_TEMPERATURE, 0)), counts)
+    summary["low"] = nullable(extreme("min", np.minimum, np.inf), summary["min_count"])
+    summary["high"] = nullable(extreme("max", np.maximum, -np.inf), summary["max_count"])
+
+    return {(row[0], row[1]): row for row in zip(*(summary[column] for column in MONTHLY_COLUMNS))}
+
+def update_climate_months(cursor, location, months, days=None):
+    """ Recomputes the climate_monthly rows of a location for the given 'YYYY-MM' months,
+    using the caller's cursor and transaction. Each run of consecutive months is summarized
+    by one grouped query, so a bulk load reads its new days once, and months whose days are all held
+    in days, a DayColumns of the rows just written, are summarized without reading them back.
+    Degree days are measured from the daily mean temperature against BASE_TEMPERATURE. """
+    whole = days.covers(months) if days else set()
+    summaries = climate_summaries(days, whole) if whole else {}
+
+    for first, last in month_runs(set(months) - whole):
+        cursor.execute('''
+            select cast(substr(sample_date, 1, 4) as integer), cast(substr(sample_date, 6, 2) as integer),
+                count(*), count(avg_temp), sum(avg_temp), sum(avg_temp * avg_temp),
+                count(min_temp), sum(min_temp), min(min_temp), count(max_temp), sum(max_temp), max(max_temp),
+                sum(max(? - avg_temp, 0)), sum(max(avg_temp - ?, 0))
+            from weather
+            where location = ? and sample_date between ? and ?
+            group by substr(sample_date, 1, 7)
+        ''', (BASE_TEMPERATURE, BASE_TEMPERATURE, location, f"{first}-01", f"{last}-31"))
+        summaries.update({(row[0], row[1]): row for row in cursor.fetchall()})
+
+    empty = [(location, int(month[:4]), int(month[5:7])) for month in months
+             if (int(month[:4]), int(month[5:7])) not in summaries]
+    cursor.executemany("delete from climate_monthly where location = ? and year = ? and month = ?", empty)
+    cursor.executemany(f'''
+        INSERT OR REPLACE INTO climate_monthly (location, {", ".join(MONTHLY_COLUMNS)})
+        VALUES (?, {", ".join("?" * len(MONTHLY_COLUMNS))})
+    ''', [(location, *summary) for summary in summaries.values()])
+
+class ClimateStats:
+    """ Represents the climate statistics of the locations in a database. """
+    def __init__(self, db_ops):
+        """ Initializes an instance of the ClimateStats class over a DBOperations instance. """
+        self.db_ops = db_ops
+
+    def monthly_sums(self, location, start_year=0, end_year=9999):
+        """ Returns the stored climate_monthly columns of a location for a span of years
+        as a dictionary of float arrays, with NaN for missing values. """
+        rows = self.db_ops.fetch_climate_months(start_year, end_year, location)
+        table = np.array(rows, dtype=np.float64).reshape(-1, len(MONTHLY_COLUMNS))
+        return dict(zip(MONTHLY_COLUMNS, table.T))
+
+    def monthly(self, location, start_year=0, end_year=9999):
+        """ Returns a dictionary of arrays holding, for each stored month of a span of years,
+        the year, month, day count, mean, standard deviation, mean minimum and maximum,
+        lowest and highest temperatures, and heating and cooling degree days. """
+        sums = self.monthly_sums(location, start_year, end_year)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sums["mean_sum"] / sums["mean_count"]
+            variance = sums["mean_sq_sum"] / sums["mean_count"] - mean ** 2
+            return {
+                "year": sums["year"].astype(np.int64),
+                "month": sums["month"].astype(np.int64),
+                "days": sums["days"].astype(np.int64),
+                "mean": mean,
+                "std": np.sqrt(np.maximum(variance, 0)),
+                "min": sums["min_sum"] / sums["min_count"],
+                "max": sums["max_sum"] / sums["max_count"],
+                "low": sums["low"],
+                "high": sums["high"],
+                "hdd": np.nan_to_num(sums["hdd"]),
+                "cdd": np.nan_to_num(sums["cdd"]),
+            }
+
+    def normals(self, location, period=NORMAL_PERIOD):
+        """ Returns the climate normals of each calendar month over a span of years (inclusive):
+        the mean and standard deviation of the daily means, the mean minimum and maximum,
+        the mean monthly heating and cooling degree days, and the number of years with data. """
+        sums = self.monthly_sums(location, *period)
+        groups = sums["month"].astype(np.int64) - 1
+
+        def total(column):
+            return np.bincount(groups, weights=np.nan_to_num(sums[column]), minlength=12)
+
+        years = np.bincount(groups, weights=sums["mean_count"] > 0, minlength=12).astype(np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total("mean_sum") / total("mean_count")
+            variance = total("mean_sq_sum") / total("mean_count") - mean ** 2
+            return {
+                "label": MONTH_LABELS,
+                "years": years,
+                "mean": mean,
+                "std": np.sqrt(np.maximum(variance, 0)),
+                "min": total("min_sum") / total("min_count"),
+                "max": total("max_sum") / total("max_count"),
+                "hdd": total("hdd") / years,
+                "cdd": total("cdd") / years,
+            }
+
+    def rolling_normals(self, location, window=30):
+        """ Returns the normal mean temperature of each calendar month over every window of
+        consecutive years, as {"year": last year of each window, "mean": array of shape (years, 12)}.
+        Windows are computed together from cumulative sums over a year by month grid. """
+        months = self.monthly_sums(location)
+        if not len(months["year"]):
+            return {"year": np.array([], dtype=np.int64), "mean": np.empty((0, 12))}
+
+        first_year = int(months["year"].min())
+        rows = months["year"].astype(np.int64) - first_year
+        columns = months["month"].astype(np.int64) - 1
+        shape = (int(rows.max()) + 1, 12)
+        sums = np.zeros(shape)
+        counts = np.zeros(shape)
+        sums[rows, columns] = np.nan_to_num(months["mean_sum"])
+        counts[rows, columns] = months["mean_count"]
+
+        sums = np.vstack((np.zeros(12), np.cumsum(sums, axis=0)))
+        counts = np.vstack((np.zeros(12), np.cumsum(counts, axis=0)))
+        window = min(window, shape[0])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (sums[window:] - sums[:-window]) / (counts[window:] - counts[:-window])
+        return {"year": np.arange(first_year + window - 1, first_year + shape[0]), "mean": mean}
+
+    @staticmethod
+    def daily_normals(normals, ordinals):
+        """ Returns the normal mean temperature of each day ordinal, interpolated linearly
+        between the monthly normals placed at the middle of each month. """
+        dates = (np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
+        days = (dates - dates.astype("datetime64[Y]")).astype(np.int64)
+        known = ~np.isnan(normals["mean"])
+        if not known.any():
+            return np.full(len(days), np.nan)
+        return np.interp(days + 1, MID_MONTH_DAYS[known], normals["mean"][known], period=365)
+
+    def anomalies(self, location, start_date, end_date, period=NORMAL_PERIOD):
+        """ Returns the daily mean temperatures of a location between two dates (inclusive)
+        with their normals and anomalies, as a dictionary of arrays. """
+        store = self.db_ops.fetch_range(str(start_date), str(end_date), location, columnar=True)
+        normal = self.daily_normals(self.normals(location, period), store.ordinals)
+        return {"date": store.dates(), "mean": store.mean.astype(np.float64), "normal": normal,
+                "anomaly": store.mean - normal}
+
+    def monthly_anomalies(self, location, start_year, end_year, period=NORMAL_PERIOD):
+        """ Returns the mean temperature of each month in a span of years with its anomaly
+        from the normal of its calendar month, as a dictionary of arrays. """
+        months = self.monthly(location, start_year, end_year)
+        normal = self.normals(location, period)["mean"][months["month"] - 1]
+        return {"year": months["year"], "month": months["month"], "mean": months["mean"],
+                "normal": normal, "anomaly": months["mean"] - normal}
+
+    def rolling_mean(self, location, start_date, end_date, window=30, min_days=None):
+        """ Returns the trailing window-day mean of the daily mean temperature for each day between two
+        dates (inclusive), as a dictionary of arrays. Missing days are skipped, and the mean is NaN
+        where the window holds fewer than min_days values (by default half the window). """
+        min_days = min_days or max(1, window // 2)
+        start = date.fromisoformat(str(start_date))
+        end = date.fromisoformat(str(end_date))
+        store = self.db_ops.fetch_range((start - timedelta(days=window - 1)).isoformat(), end.isoformat(),
+                                        location, columnar=True)
+
+        first = start.toordinal() - window + 1
+        values = np.zeros(end.toordinal() - first + 1)
+        counts = np.zeros(len(values))
+        present = ~np.isnan(store.mean)
+        values[store.ordinals[present] - first] = store.mean[present]
+        counts[store.ordinals[present] - first] = 1
+
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        totals = np.concatenate(([0.0], np.cumsum(counts)))
+        window_sums = sums[window:] - sums[:-window]
+        window_counts = totals[window:] - totals[:-window]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(window_counts >= min_days, window_sums / window_counts, np.nan)
+
+        dates = np.arange(np.datetime64(start.isoformat()), np.datetime64(end.isoformat()) + 1)
+        return {"date": dates, "mean": mean, "days": window_counts.astype(np.int64)}
+
+    def degree_days(self, location, start_year=0, end_year=9999):
+        """ Returns the heating and cooling degree day totals of each year in a span,
+        with the number of days they were measured on, as a dictionary of arrays. """
+        months = self.monthly_sums(location, start_year, end_year)
+        years, groups = np.unique(months["year"].astype(np.int64), return_inverse=True)
+        return {
+            "year": years,
+            "days": np.bincount(groups, weights=months["mean_count"], minlength=len(years)).astype(np.int64),
+            "hdd": np.bincount(groups, weights=np.nan_to_num(months["hdd"]), minlength=len(years)),
+            "cdd": np.bincount(groups, weights=np.nan_to_num(months["cdd"]), minlength=len(years)),
+        }
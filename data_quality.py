@@ -0,0 +1,145 @@
+"""
+This module contains the data quality stage between scraping and saving.
+Table cells are parsed into a value and a quality flag instead of turning anything unparseable
+into 0.0: missing, blank and invalid cells become None with a flag saying why, and values
+which carry one of the site's legend flags, such as E for estimated, keep both.
+Each day is then checked for out of range or inconsistent temperatures, and a per-month
+coverage index in the weather_coverage table records how many days of each month hold values,
+so plots and aggregates can skip empty months without scanning the daily rows.
+"""
+
+import calendar
+import re
+from instrumentation import Metrics
+
+MISSING = "M"
+BLANK = "B"
+INVALID = "I"
+OUT_OF_RANGE = "R"
+INCONSISTENT = "X"
+NO_FLAG = "-"
+SITE_FLAGS = {"M", "E", "T", "A", "C", "L", "F", "N", "Y", "S", "^", "†", "‡"}
+TEMPERATURE_RANGE = (-70.0, 60.0)
+FIELDS = ("Max", "Min", "Mean")
+
+CELL = re.compile(r"\s*(?P<value>[-+]?(?:\d+(?:\.\d*)?|\.\d+))?\s*(?:Legend)?(?P<flag>.*?)\s*$", re.DOTALL)
+
+def month_runs(months):
+    """ Groups 'YYYY-MM' months into runs of consecutive months and yields (first, last) pairs. """
+    run = None
+    for month in sorted(months):
+        index = int(month[:4]) * 12 + int(month[5:7]) - 1
+        if run and index == run[2] + 1:
+            run = (run[0], month, index)
+            continue
+        if run:
+            yield run[0], run[1]
+        run = (month, month, index)
+    if run:
+        yield run[0], run[1]
+
+def parse_cell(text):
+    """ Returns the (value, flag) pair of a table cell's text. The flag is None for a plain number,
+    one of the site's legend flags (e.g. "12.3 E" or "LegendM"), BLANK for an empty cell
+    or INVALID for text which is neither a number nor a known flag. """
+    try:
+        return float(text), None
+    except ValueError:
+        pass
+
+    text = text.replace("&nbsp;", " ").replace("\xa0", " ")
+    match = CELL.match(text)
+    value = float(match["value"]) if match["value"] else None
+    flag = match["flag"]
+
+    if not flag:
+        return value, None if value is not None else BLANK
+    if flag in SITE_FLAGS:
+        return value, flag
+    return None, INVALID
+
+def validate_day(data):
+    """ Checks one day of {'Max', 'Min', 'Mean', 'Flags'} values and returns it with out of range
+    temperatures replaced by None and flagged OUT_OF_RANGE, and with a minimum above the maximum
+    flagged INCONSISTENT on both. Flags are only present for the fields which have one. """
+    low, high = TEMPERATURE_RANGE
+    max_temp, min_temp, mean_temp = data.get("Max"), data.get("Min"), data.get("Mean")
+    if (not data.get("Flags") and max_temp is not None and min_temp is not None and mean_temp is not None
+            and low <= min_temp <= max_temp <= high and low <= mean_temp <= high):
+        return data
+
+    flags = dict(data.get("Flags") or {})
+    values = {field: data.get(field) for field in FIELDS}
+
+    for field, value in values.items():
+        if value is None:
+            flags.setdefault(field, MISSING)
+        elif not low <= value <= high:
+            values[field] = None
+            flags[field] = OUT_OF_RANGE
+
+    if values["Min"] is not None and values["Max"] is not None and values["Min"] > values["Max"]:
+        flags["Min"] = flags["Max"] = INCONSISTENT
+
+    if flags:
+        values["Flags"] = flags
+    return values
+
+def validate_page(weather):
+    """ Validates every day of a parsed page in place and counts the flags raised
+    in the quality.<flag> metrics. Returns the page. """
+    counts = {}
+    for date, data in weather.items():
+        data = weather[date] = validate_day(data)
+        for flag in data.get("Flags", {}).values():
+            counts[flag] = counts.get(flag, 0) + 1
+
+    for flag, count in counts.items():
+        Metrics.count(f"quality.{flag}", count)
+    return weather
+
+def encode_flags(flags):
+    """ Encodes the flags of a day as one code per field in (Max, Min, Mean) order,
+    with NO_FLAG for fields without one, e.g. "E-M". Returns None if there are no flags,
+    so the weather table only stores a value for flagged days. """
+    if not flags:
+        return None
+    return "".join(flags.get(field, NO_FLAG) for field in FIELDS)
+
+def decode_flags(code):
+    """ Decodes a stored flag code into a dictionary of the flagged fields. """
+    return {field: flag for field, flag in zip(FIELDS, code or "") if flag != NO_FLAG}
+
+def update_coverage(cursor, location, months, days=None):
+    """ Recomputes the weather_coverage rows of a location for the given 'YYYY-MM' months, using the
+    caller's cursor and transaction: the days in each month, the days stored, the days holding each value
+    and the days with any quality flag. Months without stored days are removed from the index.
+    The day counts are copied from climate_monthly, so its rows must be up to date, and flagged days
+    are counted through the partial weather_flagged index, which only holds flagged rows,
+    or from days, a DayColumns of the rows just written, for the months whose days it all holds. """
+    whole = days.covers(months) if days else set()
+    flagged = days.flagged_counts(whole) if whole else {}
+
+    for first, last in month_runs(set(months) - whole):
+        cursor.execute('''
+            select cast(substr(sample_date, 1, 4) as integer), cast(substr(sample_date, 6, 2) as integer), count(*)
+            from weather
+            where location = ? and sample_date between ? and ?
+                and quality is not null
+            group by substr(sample_date, 1, 7)
+        ''', (location, f"{first}-01", f"{last}-31"))
+        flagged.update({(year, month): count for year, month, count in cursor.fetchall()})
+
+    for first, last in month_runs(months):
+        bounds = (location, int(first[:4]), int(first[5:7]), int(last[:4]), int(last[5:7]))
+        cursor.execute("delete from weather_coverage where location = ? and (year, month) between (?, ?) and (?, ?)",
+                       bounds)
+        cursor.execute('''select year, month, days, max_count, min_count, mean_count from climate_monthly
+                        where location = ? and (year, month) between (?, ?) and (?, ?)''', bounds)
+        cursor.executemany('''
+            INSERT INTO weather_coverage
+                (location, year, month, days_in_month, days, max_days, min_days, mean_days, flagged_days)
+            VALUES
+                (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(location, year, month, calendar.monthrange(year, month)[1], *counts, flagged.get((year, month), 0))
+              for year, month, *counts in cursor.fetchall()])
@@ -2,28 +2,80 @@
 This module contains the DBOperations class,
 which has functions for initializing, purging, and saving data in a SQLite3 database.
 This module imports the DBCM module to manage cursors and opening/closing connections.
+The database is kept in WAL mode: every write runs on the database's writer thread,
+while reads use read-only connections, so plots and queries keep reading the last committed data
+at full speed during a long download or bulk load.
+NumPy-backed helpers are imported on first use so that opening the database stays cheap.
 """
 
-from dbcm import DBCM
-from scrape_weather import WeatherScraper
-from plot_operations import PlotOperations
+import functools
+import time
+from itertools import chain, islice
+from data_quality import decode_flags, encode_flags, month_runs
+from dbcm import DBCM, ConnectionPool, DatabaseWriter
+from instrumentation import Metrics
 from weather_logger import WeatherLogger
 from datetime import datetime
 
+BULK_LOAD_PRAGMAS = (
+    "pragma journal_mode=WAL",
+    "pragma synchronous=NORMAL",
+    "pragma cache_size=-65536",
+    "pragma temp_store=MEMORY",
+)
+
+ROWS_PER_STATEMENT = 100
+
+def weather_row(date, location, data):
+    """ Returns the weather table row of one day of {'Min', 'Max', 'Mean', 'Flags'} values,
+    with its quality flags encoded as a single code (see data_quality.encode_flags). """
+    flags = data.get('Flags')
+    return (date, location, data.get('Min'), data.get('Max'), data.get('Mean'),
+            encode_flags(flags) if flags else None)
+
+@functools.lru_cache(maxsize=None)
+def insert_statement(count):
+    """ Returns an INSERT OR IGNORE statement of count weather table rows. Sending up to
+    ROWS_PER_STATEMENT rows per statement shares SQLite's per-statement work between them,
+    which makes a bulk insert much cheaper than one execute, or executemany, per row. """
+    return ("INSERT OR IGNORE INTO weather (sample_date, location, min_temp, max_temp, avg_temp, quality) VALUES "
+            + ", ".join(["(?, ?, ?, ?, ?, ?)"] * count))
+
+def writes(method):
+    """ Makes a DBOperations method run on the writer thread of its database
+    and return its result, or raise its exception, in the calling thread. """
+    @functools.wraps(method)
+    def write(self, *args, **kwargs):
+        if self.read_only:
+            return method(self, *args, **kwargs)
+        return DatabaseWriter.get(self.db_name).call(method, self, *args, **kwargs)
+    return write
+
 class DBOperations:
     """ Represents a database with functions to initialize,
     insert data, read data, and purge the database. """
-    def __init__(self, db_name='weather_data.sqlite'):
-        """ Initializes an instance of the DBOperations class. """
+    def __init__(self, db_name='weather_data.sqlite', chunk_size=5000, read_only=False, columnar_dir=None):
+        """ Initializes an instance of the DBOperations class.
+        Chunk_size is the number of rows save_data takes from its input at a time when saving;
+        each chunk is inserted with multi-row statements of up to ROWS_PER_STATEMENT rows.
+        If read_only is set, every query runs on a read-only connection and writes fail.
+        If columnar_dir holds a columnar copy of the database (see the storage module),
+        columnar reads of a location are served from its memory-mapped files while the copy is up to date. """
         self.db_name = db_name
+        self.chunk_size = chunk_size
+        self.read_only = read_only
+        self.columnar_dir = columnar_dir
 
         logger = WeatherLogger()
         self.logger = logger.get_logger()
 
+    @writes
     def initialize_db(self):
-        """ Initializes a sqlite database file with the given DB name. """
-        with DBCM(self.db_name) as cursor:
+        """ Initializes a sqlite database file with the given DB name and switches it to WAL mode,
+        in which readers see the last committed data instead of waiting for writes to finish. """
+        with DBCM(self.db_name, self.read_only) as cursor:
             try:
+                cursor.execute("pragma journal_mode=WAL")
                 cursor.execute('''create table if not exists weather
                                 (id integer primary key autoincrement not null,
                                 sample_date text,
@@ -31,56 +83,516 @@ class DBOperations:
                                 min_temp real,
                                 max_temp real,
                                 avg_temp real,
+                                quality text,
                                 unique (sample_date, location));''')
+                cursor.execute('''create table if not exists page_validators
+                                (url text primary key not null,
+                                etag text,
+                                last_modified text);''')
+                cursor.execute('''create table if not exists weather_monthly
+                                (location text not null,
+                                year integer not null,
+                                month integer not null,
+                                day_count integer not null,
+                                mean_sum real,
+                                mean_min real,
+                                mean_max real,
+                                sketch blob,
+                                primary key (location, year, month));''')
+
+                cursor.execute('''create table if not exists weather_staging
+                                (sample_date text not null,
+                                location text not null,
+                                min_temp real,
+                                max_temp real,
+                                avg_temp real,
+                                quality text,
+                                unique (sample_date, location));''')
+                cursor.execute('''create table if not exists download_checkpoints
+                                (location text primary key not null,
+                                station_id integer,
+                                started_at text,
+                                start_month text,
+                                last_completed text);''')
+                cursor.execute('''create table if not exists data_versions
+                                (location text not null,
+                                year integer not null,
+                                month integer not null,
+                                version integer not null,
+                                primary key (location, year, month));''')
+                cursor.execute('''create table if not exists climate_monthly
+                                (location text not null,
+                                year integer not null,
+                                month integer not null,
+                                days integer not null,
+                                mean_count integer not null,
+                                mean_sum real,
+                                mean_sq_sum real,
+                                min_count integer not null,
+                                min_sum real,
+                                low real,
+                                max_count integer not null,
+                                max_sum real,
+                                high real,
+                                hdd real,
+                                cdd real,
+                                primary key (location, year, month));''')
+                cursor.execute('''create table if not exists weather_coverage
+                                (location text not null,
+                                year integer not null,
+                                month integer not null,
+                                days_in_month integer not null,
+                                days integer not null,
+                                max_days integer not null,
+                                min_days integer not null,
+                                mean_days integer not null,
+                                flagged_days integer not null,
+                                primary key (location, year, month));''')
+
+                # Databases created before quality flags were stored gain the quality column,
+                # and their range index is rebuilt to cover it, so range reads never visit the table.
+                for table in ("weather", "weather_staging"):
+                    cursor.execute(f"pragma table_info({table})")
+                    if "quality" not in {row[1] for row in cursor.fetchall()}:
+                        cursor.execute(f"alter table {table} add column quality text")
+                cursor.execute("pragma index_info(weather_location_date)")
+                if "quality" not in {row[2] for row in cursor.fetchall()}:
+                    cursor.execute("drop index if exists weather_location_date")
+                cursor.execute('''create index if not exists weather_location_date
+                                on weather (location, sample_date, min_temp, max_temp, avg_temp, quality);''')
+                cursor.execute('''create index if not exists weather_flagged
+                                on weather (location, sample_date) where quality is not null;''')
+
+                cursor.execute("select exists (select 1 from weather_monthly)")
+                if not cursor.fetchone()[0]:
+                    cursor.execute("select location, substr(sample_date, 1, 7) from weather group by 1, 2")
+                    for location, month in cursor.fetchall():
+                        self.update_rollups(cursor, location, [month])
+
+                from climate_stats import update_climate_months
+                from data_quality import update_coverage
+
+                for table, update in (("climate_monthly", update_climate_months),
+                                      ("weather_coverage", update_coverage)):
+                    cursor.execute(f"select exists (select 1 from {table})")
+                    if not cursor.fetchone()[0]:
+                        cursor.execute("select location, substr(sample_date, 1, 7) from weather group by 1, 2")
+                        by_location = {}
+                        for location, month in cursor.fetchall():
+                            by_location.setdefault(location, []).append(month)
+                        for location, months in by_location.items():
+                            update(cursor, location, months)
 
                 self.logger.info("Database initialized successfully.")
             except Exception as e:
                 self.logger.critical("Database initialization failed! Error: %s", e)
 
+    @writes
     def purge_data(self):
         """ Purges the database of all entries. """
-        with DBCM(self.db_name) as cursor:
+        with DBCM(self.db_name, self.read_only) as cursor:
             try:
                 cursor.execute('''delete from weather''')
+                cursor.execute('''delete from weather_monthly''')
+                cursor.execute('''delete from climate_monthly''')
+                cursor.execute('''delete from weather_coverage''')
+                cursor.execute('''update data_versions set version = version + 1''')
                 self.logger.info("Database purged successfully.")
             except Exception as e:
                 self.logger.error("Database purge failed! Error: %s", e)
 
-    def save_data(self, weather_data, location="Winnipeg, MB"):
-        """ Accepts a dictionary of weather data and inserts the given values into the database. """
-        with DBCM(self.db_name) as cursor:
+    @writes
+    def save_data(self, weather_data, location="Winnipeg, MB", chunk_size=None, replace=False):
+        """ Accepts weather data and inserts the given values into the database.
+        Weather data may be a dictionary of date: values pairs or any iterable of
+        (date, values) pairs, such as rows streamed straight from the scraper.
+        Missing values are stored as NULL, with the quality flags found in values['Flags'].
+        Rows are inserted in chunks inside a single transaction, many rows per statement,
+        and the monthly rollups of every month touched are brought up to date.
+        If replace is set, the location's stored rows are deleted in the same transaction,
+        so readers see either the old rows or the new ones, never an emptied table. """
+        from aggregation import DayColumns
+
+        chunk_size = chunk_size or self.chunk_size
+        items = weather_data.items() if hasattr(weather_data, "items") else weather_data
+        touched_months = set()
+        days = DayColumns()
+
+        rows = (weather_row(date, location, data) for date, data in items)
+        submitted = 0
+        inserted = 0
+        start = time.perf_counter()
+
+        with DBCM(self.db_name, self.read_only) as cursor:
             try:
-                for date, data in weather_data.items():
-                    max_temp = data.get('Max')
-                    min_temp = data.get('Min')
-                    avg_temp = data.get('Mean')
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO weather
-                            (sample_date, location, min_temp, max_temp, avg_temp)
-                        VALUES
-                            (?, ?, ?, ?, ?)
-                    ''', (date, location, min_temp, max_temp, avg_temp))
-                    # datetime.strptime(date, "%Y-%m-%d")
-                self.logger.info("Database insert of %s items completed successfully.", len(weather_data))
+                for pragma in BULK_LOAD_PRAGMAS:
+                    cursor.execute(pragma)
+                cursor.execute("begin")
+
+                if replace:
+                    cursor.execute("select distinct substr(sample_date, 1, 7) from weather where location = ?",
+                                   (location,))
+                    touched_months.update(row[0] for row in cursor.fetchall())
+                    cursor.execute("delete from weather where location = ?", (location,))
+
+                while True:
+                    chunk = list(islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    for first in range(0, len(chunk), ROWS_PER_STATEMENT):
+                        batch = chunk[first:first + ROWS_PER_STATEMENT]
+                        cursor.execute(insert_statement(len(batch)), list(chain.from_iterable(batch)))
+                        inserted += max(cursor.rowcount, 0)
+                    touched_months.update({row[0][:7] for row in chunk})
+                    days.add(chunk)
+                    submitted += len(chunk)
+
+                # Without ignored duplicates, the rows just written are all the days of the months which held
+                # none before, or of every month if the location was replaced, so those are summarized in memory.
+                if inserted == submitted:
+                    days.whole_months = touched_months if replace else self.unstored_months(cursor, location,
+                                                                                            touched_months)
+                if inserted or replace:
+                    self.update_rollups(cursor, location, touched_months, days)
+
+                self.logger.info("Database insert of %s items completed successfully (%s new).",
+                                 submitted, inserted)
             except Exception as e:
+                cursor.connection.rollback()
+                inserted = 0
                 self.logger.critical("Database insert failed! Error: %s", e)
 
-    def fetch_data(self):
-        """ Returns all rows from the database. """
+        Metrics.observe("db.save_data", time.perf_counter() - start, submitted)
+        Metrics.count("db.rows_inserted", inserted)
+        return inserted
+
+    @writes
+    def upsert_data(self, weather_data, location="Winnipeg, MB", validators=None):
+        """ Accepts a dictionary of weather data and writes only the rows which are new
+        or whose values differ from the stored ones, then refreshes the rollups of the months touched.
+        Returns a dictionary of the rows which were written.
+        The page validators of the scrape, if given, are saved in the same transaction: validators saved
+        without their rows would have the next update skip those months as unmodified.
+        Errors are logged and raised once the transaction has been rolled back. """
+        if not weather_data:
+            if validators:
+                self.save_validators(validators)
+            return {}
+
+        changed = {}
+        start = time.perf_counter()
+
+        with DBCM(self.db_name, self.read_only) as cursor:
+            try:
+                cursor.execute("begin")
+                cursor.execute('''select sample_date, location, min_temp, max_temp, avg_temp,
+                                quality from weather
+                                where location = ? and sample_date between ? and ?''',
+                               (location, min(weather_data), max(weather_data)))
+                stored = {row[0]: row for row in cursor.fetchall()}
+
+                for date, data in weather_data.items():
+                    if stored.get(date) != weather_row(date, location, data):
+                        changed[date] = data
+
+                cursor.executemany('''
+                    INSERT INTO weather
+                        (sample_date, location, min_temp, max_temp, avg_temp, quality)
+                    VALUES
+                        (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (sample_date, location) DO UPDATE SET
+                        min_temp = excluded.min_temp,
+                        max_temp = excluded.max_temp,
+                        avg_temp = excluded.avg_temp,
+                        quality = excluded.quality
+                ''', [weather_row(date, location, data) for date, data in changed.items()])
+
+                self.update_rollups(cursor, location, {date[:7] for date in changed})
+                if validators:
+                    self.write_validators(cursor, validators)
+                self.logger.info("Database upsert wrote %s of %s rows.", len(changed), len(weather_data))
+            except Exception as e:
+                cursor.connection.rollback()
+                self.logger.critical("Database upsert failed! Error: %s", e)
+                raise
+
+        Metrics.observe("db.upsert_data", time.perf_counter() - start, len(weather_data))
+        Metrics.count("db.rows_written", len(changed))
+        return changed
+
+    @writes
+    def start_download(self, location, station_id, start_month):
+        """ Starts or resumes a staged full download of a location and returns the 'YYYY-MM' month
+        to continue from. A checkpoint left by an interrupted download of the same station is resumed,
+        otherwise the location's staging rows are cleared and a new checkpoint is written. """
+        with DBCM(self.db_name, self.read_only) as cursor:
+            cursor.execute('''select station_id, start_month, last_completed from download_checkpoints
+                            where location = ?''', (location,))
+            checkpoint = cursor.fetchone()
+
+            if checkpoint and checkpoint[0] == station_id:
+                _, first_month, last_completed = checkpoint
+                if last_completed is None:
+                    return first_month
+                year, month = int(last_completed[:4]), int(last_completed[5:7])
+                year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+                self.logger.info("Resuming download of %s after %s.", location, last_completed)
+                return f"{year:04d}-{month:02d}"
+
+            cursor.execute("delete from weather_staging where location = ?", (location,))
+            cursor.execute('''
+                INSERT OR REPLACE INTO download_checkpoints
+                    (location, station_id, started_at, start_month, last_completed)
+                VALUES
+                    (?, ?, ?, ?, NULL)
+            ''', (location, station_id, datetime.now().isoformat(timespec="seconds"), start_month))
+            self.logger.info("Starting download of %s from %s.", location, start_month)
+            return start_month
+
+    @writes
+    def save_month(self, location, weather_data, month):
+        """ Stages the rows of one downloaded 'YYYY-MM' month and advances the checkpoint
+        to it in the same transaction, so a month is either fully staged or not at all. """
+        with DBCM(self.db_name, self.read_only) as cursor:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO weather_staging
+                    (sample_date, location, min_temp, max_temp, avg_temp, quality)
+                VALUES
+                    (?, ?, ?, ?, ?, ?)
+            ''', [weather_row(date, location, data) for date, data in weather_data.items()])
+            cursor.execute("update download_checkpoints set last_completed = ? where location = ?",
+                           (month, location))
+
+    def count_staged(self, location):
+        """ Returns the number of rows staged for a location by an unfinished download. """
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                cursor.execute("select count(*) from weather_staging where location = ?", (location,))
+                return cursor.fetchone()[0]
+            except Exception as e:
+                self.logger.error("Error counting staged rows. Error: %s", e)
+                return 0
+
+    @writes
+    def finish_download(self, location):
+        """ Atomically replaces the stored rows of a location with its staged rows,
+        rebuilds its rollups and clears the staging rows and checkpoint.
+        Raises ValueError and leaves the stored rows untouched if nothing is staged. """
+        start = time.perf_counter()
+        with DBCM(self.db_name, self.read_only) as cursor:
+            try:
+                cursor.execute("begin immediate")
+                cursor.execute("select count(*) from weather_staging where location = ?", (location,))
+                if cursor.fetchone()[0] == 0:
+                    raise ValueError(f"No rows are staged for {location}.")
+                cursor.execute('''select substr(sample_date, 1, 7) from weather where location = ?
+                                union select substr(sample_date, 1, 7) from weather_staging where location = ?''',
+                               (location, location))
+                months = [row[0] for row in cursor.fetchall()]
+                cursor.execute("delete from weather where location = ?", (location,))
+                cursor.execute('''insert into weather (sample_date, location, min_temp, max_temp, avg_temp, quality)
+                                select sample_date, location, min_temp, max_temp, avg_temp, quality
+                                from weather_staging where location = ? order by sample_date''', (location,))
+                swapped = cursor.rowcount
+
+                cursor.execute("delete from weather_monthly where location = ?", (location,))
+                self.update_rollups(cursor, location, months)
+
+                cursor.execute("delete from weather_staging where location = ?", (location,))
+                cursor.execute("delete from download_checkpoints where location = ?", (location,))
+                self.logger.info("Swapped %s downloaded rows into place for %s.", swapped, location)
+                Metrics.observe("db.finish_download", time.perf_counter() - start, swapped)
+                return swapped
+            except Exception as e:
+                cursor.connection.rollback()
+                self.logger.critical("Swapping downloaded rows failed! Error: %s", e)
+                raise
+
+    def snapshot(self):
+        """ Returns a context manager inside which every read of this thread sees the same snapshot
+        of the database, e.g. a data version and the rows it describes, even while writes are committed. """
+        return ConnectionPool.get(self.db_name, read_only=True).snapshot()
+
+    def fetch_date_bounds(self):
+        """ Returns the (first, last) sample dates in the database, or (None, None) if it is empty. """
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                cursor.execute("select min(sample_date), max(sample_date) from weather")
+                return cursor.fetchone()
+            except Exception as e:
+                self.logger.error("Error fetching date bounds. Error: %s", e)
+                return None, None
+
+    def latest_dates(self):
+        """ Returns a dictionary of location: most recent sample date. """
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                cursor.execute("select location, max(sample_date) from weather group by location")
+                return dict(cursor.fetchall())
+            except Exception as e:
+                self.logger.error("Error fetching latest dates. Error: %s", e)
+                return {}
+
+    @staticmethod
+    def unstored_months(cursor, location, months):
+        """ Returns the 'YYYY-MM' months among the given ones for which the location had no stored days
+        before the current transaction, read from the climate statistics, which are only brought up to date
+        once a write's rows are all in. """
+        if not months:
+            return set()
+        first, last = min(months), max(months)
+        cursor.execute('''select year, month from climate_monthly
+                        where location = ? and (year, month) between (?, ?) and (?, ?)''',
+                       (location, int(first[:4]), int(first[5:7]), int(last[:4]), int(last[5:7])))
+        return set(months) - {f"{year:04d}-{month:02d}" for year, month in cursor.fetchall()}
+
+    def update_rollups(self, cursor, location, months, days=None):
+        """ Recomputes the monthly rollup rows of a location for the given
+        'YYYY-MM' months from the daily rows, using the caller's cursor and transaction.
+        Each run of consecutive months is summarized by grouped queries, as in update_climate_months,
+        except for the months whose days are all held in days, an aggregation.DayColumns of the rows
+        just written, which are summarized in memory.
+        The data version of each month is bumped and its climate statistics and coverage are refreshed,
+        as every write path comes through here. """
+        from aggregation import encode_month_sketches, month_rollups
+        from climate_stats import update_climate_months
+        from data_quality import update_coverage
+
+        start = time.perf_counter()
+        whole = days.covers(months) if days else set()
+        rollups = [(location, *rollup) for rollup in month_rollups(days, whole)] if whole else []
+        for first, last in month_runs(set(months) - whole):
+            span = (location, f"{first}-01", f"{last}-31")
+            cursor.execute('''
+                select cast(substr(sample_date, 1, 4) as integer), cast(substr(sample_date, 6, 2) as integer),
+                    count(*), sum(avg_temp), min(avg_temp), max(avg_temp)
+                from weather
+                where location = ? and sample_date between ? and ? and avg_temp is not null
+                group by substr(sample_date, 1, 7)
+            ''', span)
+            summaries = cursor.fetchall()
+            if not summaries:
+                continue
+
+            # Only the means of months which hold any are read, in index order, to build their sketches.
+            cursor.execute('''
+                select cast(substr(sample_date, 1, 4) as integer) * 12 + cast(substr(sample_date, 6, 2) as integer) - 1,
+                    avg_temp
+                from weather
+                where location = ? and sample_date between ? and ? and avg_temp is not null
+            ''', span)
+            sketches = encode_month_sketches(*zip(*cursor.fetchall()))
+            rollups.extend((location, year, month, *summary, sketches[year * 12 + month - 1])
+                           for year, month, *summary in summaries)
+
+        cursor.executemany('''
+            INSERT INTO data_versions (location, year, month, version)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT (location, year, month) DO UPDATE SET version = version + 1
+        ''', [(location, int(month[:4]), int(month[5:7])) for month in months])
+        summarized = {(year, month) for _, year, month, *_ in rollups}
+        cursor.executemany("delete from weather_monthly where location = ? and year = ? and month = ?",
+                           [(location, int(month[:4]), int(month[5:7])) for month in months
+                            if (int(month[:4]), int(month[5:7])) not in summarized])
+        cursor.executemany('''
+            INSERT OR REPLACE INTO weather_monthly
+                (location, year, month, day_count, mean_sum, mean_min, mean_max, sketch)
+            VALUES
+                (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rollups)
+
+        update_climate_months(cursor, location, months, days)
+        # The coverage index is read from the climate statistics written just above.
+        update_coverage(cursor, location, months, days)
+        Metrics.observe("db.update_rollups", time.perf_counter() - start, len(months))
+
+    def fetch_monthly_rollups(self, start_year, end_year, location="Winnipeg, MB"):
+        """ Returns the monthly rollup rows of a location for a span of years
+        as (month, day_count, mean_sum, sketch) tuples. """
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                cursor.execute('''select month, day_count, mean_sum, sketch from weather_monthly
+                                where location = ? and year between ? and ?
+                                order by year, month''', (location, start_year, end_year))
+                return cursor.fetchall()
+            except Exception as e:
+                self.logger.error("Error fetching monthly rollups. Error: %s", e)
+                return []
+
+    def fetch_climate_months(self, start_year, end_year, location="Winnipeg, MB"):
+        """ Returns the climate_monthly rows of a location for a span of years, in date order,
+        as tuples in the column order of climate_stats.MONTHLY_COLUMNS. """
+        from climate_stats import MONTHLY_COLUMNS
+
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                cursor.execute(f'''select {", ".join(MONTHLY_COLUMNS)} from climate_monthly
+                                where location = ? and year between ? and ?
+                                order by year, month''', (location, start_year, end_year))
+                return cursor.fetchall()
+            except Exception as e:
+                self.logger.error("Error fetching climate statistics. Error: %s", e)
+                return []
+
+    def fetch_coverage(self, location, start_month, end_month):
+        """ Returns the coverage index of a location between two (year, month) pairs, inclusive,
+        as a dictionary of (year, month): (days_in_month, days, max_days, min_days, mean_days, flagged_days).
+        Months without stored days are absent. """
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                cursor.execute('''select year, month, days_in_month, days, max_days, min_days, mean_days, flagged_days
+                                from weather_coverage
+                                where location = ? and (year, month) between (?, ?) and (?, ?)
+                                order by year, month''', (location, *start_month, *end_month))
+                return {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+            except Exception as e:
+                self.logger.error("Error fetching coverage. Error: %s", e)
+                return {}
+
+    def covered_months(self, location, start_month, end_month):
+        """ Returns the (year, month) pairs between two (year, month) pairs, inclusive,
+        which hold at least one mean temperature, read from the coverage index. """
+        return [month for month, coverage in self.fetch_coverage(location, start_month, end_month).items()
+                if coverage[4]]
+
+    def fetch_data_version(self, location, start_month, end_month):
+        """ Returns a version stamp of a location's data between two (year, month) pairs, inclusive.
+        Versions only ever increase, so the stamp changes whenever a month in the range is written. """
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                cursor.execute('''select count(*), coalesce(sum(version), 0) from data_versions
+                                where location = ? and (year, month) between (?, ?) and (?, ?)''',
+                               (location, *start_month, *end_month))
+                count, total = cursor.fetchone()
+                return f"{count}.{total}"
+            except Exception as e:
+                self.logger.error("Error fetching data version. Error: %s", e)
+                return None
+
+    def fetch_data(self, location="Winnipeg, MB", columnar=False):
+        """ Returns all rows stored for a location, newest first, with the quality flags of flagged days.
+        If columnar is set, the rows are returned as a WeatherStore instead of a dictionary. """
+        from weather_store import WeatherStore
+
         weather_data = {}
 
-        with DBCM(self.db_name) as cursor:
+        with DBCM(self.db_name, read_only=True) as cursor:
             try:
-                cursor.execute("select * from weather order by sample_date desc")
-                rows = cursor.fetchall()
+                if columnar:
+                    cursor.execute("select sample_date, min_temp, max_temp, avg_temp, quality from weather "
+                                   "where location = ? order by sample_date", (location,))
+                    weather_data = WeatherStore.from_rows(cursor)
+                    self.logger.info("Database rows from database \"%s\" retrieved successfully.", self.db_name)
+                    return weather_data
 
-                for row in rows:
-                    date = row[1]
-                    min_temp = row[3]
-                    max_temp = row[4]
-                    avg_temp = row[5]
+                cursor.execute("select sample_date, min_temp, max_temp, avg_temp, quality from weather "
+                               "where location = ? order by sample_date desc", (location,))
+                rows = cursor.fetchall()
 
+                for date, min_temp, max_temp, avg_temp, quality in rows:
                     weather_data[date] = {'Min': min_temp, 'Max': max_temp, 'Mean': avg_temp}
+                    if quality:
+                        weather_data[date]['Flags'] = decode_flags(quality)
 
                 self.logger.info("Database rows from database \"%s\" retrieved successfully.", self.db_name)
                 return weather_data
@@ -88,13 +600,106 @@ class DBOperations:
                 self.logger.error("Error fetching rows from table. Error: %s", e)
                 return e
 
+    def fetch_range(self, start_date, end_date, location="Winnipeg, MB", columnar=False):
+        """ Returns the rows for a location between two dates (inclusive),
+        in chronological order. The filter runs in SQL on the (location, sample_date) index.
+        If columnar is set, the rows are returned as a WeatherStore instead of a dictionary. """
+        from weather_store import WeatherStore
+
+        if columnar:
+            backend = self.columnar_backend(location)
+            if backend is not None:
+                return backend.read(location, start_date, end_date)
+
+        weather_data = WeatherStore() if columnar else {}
+        start = time.perf_counter()
+
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                if columnar:
+                    cursor.execute('''select sample_date, min_temp, max_temp, avg_temp, quality from weather
+                                    where location = ? and sample_date between ? and ?
+                                    order by sample_date''', (location, start_date, end_date))
+                    weather_data = WeatherStore.from_rows(cursor)
+                else:
+                    cursor.execute('''select sample_date, min_temp, max_temp, avg_temp, quality from weather
+                                    where location = ? and sample_date between ? and ?
+                                    order by sample_date''', (location, start_date, end_date))
+                    for date, min_temp, max_temp, avg_temp, quality in cursor.fetchall():
+                        weather_data[date] = {'Min': min_temp, 'Max': max_temp, 'Mean': avg_temp}
+                        if quality:
+                            weather_data[date]['Flags'] = decode_flags(quality)
+
+                self.logger.info("Fetched %s rows between %s and %s.", len(weather_data), start_date, end_date)
+            except Exception as e:
+                self.logger.error("Error fetching rows from table. Error: %s", e)
+
+        Metrics.observe("db.fetch_range", time.perf_counter() - start, len(weather_data))
+        return weather_data
+
+    def columnar_backend(self, location):
+        """ Returns the columnar copy of the database if one is configured
+        and holds the current data version of the location, otherwise None. """
+        if not self.columnar_dir:
+            return None
+
+        from storage import ColumnarBackend
+
+        backend = ColumnarBackend(self.columnar_dir)
+        version = backend.version(location)
+        if version is None or version != self.fetch_data_version(location, (0, 1), (9999, 12)):
+            return None
+        return backend
+
+    def fetch_month(self, year, month, location="Winnipeg, MB", columnar=False):
+        """ Returns the rows for a single month of a location. """
+        return self.fetch_range(f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-31",
+                                location, columnar)
+
+    def fetch_years(self, start_year, end_year, location="Winnipeg, MB", columnar=False):
+        """ Returns the rows for a span of years of a location. """
+        return self.fetch_range(f"{start_year:04d}-01-01", f"{end_year:04d}-12-31",
+                                location, columnar)
+
+    def fetch_validators(self):
+        """ Returns a dictionary of url: (etag, last_modified) pairs
+        stored for previously scraped pages. """
+        with DBCM(self.db_name, read_only=True) as cursor:
+            try:
+                cursor.execute("select url, etag, last_modified from page_validators")
+                return {url: (etag, last_modified) for url, etag, last_modified in cursor.fetchall()}
+            except Exception as e:
+                self.logger.error("Error fetching page validators. Error: %s", e)
+                return {}
+
+    @writes
+    def save_validators(self, validators):
+        """ Accepts a dictionary of url: (etag, last_modified) pairs
+        and stores them for conditional requests on the next scrape. """
+        with DBCM(self.db_name, self.read_only) as cursor:
+            try:
+                self.write_validators(cursor, validators)
+            except Exception as e:
+                self.logger.error("Error saving page validators. Error: %s", e)
+
+    def write_validators(self, cursor, validators):
+        """ Stores a dictionary of url: (etag, last_modified) pairs with the given cursor. """
+        cursor.executemany('''
+            INSERT OR REPLACE INTO page_validators
+                (url, etag, last_modified)
+            VALUES
+                (?, ?, ?)
+        ''', [(url, etag, last_modified) for url, (etag, last_modified) in validators.items()])
+        self.logger.info("Saved validators for %s pages.", len(validators))
+
 if __name__ == "__main__":
+    from scrape_weather import WeatherScraper
+
     weather_scraper = WeatherScraper()
     db_ops = DBOperations()
 
     weather_data = weather_scraper.scrape_weather_data()
 
     db_ops.initialize_db()
-    db_ops.purge_data()
-    db_ops.save_data(weather_data, "Winnipeg, MB")
+    db_ops.save_data(weather_data, "Winnipeg, MB", replace=True)
 
@@ -1,37 +1,302 @@
 """
-This module contains the DBCM class,
-which manages cursors and opening/closing connections to a SQLite3 database.
+This module contains the DBCM, ConnectionPool and DatabaseWriter classes,
+which manage cursors, long-lived, pooled connections and the single writer thread of a SQLite3 database.
+With the database in WAL mode, writes are queued to the writer thread while readers keep using
+their own connections, each reading a consistent snapshot of the last committed data.
 """
 
+import atexit
+import contextlib
+import os
+import pathlib
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future
 from weather_logger import WeatherLogger
 
+class ConnectionPool:
+    """ Represents a thread-safe pool of long-lived connections to one SQLite3 database.
+    Reusing connections keeps each connection's prepared statement cache warm. """
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def __init__(self, db_name, max_size=5, cached_statements=256, read_only=False, timeout=30.0):
+        """ Initializes an instance of the ConnectionPool class.
+        Connections of a read-only pool open the database file in read-only mode,
+        and a checkout waits up to timeout seconds for a connection once the pool is full. """
+        self.db_name = db_name
+        self.read_only = read_only
+        self.max_size = max_size
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.size = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.pinned = threading.local()
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    @classmethod
+    def get(cls, db_name, read_only=False):
+        """ Returns the shared pool for the given database, creating it on first use.
+        Read-only and read-write connections are kept in separate pools. """
+        key = (os.path.abspath(db_name), read_only)
+        with cls.pools_lock:
+            pool = cls.pools.get(key)
+            if pool is None:
+                pool = cls.pools[key] = cls(db_name, read_only=read_only)
+            return pool
+
+    @classmethod
+    def close_all(cls):
+        """ Closes every idle connection in every pool.
+        Read-only pools are closed first, so the last connection to each database can checkpoint its WAL. """
+        with cls.pools_lock:
+            for pool in sorted(cls.pools.values(), key=lambda pool: not pool.read_only):
+                pool.close()
+            cls.pools.clear()
+
+    @classmethod
+    def release(cls, db_name):
+        """ Closes and forgets both pools of one database, so the file can be moved, replaced or deleted.
+        Read-only connections are closed first, so the last connection checkpoints and removes the WAL.
+        Connections checked out at the time are closed when they are checked back in. """
+        path = os.path.abspath(db_name)
+        with cls.pools_lock:
+            pools = [cls.pools.pop((path, read_only), None) for read_only in (True, False)]
+        for pool in pools:
+            if pool is not None:
+                pool.close()
+
+    @classmethod
+    def reset_after_fork(cls):
+        """ Forgets the parent's pools in a forked child process.
+        Connections inherited from the parent must not be used, or closed, by the child. """
+        cls.pools_lock = threading.Lock()
+        cls.pools = {}
+
+    def connect(self):
+        """ Opens a new connection which may be handed between threads. """
+        if self.read_only:
+            conn = sqlite3.connect(f"{pathlib.Path(self.db_name).resolve().as_uri()}?mode=ro", uri=True,
+                                   check_same_thread=False, cached_statements=self.cached_statements)
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+        self.logger.info("Opened database %s successfully.", self.db_name)
+        return conn
+
+    def checkout(self):
+        """ Returns an idle connection, opening a new one if the pool is not full,
+        or waiting for one to be checked in otherwise. """
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            grow = self.size < self.max_size
+            if grow:
+                self.size += 1
+
+        if not grow:
+            try:
+                return self.idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No connection to {self.db_name} was free within {self.timeout} seconds; "
+                                   f"all {self.max_size} are checked out.") from None
+
+        try:
+            return self.connect()
+        except Exception:
+            with self.lock:
+                self.size -= 1
+            raise
+
+    def checkin(self, conn):
+        """ Returns a connection to the pool, or closes it if the pool has been closed. """
+        if self.closed:
+            conn.close()
+            with self.lock:
+                self.size -= 1
+            return
+        self.idle.put(conn)
+
+    def pinned_connection(self):
+        """ Returns the connection pinned to the calling thread by snapshot(), or None. """
+        return getattr(self.pinned, "conn", None)
+
+    @contextlib.contextmanager
+    def snapshot(self):
+        """ Pins one connection to the calling thread inside a read transaction for the duration
+        of the block, so every DBCM block on this pool in the thread reads the same snapshot,
+        however many writes are committed meanwhile. Nested snapshots share the outermost one. """
+        if self.pinned_connection() is not None:
+            yield self.pinned_connection()
+            return
+
+        conn = self.checkout()
+        try:
+            # A deferred transaction only takes its snapshot at the first read.
+            conn.execute("begin")
+            conn.execute("select count(*) from sqlite_master").fetchone()
+            self.pinned.conn = conn
+            yield conn
+        finally:
+            self.pinned.conn = None
+            conn.rollback()
+            self.checkin(conn)
+
+    def close(self):
+        """ Closes every idle connection in the pool. Connections checked in afterwards are closed as well. """
+        self.closed = True
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self.lock:
+                self.size -= 1
+
+
+atexit.register(ConnectionPool.close_all)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ConnectionPool.reset_after_fork)
+
+
+class DatabaseWriter:
+    """ Represents the writer thread of one SQLite3 database.
+    Writes submitted from any thread are queued and run one at a time on the writer thread,
+    which takes its connection from the database's read-write pool, so writers never contend
+    with each other for the database lock and a long ingest never blocks the readers. """
+    writers = {}
+    writers_lock = threading.Lock()
+
+    def __init__(self, db_name):
+        """ Initializes an instance of the DatabaseWriter class and starts its thread. """
+        self.db_name = db_name
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name=f"db-writer-{os.path.basename(db_name)}")
+        self.thread.start()
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    @classmethod
+    def get(cls, db_name):
+        """ Returns the writer of the given database, starting it on first use. """
+        key = os.path.abspath(db_name)
+        with cls.writers_lock:
+            writer = cls.writers.get(key)
+            if writer is None or not writer.thread.is_alive():
+                writer = cls.writers[key] = cls(db_name)
+            return writer
+
+    @classmethod
+    def stop_all(cls):
+        """ Stops every writer once the writes already queued have run. """
+        with cls.writers_lock:
+            writers = list(cls.writers.values())
+            cls.writers.clear()
+        for writer in writers:
+            writer.stop()
+
+    @classmethod
+    def reset_after_fork(cls):
+        """ Forgets the parent's writers in a forked child process, where their threads do not exist. """
+        cls.writers_lock = threading.Lock()
+        cls.writers = {}
+
+    def submit(self, function, *args, **kwargs):
+        """ Queues a call to run on the writer thread and returns a Future of its result. """
+        future = Future()
+        self.jobs.put((future, function, args, kwargs))
+        return future
+
+    def call(self, function, *args, **kwargs):
+        """ Runs a call on the writer thread, waits for it and returns its result or raises its exception.
+        Calls made from the writer thread itself run straight away. """
+        if threading.current_thread() is self.thread:
+            return function(*args, **kwargs)
+        return self.submit(function, *args, **kwargs).result()
+
+    def run(self):
+        """ Runs queued calls until a None job is taken off the queue. """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            future, function, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def stop(self):
+        """ Stops the thread after the writes already queued. """
+        if self.thread.is_alive():
+            self.jobs.put(None)
+            self.thread.join()
+            self.logger.debug("Stopped the writer of database %s.", self.db_name)
+
+
+# Registered after close_all, so queued writes finish before the connections are closed.
+atexit.register(DatabaseWriter.stop_all)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=DatabaseWriter.reset_after_fork)
+
+
 class DBCM:
     """ Context Manager class for handling SQLite3 database connections. """
-    def __init__(self, db_name='weather_data.sqlite'):
-        """ Initializes an instance of the DBCM class. """
+    def __init__(self, db_name='weather_data.sqlite', read_only=False):
+        """ Initializes an instance of the DBCM class.
+        If read_only is set, the cursor comes from the database's pool of read-only connections. """
         self.db_name = db_name
+        self.pool = ConnectionPool.get(db_name, read_only)
         self.conn = None
+        self.cursor = None
+        self.pinned = False
 
         logger = WeatherLogger()
         self.logger = logger.get_logger()
 
     def __enter__(self):
-        """ Establishes a connection with the SQLite3 database and returns a cursor. """
+        """ Checks a connection out of the pool and returns a cursor.
+        Inside the pool's snapshot() block, the cursor comes from the thread's pinned connection. """
         try:
-            self.conn = sqlite3.connect(self.db_name)
-            self.logger.info("Opened database successfully.")
-            return self.conn.cursor()
+            self.pinned = self.pool.pinned_connection() is not None
+            self.conn = self.pool.pinned_connection() or self.pool.checkout()
+            self.cursor = self.conn.cursor()
+            return self.cursor
         except Exception as e:
             self.logger.error("Opening database failed! Error: %s", e)
             return e
 
     def __exit__(self, exc_type, exc_val, exc_trace):
-        """ Closes connection upon completing database tasks. """
-        if exc_type or exc_val or exc_trace:
-            self.conn.rollback()
-            self.logger.error("Error occurred. Rollback executed.")
-        else:
-            self.conn.commit()
-            self.logger.info("Changes committed.")
-        self.conn.close()
+        """ Commits or rolls back, then returns the connection to the pool. """
+        if self.conn is None:
+            return
+        if self.pinned:
+            # The snapshot's transaction stays open until its block ends.
+            self.cursor.close()
+            self.conn = None
+            return
+        try:
+            if exc_type or exc_val or exc_trace:
+                self.conn.rollback()
+                self.logger.error("Error occurred. Rollback executed.")
+            else:
+                self.conn.commit()
+                self.logger.debug("Changes committed.")
+        finally:
+            self.cursor.close()
+            self.pool.checkin(self.conn)
+            self.conn = None
@@ -0,0 +1,121 @@
+"""
+This module contains the DailyTableParser class,
+a streaming parser for the daily data table of climate.weather.gc.ca month pages.
+It skips everything outside of <tbody> and pulls the date, max, min and mean
+out of each row with precompiled patterns instead of per-tag callbacks.
+"""
+
+import re
+import time
+from data_quality import FIELDS, parse_cell
+
+MONTHS = {
+    b"January": 1, b"February": 2, b"March": 3, b"April": 4, b"May": 5, b"June": 6,
+    b"July": 7, b"August": 8, b"September": 9, b"October": 10, b"November": 11, b"December": 12,
+}
+
+TBODY_START = re.compile(rb"<tbody\b", re.IGNORECASE)
+TBODY_END = re.compile(rb"</tbody\s*>", re.IGNORECASE)
+ROW_END = re.compile(rb"</tr\s*>", re.IGNORECASE)
+ROW_DATE = re.compile(rb'<abbr[^>]*\btitle="([A-Za-z]+) (\d{1,2}), (\d{4})"', re.IGNORECASE)
+ROW_CELL = re.compile(rb"<td\b[^>]*>(.*?)</td\s*>", re.IGNORECASE | re.DOTALL)
+TAG = re.compile(rb"<[^>]*>")
+
+def page_months(body):
+    """ Returns the set of (year, month) pairs of the row dates on a month page,
+    without parsing the rest of the table. """
+    months = set()
+    for match in ROW_DATE.finditer(body):
+        month = MONTHS.get(match.group(1).capitalize())
+        if month is not None:
+            months.add((int(match.group(3)), month))
+    return months
+
+class DailyTableParser:
+    """ Represents an incremental parser for the daily data table.
+    Bytes can be fed in chunks as they arrive, and complete rows
+    are parsed as soon as their closing tag has been seen. """
+    def __init__(self):
+        """ Initializes an instance of the DailyTableParser class. """
+        self.buffer = b""
+        self.in_tbody = False
+        self.weather = {}
+        self.parse_time = 0.0
+
+    def feed(self, chunk):
+        """ Accepts the next chunk of the page and parses every complete row in it.
+        The time spent parsing is added to parse_time. """
+        start = time.perf_counter()
+        try:
+            return self.parse_chunk(chunk)
+        finally:
+            self.parse_time += time.perf_counter() - start
+
+    def parse_chunk(self, chunk):
+        """ Parses every complete row once the chunk has been appended to the buffer. """
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        self.buffer += chunk
+
+        while True:
+            if not self.in_tbody:
+                match = TBODY_START.search(self.buffer)
+                if match is None:
+                    # Keep just enough of the tail to match a tag split across chunks.
+                    self.buffer = self.buffer[-8:]
+                    return self
+                self.buffer = self.buffer[match.end():]
+                self.in_tbody = True
+
+            end = TBODY_END.search(self.buffer)
+            limit = end.start() if end else len(self.buffer)
+            position = 0
+
+            for row_end in ROW_END.finditer(self.buffer, 0, limit):
+                self.parse_row(self.buffer[position:row_end.start()])
+                position = row_end.end()
+
+            if end is None:
+                self.buffer = self.buffer[position:]
+                return self
+
+            self.buffer = self.buffer[end.end():]
+            self.in_tbody = False
+
+    def parse_row(self, row):
+        """ Parses a single table row, storing its values if it holds a daily record. """
+        date = ROW_DATE.search(row)
+        if date is None:
+            return
+
+        month = MONTHS.get(date.group(1).capitalize())
+        if month is None:
+            return
+
+        cells = ROW_CELL.findall(row, date.end())
+        if len(cells) < 3:
+            return
+
+        key = f"{int(date.group(3)):04d}-{month:02d}-{int(date.group(2)):02d}"
+        day = {}
+        flags = {}
+        for field, cell in zip(FIELDS, cells):
+            day[field], flag = self.parse_value(cell)
+            if flag:
+                flags[field] = flag
+        if flags:
+            day["Flags"] = flags
+        self.weather[key] = day
+
+    @staticmethod
+    def parse_value(cell):
+        """ Returns the (value, quality flag) pair of a table cell, with None for a missing value. """
+        try:
+            return float(cell), None
+        except ValueError:
+            return parse_cell(TAG.sub(b" ", cell).decode("utf-8", errors="replace"))
+
+    def close(self):
+        """ Finishes parsing and returns the weather data found on the page. """
+        self.buffer = b""
+        return self.weather
@@ -0,0 +1,162 @@
+"""
+This module contains the FetchEngine and RateLimiter classes,
+which download batches of web pages concurrently on a thread pool
+while limiting the request rate per host and retrying failed requests with backoff.
+Requests go through a PooledHTTPClient so connections to the same host are reused.
+"""
+
+import random
+import threading
+import time
+import urllib.error
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.parse import urlsplit
+from http_client import PooledHTTPClient
+from instrumentation import Metrics
+from weather_logger import WeatherLogger
+
+class RateLimiter:
+    """ Represents a per-host rate limiter which spaces out
+    requests to the same host by a minimum interval. """
+    def __init__(self, requests_per_second=None):
+        """ Initializes an instance of the RateLimiter class.
+        A rate of None disables rate limiting. """
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        """ Blocks until the next request to the given host is allowed. """
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class FetchEngine:
+    """ Represents a concurrent page downloader which keeps a
+    configurable number of requests in flight at once. """
+    def __init__(self, max_workers=8, requests_per_second=None,
+                 max_retries=3, backoff=0.5, timeout=30, validators=None, conditional=False):
+        """ Initializes an instance of the FetchEngine class.
+        Validators is a dictionary of url: (etag, last_modified) pairs which is kept
+        up to date with every response, and which is sent with each request when conditional is set. """
+        self.max_workers = max(1, int(max_workers))
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.validators = validators if validators is not None else {}
+        self.conditional = conditional
+        self.client = PooledHTTPClient(max_idle_per_host=self.max_workers, timeout=timeout)
+        self.executor = None
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    def __enter__(self):
+        """ Starts the worker thread pool. """
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                           thread_name_prefix="fetch")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_trace):
+        """ Shuts down the worker thread pool, cancelling any queued requests. """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+        self.client.close()
+
+    def open_url(self, url, sink=None):
+        """ Downloads a single URL and returns the response body as bytes,
+        or None if a conditional request found the page unchanged.
+        If a sink callable is given, it is passed each chunk of the body as it arrives. """
+        etag, last_modified = self.validators.get(url, (None, None)) if self.conditional else (None, None)
+        start = time.perf_counter()
+        response = self.client.get(url, etag=etag, last_modified=last_modified, sink=sink)
+        Metrics.observe("fetch.request", time.perf_counter() - start, len(response.body))
+        Metrics.count("fetch.bytes", len(response.body))
+
+        if response.status == 304:
+            Metrics.count("fetch.not_modified")
+            return None
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.validators[url] = (etag, last_modified)
+        return response.body
+
+    def fetch(self, url, stream=None):
+        """ Downloads a single URL, retrying with exponential backoff
+        on network errors, server errors and throttling responses.
+        If a stream factory is given, each attempt creates a fresh consumer
+        from it and feeds it the body as it arrives. """
+        host = urlsplit(url).netloc
+        attempt = 0
+
+        while True:
+            with Metrics.timer("fetch.rate_limit_wait"):
+                self.rate_limiter.wait(host)
+            try:
+                return self.open_url(url, stream().feed if stream else None)
+            except urllib.error.HTTPError as e:
+                if e.code != 429 and e.code < 500 or attempt >= self.max_retries:
+                    raise
+                error = e
+            except (HTTPException, OSError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                error = e
+
+            delay = self.backoff * (2 ** attempt) * (1 + random.random())
+            attempt += 1
+            Metrics.count("fetch.retries")
+            self.logger.warning("Fetching %s failed (%s), retry %s in %.2fs.",
+                                url, error, attempt, delay)
+            time.sleep(delay)
+
+    def fetch_ordered(self, jobs, fetch=None):
+        """ Accepts an iterable of (key, url) pairs and yields (key, body) pairs
+        in the same order, keeping up to max_workers requests in flight.
+        The body is None for pages which a conditional request found unchanged.
+        The iterable may be endless; closing the generator cancels pending requests.
+        A fetch callable taking (key, url) may be given to replace the default download. """
+        if self.executor is None:
+            with self:
+                yield from self.fetch_ordered(jobs, fetch)
+            return
+
+        if fetch is None:
+            fetch = lambda key, url: self.fetch(url)
+
+        jobs = iter(jobs)
+        in_flight = deque()
+
+        def submit_next():
+            for key, url in jobs:
+                in_flight.append((key, self.executor.submit(fetch, key, url)))
+                return True
+            return False
+
+        try:
+            while len(in_flight) < self.max_workers and submit_next():
+                pass
+
+            while in_flight:
+                key, future = in_flight.popleft()
+                body = future.result()
+                submit_next()
+                yield key, body
+        finally:
+            for _, future in in_flight:
+                future.cancel()
@@ -0,0 +1,107 @@
+"""
+This module contains the PooledHTTPClient class,
+which reuses keep-alive HTTP connections across requests
+and supports conditional GET requests using ETag and Last-Modified validators.
+"""
+
+import http.client
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+from weather_logger import WeatherLogger
+
+Response = namedtuple("Response", ["status", "reason", "headers", "body"])
+
+class PooledHTTPClient:
+    """ Represents an HTTP client which keeps a pool of idle
+    keep-alive connections per host and hands them out to one request at a time. """
+    def __init__(self, max_idle_per_host=32, timeout=30):
+        """ Initializes an instance of the PooledHTTPClient class. """
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    def checkout(self, scheme, netloc):
+        """ Returns an idle connection to the given host, or a new one if none are idle. """
+        with self.lock:
+            connections = self.idle.get((scheme, netloc))
+            if connections:
+                return connections.pop()
+
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def checkin(self, scheme, netloc, conn):
+        """ Returns a connection to the idle pool, closing it if the pool is full. """
+        with self.lock:
+            connections = self.idle.setdefault((scheme, netloc), [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def get(self, url, etag=None, last_modified=None, sink=None, chunk_size=65536):
+        """ Sends a GET request over a pooled connection and returns a Response.
+        If validators are given the request is conditional, and an unchanged
+        page comes back as a 304 response with an empty body.
+        If a sink callable is given, successful response bodies are passed to it
+        chunk by chunk as they arrive from the socket. """
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        headers = {"Connection": "keep-alive", "Accept-Encoding": "identity"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        conn = self.checkout(parts.scheme, parts.netloc)
+        try:
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The server closed an idle keep-alive connection, so retry on a fresh one.
+                conn.close()
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+
+            if sink is None or response.status != 200:
+                body = response.read()
+            else:
+                chunks = []
+                while True:
+                    chunk = response.read1(chunk_size)
+                    if not chunk:
+                        break
+                    sink(chunk)
+                    chunks.append(chunk)
+                # read1 leaves the response open once its length is used up,
+                # so a final read marks it complete and frees the connection.
+                response.read()
+                body = b"".join(chunks)
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.checkin(parts.scheme, parts.netloc, conn)
+
+        return Response(response.status, response.reason, response.headers, body)
+
+    def close(self):
+        """ Closes every idle connection in the pool. """
+        with self.lock:
+            for connections in self.idle.values():
+                for conn in connections:
+                    conn.close()
+            self.idle.clear()
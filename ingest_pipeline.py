@@ -0,0 +1,299 @@
+"""
+This module contains the IngestPipeline class,
+which scrapes many stations in parallel and loads them into the database.
+Fetching and parsing run in pools of worker processes, joined to each other and to
+a single database writer by bounded queues, and each stage reports its own throughput.
+"""
+
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+from datetime import datetime
+from data_quality import validate_page
+from db_operations import DBOperations
+from fast_parser import DailyTableParser, page_months
+from fetch_engine import FetchEngine
+from scrape_weather import WeatherScraper
+from stations import StationRegistry
+from weather_logger import WeatherLogger
+
+class StageStats:
+    """ Represents the throughput counters of one worker in a pipeline stage.
+    Busy time is spent doing work, while wait time is spent blocked on a queue. """
+    def __init__(self, stage):
+        """ Initializes an instance of the StageStats class. """
+        self.stage = stage
+        self.items = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.wait = 0.0
+        self.started = time.perf_counter()
+
+    def as_dict(self):
+        """ Returns the counters as a dictionary which can be sent between processes. """
+        return {"stage": self.stage, "items": self.items, "bytes": self.bytes,
+                "busy": self.busy, "wait": self.wait,
+                "elapsed": time.perf_counter() - self.started}
+
+def timed_get(source, stats, timeout=None):
+    """ Takes the next item from a queue, adding the time blocked to the wait counter.
+    Raises queue.Empty if no item arrives within the timeout. """
+    start = time.perf_counter()
+    try:
+        return source.get(timeout=timeout)
+    finally:
+        stats.wait += time.perf_counter() - start
+
+def timed_put(target, item, stats):
+    """ Puts an item on a queue, adding the time blocked to the wait counter. """
+    start = time.perf_counter()
+    target.put(item)
+    stats.wait += time.perf_counter() - start
+
+def fetch_worker(station_queue, page_queue, stats_queue, base_url, concurrency):
+    """ Fetches every month page of each station taken from the station queue, newest first,
+    until the station's first year or until the site answers with the rows of another month,
+    which it does for months before the start of the record. A station which fails is logged
+    and skipped, so the worker carries on with the remaining stations. """
+    logger = WeatherLogger().get_logger()
+    stats = StageStats("fetch")
+    current_date = datetime.now().replace(day=1)
+
+    try:
+        while True:
+            station = timed_get(station_queue, stats)
+            if station is None:
+                break
+
+            try:
+                scraper = WeatherScraper(base_url=base_url, station_id=station.station_id)
+                engine = FetchEngine(max_workers=concurrency)
+                start = time.perf_counter()
+
+                with engine:
+                    for (year, month), body in engine.fetch_ordered(scraper.month_urls(current_date)):
+                        if year < station.first_year:
+                            break
+                        months = page_months(body)
+                        if months and (year, month) not in months:
+                            logger.info("Reached the start of the record of %s at %04d-%02d.",
+                                        station.location, year, month)
+                            break
+                        stats.items += 1
+                        stats.bytes += len(body)
+                        stats.busy += time.perf_counter() - start
+                        timed_put(page_queue, (station.location, body), stats)
+                        start = time.perf_counter()
+            except Exception as e:
+                logger.error("Fetching station %s (%s) failed! Error: %s",
+                             station.station_id, station.location, e)
+    finally:
+        stats_queue.put(stats.as_dict())
+
+def parse_worker(page_queue, row_queue, stats_queue):
+    """ Parses and validates pages taken from the page queue and passes their rows on to the writer,
+    signalling the writer once the page queue is closed. A page which fails to parse is logged
+    and skipped, and the writer is signalled even if the worker itself fails. """
+    logger = WeatherLogger().get_logger()
+    stats = StageStats("parse")
+
+    try:
+        while True:
+            item = timed_get(page_queue, stats)
+            if item is None:
+                break
+
+            location, body = item
+            start = time.perf_counter()
+            try:
+                rows = list(validate_page(DailyTableParser().feed(body).close()).items())
+            except Exception as e:
+                logger.error("Parsing a page of %s failed! Error: %s", location, e)
+                continue
+            finally:
+                stats.busy += time.perf_counter() - start
+            stats.items += 1
+            stats.bytes += len(body)
+            timed_put(row_queue, (location, rows), stats)
+    finally:
+        row_queue.put(None)
+        stats_queue.put(stats.as_dict())
+
+
+class IngestPipeline:
+    """ Represents a multi-station ingestion pipeline of fetch, parse and write stages.
+    The writer checks on the worker processes while it waits, and aborts the run
+    if any of them dies rather than waiting on a queue which will never be filled. """
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, stations, db_name="weather_data.sqlite", base_url=WeatherScraper.BASE_URL,
+                 fetch_workers=4, parse_workers=2, concurrency=4, queue_size=64, batch_size=20000):
+        """ Initializes an instance of the IngestPipeline class.
+        Fetch_workers processes each scrape one station at a time with concurrency requests in flight,
+        parse_workers processes parse pages, and the writer inserts rows in batches of batch_size. """
+        self.stations = list(stations)
+        self.db_ops = DBOperations(db_name)
+        self.base_url = base_url
+        self.fetch_workers = max(1, min(fetch_workers, len(self.stations)))
+        self.parse_workers = max(1, parse_workers)
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.report = {}
+        self.workers = []
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    def write(self, row_queue, stats):
+        """ Takes parsed rows off the row queue until every parser has finished,
+        inserting them into the database in batches. """
+        pending = {}
+        pending_count = 0
+        finished = 0
+
+        while finished < self.parse_workers:
+            try:
+                item = timed_get(row_queue, stats, self.POLL_INTERVAL)
+            except queue.Empty:
+                self.check_workers()
+                continue
+
+            if item is None:
+                finished += 1
+            else:
+                location, rows = item
+                pending.setdefault(location, []).extend(rows)
+                pending_count += len(rows)
+                stats.items += len(rows)
+
+            if pending_count >= self.batch_size or (finished == self.parse_workers and pending):
+                start = time.perf_counter()
+                for location, rows in pending.items():
+                    self.db_ops.save_data(rows, location)
+                stats.busy += time.perf_counter() - start
+                pending = {}
+                pending_count = 0
+
+    def check_workers(self):
+        """ Raises a RuntimeError if a worker process has exited with an error,
+        terminating the remaining workers first. """
+        failed = [process for process in self.workers if process.exitcode not in (None, 0)]
+        if not failed:
+            return
+
+        for process in self.workers:
+            if process.is_alive():
+                process.terminate()
+        for process in self.workers:
+            process.join()
+        raise RuntimeError(f"Ingest worker {failed[0].name} exited with code {failed[0].exitcode}, "
+                           "the ingest was aborted.")
+
+    def join(self, workers):
+        """ Waits for the given threads or processes to finish, checking on the workers meanwhile. """
+        for worker in workers:
+            while True:
+                worker.join(self.POLL_INTERVAL)
+                self.check_workers()
+                if not worker.is_alive():
+                    break
+
+    def run(self):
+        """ Runs the pipeline to completion and returns a report of
+        per-stage throughput, keyed by stage name. """
+        context = multiprocessing.get_context()
+        station_queue = context.Queue()
+        page_queue = context.Queue(self.queue_size)
+        row_queue = context.Queue(self.queue_size)
+        stats_queue = context.Queue()
+        self.db_ops.initialize_db()
+
+        for station in self.stations:
+            station_queue.put(station)
+        for _ in range(self.fetch_workers):
+            station_queue.put(None)
+
+        started = time.perf_counter()
+        fetchers = [context.Process(target=fetch_worker,
+                                    args=(station_queue, page_queue, stats_queue,
+                                          self.base_url, self.concurrency))
+                    for _ in range(self.fetch_workers)]
+        parsers = [context.Process(target=parse_worker, args=(page_queue, row_queue, stats_queue))
+                   for _ in range(self.parse_workers)]
+        self.workers = fetchers + parsers
+        for process in self.workers:
+            process.start()
+
+        def close_pages():
+            """ Signals the parsers once every fetcher has exited. """
+            for process in fetchers:
+                process.join()
+            for _ in range(self.parse_workers):
+                page_queue.put(None)
+
+        closer = threading.Thread(target=close_pages, daemon=True)
+        closer.start()
+
+        writer_stats = StageStats("write")
+        self.write(row_queue, writer_stats)
+        self.join([closer] + parsers)
+
+        worker_stats = [writer_stats.as_dict()]
+        for _ in fetchers + parsers:
+            try:
+                worker_stats.append(stats_queue.get(timeout=5))
+            except queue.Empty:
+                self.logger.warning("A pipeline worker exited without reporting its stats.")
+
+        self.report = self.summarize(worker_stats, time.perf_counter() - started)
+        for stage, summary in self.report.items():
+            self.logger.info("Ingest stage %s: %s", stage, summary)
+        return self.report
+
+    @staticmethod
+    def summarize(worker_stats, elapsed):
+        """ Combines the stats of every worker into a per-stage report. Utilization is the share of
+        worker time spent working; the stage with the highest utilization is the bottleneck. """
+        report = {}
+        for stats in worker_stats:
+            stage = report.setdefault(stats["stage"], {"workers": 0, "items": 0, "bytes": 0,
+                                                       "busy": 0.0, "wait": 0.0})
+            stage["workers"] += 1
+            for key in ("items", "bytes", "busy", "wait"):
+                stage[key] += stats[key]
+
+        for stage in report.values():
+            stage["items_per_sec"] = stage["items"] / elapsed if elapsed else 0.0
+            stage["utilization"] = stage["busy"] / (stage["workers"] * elapsed) if elapsed else 0.0
+        return report
+
+
+def main():
+    """ Runs the ingestion pipeline for the registered stations and prints the stage report. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--registry", help="JSON station registry; defaults to the built-in stations")
+    parser.add_argument("--station", type=int, nargs="*", default=None, help="only ingest these station IDs")
+    parser.add_argument("--db", default="weather_data.sqlite")
+    parser.add_argument("--base-url", default=WeatherScraper.BASE_URL)
+    parser.add_argument("--fetch-workers", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    registry = StationRegistry.load(args.registry) if args.registry else StationRegistry()
+    stations = [registry.get(station_id) for station_id in args.station] if args.station else list(registry)
+
+    pipeline = IngestPipeline(stations, args.db, args.base_url, args.fetch_workers,
+                              args.parse_workers, args.concurrency)
+    report = pipeline.run()
+
+    print(f"{'stage':>6} {'workers':>7} {'items':>8} {'items/sec':>10} {'utilization':>11}")
+    for name, stage in report.items():
+        print(f"{name:>6} {stage['workers']:>7} {stage['items']:>8} "
+              f"{stage['items_per_sec']:>10.1f} {stage['utilization']:>11.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+This module contains the Metrics and Profiler classes,
+which give the scraper, the database layer and the plotting code a shared set of
+counters and timers, and an opt-in cProfile and tracemalloc capture of a whole run.
+A snapshot of the metrics is written to a JSON file when the run ends if the
+WEATHER_METRICS environment variable names one, and profiling is switched on by
+setting WEATHER_PROFILE to "cpu", "memory" or "cpu,memory".
+"""
+
+import atexit
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from weather_logger import WeatherLogger
+
+class TimerStats:
+    """ Represents the statistics of one timer: how often it ran, for how long,
+    how many items it handled, and a bounded random sample of durations for percentiles. """
+    SAMPLE_SIZE = 1024
+
+    def __init__(self):
+        """ Initializes an instance of the TimerStats class. """
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.items = 0
+        self.samples = []
+
+    def add(self, seconds, items=0):
+        """ Records one duration, keeping a reservoir sample of durations. """
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.items += items
+        if len(self.samples) < self.SAMPLE_SIZE:
+            self.samples.append(seconds)
+        else:
+            index = random.randrange(self.count)
+            if index < self.SAMPLE_SIZE:
+                self.samples[index] = seconds
+
+    def as_dict(self):
+        """ Returns the statistics as a dictionary, with items per second if the timer counted items. """
+        ordered = sorted(self.samples)
+
+        def percentile(fraction):
+            return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+        stats = {"count": self.count, "total": self.total, "mean": self.total / self.count if self.count else None,
+                 "min": self.min if self.count else None, "max": self.max,
+                 "p50": percentile(0.5), "p99": percentile(0.99)}
+        if self.items:
+            stats["items"] = self.items
+            stats["items_per_sec"] = self.items / self.total if self.total else None
+        return stats
+
+
+class Timing:
+    """ Represents a running timer. Items can be set while it runs, e.g. the number of rows written. """
+    def __init__(self):
+        """ Initializes an instance of the Timing class. """
+        self.items = 0
+
+
+class Metrics:
+    """ Represents the process-wide registry of counters and timers.
+    Its methods are class methods, so instrumented code needs no instance to report to. """
+    counters = {}
+    timers = {}
+    lock = threading.Lock()
+    enabled = True
+
+    @classmethod
+    def count(cls, name, value=1):
+        """ Adds a value to a counter. """
+        if cls.enabled:
+            with cls.lock:
+                cls.counters[name] = cls.counters.get(name, 0) + value
+
+    @classmethod
+    def observe(cls, name, seconds, items=0):
+        """ Records a duration measured by the caller. """
+        if cls.enabled:
+            with cls.lock:
+                stats = cls.timers.get(name)
+                if stats is None:
+                    stats = cls.timers[name] = TimerStats()
+                stats.add(seconds, items)
+
+    @classmethod
+    @contextmanager
+    def timer(cls, name):
+        """ Times the enclosed block, e.g. with Metrics.timer("db.save_data") as timing: ...
+        Setting timing.items records how many items the block handled. """
+        timing = Timing()
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            cls.observe(name, time.perf_counter() - start, timing.items)
+
+    @classmethod
+    def snapshot(cls):
+        """ Returns the current counters and timer statistics as a dictionary. """
+        with cls.lock:
+            return {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "pid": os.getpid(),
+                "counters": dict(sorted(cls.counters.items())),
+                "timers": {name: stats.as_dict() for name, stats in sorted(cls.timers.items())},
+            }
+
+    @classmethod
+    def reset(cls):
+        """ Clears every counter and timer. """
+        with cls.lock:
+            cls.counters = {}
+            cls.timers = {}
+
+    @classmethod
+    def export(cls, path):
+        """ Writes a snapshot of the metrics to a JSON file. """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(cls.snapshot(), file, indent=2)
+
+    @classmethod
+    def export_on_exit(cls, path):
+        """ Writes a snapshot of the metrics to a JSON file when the process exits. """
+        atexit.register(cls.export, path)
+
+
+class Profiler:
+    """ Represents an opt-in capture of a CPU profile and/or memory allocations.
+    The CPU profile covers the thread which started it, and allocations cover every thread. """
+    def __init__(self, cpu=True, memory=False, output_dir="profiles", top=25):
+        """ Initializes an instance of the Profiler class.
+        Results are written to output_dir, and the top allocation sites are listed. """
+        self.cpu = cpu
+        self.memory = memory
+        self.output_dir = output_dir
+        self.top = top
+        self.profile = None
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    def start(self):
+        """ Starts capturing. """
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.cpu:
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def stop(self):
+        """ Stops capturing and writes the results: a .prof file readable by pstats or snakeviz,
+        and a text listing of the largest allocation sites. Returns the paths written. """
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        paths = []
+
+        if self.profile is not None:
+            self.profile.disable()
+            path = os.path.join(self.output_dir, f"cpu-{stamp}.prof")
+            self.profile.dump_stats(path)
+            self.profile = None
+            paths.append(path)
+
+        if self.memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                path = os.path.join(self.output_dir, f"memory-{stamp}.txt")
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(f"current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n")
+                    for stat in snapshot.statistics("lineno")[:self.top]:
+                        file.write(f"{stat}\n")
+                paths.append(path)
+
+        self.logger.info("Profile written to %s", ", ".join(paths))
+        return paths
+
+    def __enter__(self):
+        """ Starts capturing. """
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_trace):
+        """ Stops capturing and writes the results. """
+        self.stop()
+
+
+def configure_from_environment():
+    """ Applies the WEATHER_METRICS and WEATHER_PROFILE environment variables.
+    They are ignored in multiprocessing workers, such as those of the ingest pipeline
+    or the plot renderer, so the workers do not overwrite the parent's files. """
+    if multiprocessing.parent_process() is not None:
+        return
+
+    metrics_path = os.environ.get("WEATHER_METRICS")
+    if metrics_path:
+        Metrics.export_on_exit(metrics_path)
+
+    modes = {mode.strip() for mode in os.environ.get("WEATHER_PROFILE", "").split(",") if mode.strip()}
+    if modes:
+        profiler = Profiler("cpu" in modes, "memory" in modes,
+                            os.environ.get("WEATHER_PROFILE_DIR", "profiles")).start()
+        atexit.register(profiler.stop)
+
+configure_from_environment()
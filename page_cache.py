@@ -0,0 +1,131 @@
+"""
+This module contains the PageCache class,
+which stores raw month pages on disk, compressed and content-addressed,
+so that historical months only have to be downloaded once.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from datetime import date, datetime
+from weather_logger import WeatherLogger
+
+class PageCache:
+    """ Represents an on-disk cache of raw month pages keyed by station, year and month.
+    Page bodies are stored once per content hash under objects/,
+    and refs/ maps each station/year/month to a hash and the time it was fetched. """
+    def __init__(self, directory="page_cache"):
+        """ Initializes an instance of the PageCache class. """
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.refs_dir = os.path.join(directory, "refs")
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    def ref_path(self, station_id, year, month):
+        """ Returns the path of the ref file for the given month. """
+        return os.path.join(self.refs_dir, str(station_id), f"{year:04d}-{month:02d}")
+
+    def object_path(self, digest):
+        """ Returns the path of the compressed page with the given hash. """
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.html.gz")
+
+    @staticmethod
+    def write_atomic(path, data):
+        """ Writes data to a file through a temporary file so readers never see a partial write. """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def read_ref(self, station_id, year, month):
+        """ Returns the (digest, fetched_at) pair stored for a month, or None if it is not cached. """
+        try:
+            with open(self.ref_path(station_id, year, month), encoding="utf-8") as file:
+                digest, fetched_at = file.read().split()
+            return digest, datetime.fromisoformat(fetched_at)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, station_id, year, month, body):
+        """ Stores the raw body of a month page. """
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            self.write_atomic(path, gzip.compress(body, compresslevel=6))
+
+        fetched_at = datetime.now().replace(microsecond=0).isoformat()
+        self.write_atomic(self.ref_path(station_id, year, month), f"{digest} {fetched_at}".encode())
+
+    def get(self, station_id, year, month):
+        """ Returns the raw body of a cached month page, or None if it is not cached. """
+        ref = self.read_ref(station_id, year, month)
+        if ref is None:
+            return None
+
+        try:
+            with open(self.object_path(ref[0]), "rb") as file:
+                return gzip.decompress(file.read())
+        except (OSError, EOFError, gzip.BadGzipFile) as e:
+            self.logger.warning("Cached page %s-%s for station %s is unreadable: %s",
+                                year, month, station_id, e)
+            return None
+
+    def is_fresh(self, station_id, year, month, today=None):
+        """ Returns True if the cached copy of a month can be used without refetching.
+        A month is immutable once it has closed, so a copy fetched after the month ended is always fresh,
+        while the current month and copies fetched before the month ended are always refetched. """
+        ref = self.read_ref(station_id, year, month)
+        if ref is None:
+            return False
+
+        today = today or date.today()
+        next_month = date(year + month // 12, month % 12 + 1, 1)
+        return next_month <= today and next_month <= ref[1].date()
+
+    def get_fresh(self, station_id, year, month):
+        """ Returns the raw body of a month page if a fresh copy is cached, otherwise None. """
+        if not self.is_fresh(station_id, year, month):
+            return None
+        return self.get(station_id, year, month)
+
+    def months(self, station_id):
+        """ Returns a sorted list of (year, month) pairs cached for the given station. """
+        try:
+            names = os.listdir(os.path.join(self.refs_dir, str(station_id)))
+        except FileNotFoundError:
+            return []
+
+        months = []
+        for name in names:
+            try:
+                year, month = name.split("-")
+                months.append((int(year), int(month)))
+            except ValueError:
+                continue
+        return sorted(months)
+
+    def prune(self):
+        """ Evicts page bodies which are no longer referenced by any month,
+        such as earlier copies of the current month. Returns the number of files removed. """
+        referenced = set()
+        for root, _, names in os.walk(self.refs_dir):
+            for name in names:
+                try:
+                    with open(os.path.join(root, name), encoding="utf-8") as file:
+                        referenced.add(file.read().split()[0])
+                except (OSError, IndexError):
+                    continue
+
+        removed = 0
+        for root, _, names in os.walk(self.objects_dir):
+            for name in names:
+                if name.split(".")[0] not in referenced:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+
+        self.logger.info("Pruned %s unreferenced pages from the page cache.", removed)
+        return removed
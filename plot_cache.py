@@ -0,0 +1,265 @@
+"""
+This module contains the PlotCache and CachedPlotOperations classes,
+which keep rendered plot images and the aggregated series behind them on disk.
+Entries are keyed by the database file, the plot parameters and the data version of the months plotted,
+so writing new rows for those months, or replacing the database, makes the old entries unreachable,
+and the least recently used entries are evicted once the cache grows past its size limit.
+The aggregated series are stored as JSON and NumPy .npz files, never as pickles.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from db_operations import DBOperations
+from instrumentation import Metrics
+from page_cache import PageCache
+from weather_logger import WeatherLogger
+
+def database_identity(db_name):
+    """ Returns the absolute path of a database file and its creation stamp, which changes when the file
+    is replaced. The birth time is used where the platform records one, and the inode number elsewhere. """
+    try:
+        stat = os.stat(db_name)
+    except OSError:
+        return os.path.abspath(db_name), None
+    return os.path.abspath(db_name), getattr(stat, "st_birthtime", None) or stat.st_ino
+
+def dump_stats(stats):
+    """ Encodes monthly box plot statistics as JSON. """
+    return json.dumps([{**month, "fliers": [float(value) for value in month["fliers"]]} for month in stats],
+                      default=float).encode()
+
+def load_stats(data):
+    """ Decodes monthly box plot statistics encoded by dump_stats. """
+    import numpy as np
+
+    return [{**month, "fliers": np.array(month["fliers"])} for month in json.loads(data)]
+
+def dump_series(series):
+    """ Encodes a (days, temperatures) series as a NumPy .npz archive. """
+    import numpy as np
+
+    buffer = io.BytesIO()
+    days, temperatures = series
+    np.savez(buffer, days=days, temperatures=temperatures)
+    return buffer.getvalue()
+
+def load_series(data):
+    """ Decodes a (days, temperatures) series encoded by dump_series. """
+    import numpy as np
+
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        return arrays["days"], arrays["temperatures"]
+
+
+class PlotCache:
+    """ Represents a size-bounded, least recently used on-disk cache of plot files.
+    Recency is kept in file modification times, so it survives restarts. The index is brought up to
+    date with the directory before every eviction, so the size limit holds for every process sharing it. """
+    def __init__(self, directory="plot_cache", max_bytes=256 * 1024 * 1024):
+        """ Initializes an instance of the PlotCache class and indexes the files already cached. """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.folders = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+        with self.lock:
+            self.scan()
+
+    def scan(self):
+        """ Brings the index of {subdirectory: (mtime, {name: (mtime, size)})} up to date with the directory,
+        picking up entries written and evicted by other processes. Only the subdirectories modified
+        since the last scan are listed again. The caller must hold the lock. """
+        try:
+            subdirectories = [entry for entry in os.scandir(self.directory) if entry.is_dir()]
+        except OSError:
+            subdirectories = []
+
+        folders = {}
+        for subdirectory in subdirectories:
+            modified = subdirectory.stat().st_mtime_ns
+            known = self.folders.get(subdirectory.path)
+            if known is not None and known[0] == modified:
+                folders[subdirectory.path] = known
+                continue
+
+            files = {}
+            for entry in os.scandir(subdirectory.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files[entry.name] = (stat.st_mtime, stat.st_size)
+            folders[subdirectory.path] = (modified, files)
+
+        self.folders = folders
+        self.total_bytes = sum(size for _, files in folders.values() for _, size in files.values())
+
+    @staticmethod
+    def key(*parts, suffix=""):
+        """ Returns the file name of the entry for the given key parts, e.g. "3fa9...c1.png". """
+        digest = hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+        return f"{digest}{suffix}"
+
+    def path(self, name):
+        """ Returns the path of a cached entry. """
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, name):
+        """ Returns the contents of a cached entry and marks it as recently used, or None if it is not cached. """
+        try:
+            with open(self.path(name), "rb") as file:
+                data = file.read()
+            os.utime(self.path(name))
+        except OSError:
+            return None
+
+        with self.lock:
+            folder = self.folders.get(os.path.dirname(self.path(name)))
+            if folder is not None and name in folder[1]:
+                folder[1][name] = (time.time(), folder[1][name][1])
+        return data
+
+    def put(self, name, data):
+        """ Stores an entry, evicting the least recently used entries if the cache is over its size limit. """
+        PageCache.write_atomic(self.path(name), data)
+        with self.lock:
+            self.scan()
+            self.evict(keep=name)
+
+    def evict(self, keep=None):
+        """ Removes the least recently used entries, other than keep, until the cache fits its size limit.
+        The caller must hold the lock. """
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        entries = sorted((mtime, name, size, files) for _, files in self.folders.values()
+                         for name, (mtime, size) in files.items() if name != keep)
+        for _, name, size, files in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+            del files[name]
+            self.total_bytes -= size
+            self.logger.debug("Evicted %s from the plot cache.", name)
+
+
+class CachedPlotOperations:
+    """ Represents a cache in front of PlotOperations which serves rendered box plots and line plots
+    and their aggregated series, re-aggregating and re-rendering only when the plotted months have changed. """
+    def __init__(self, db_ops=None, cache=None):
+        """ Initializes an instance of the CachedPlotOperations class. """
+        self.db_ops = db_ops or DBOperations()
+        self.cache = cache or PlotCache()
+
+    def entry_name(self, kind, location, first, second, version, suffix):
+        """ Returns the cache file name of an entry, or None if its data version is unknown
+        and the entry must not be cached. """
+        if version is None:
+            return None
+        return self.cache.key(database_identity(self.db_ops.db_name), kind, location, first, second, version,
+                              suffix=suffix)
+
+    def cached(self, name, compute, dump, load):
+        """ Returns the entry with the given name, decoded by load,
+        computing it and storing it as encoded by dump on a miss. """
+        data = self.cache.get(name) if name else None
+        if data is not None:
+            Metrics.count("plot_cache.hits")
+            return load(data)
+        Metrics.count("plot_cache.misses")
+
+        value = compute()
+        if name:
+            self.cache.put(name, dump(value))
+        return value
+
+    def render(self, name, draw, fmt):
+        """ Returns the image bytes of the entry with the given name, drawing and storing it on a miss.
+        Draw accepts a Figure and returns it, or None if there is nothing to plot. """
+        image = self.cache.get(name) if name else None
+        if image is not None:
+            Metrics.count("plot_cache.hits")
+            return image
+        Metrics.count("plot_cache.misses")
+
+        from matplotlib.figure import Figure
+
+        figure = draw(Figure())
+        if figure is None:
+            return None
+
+        buffer = io.BytesIO()
+        with Metrics.timer("plot.render"):
+            figure.savefig(buffer, format=fmt)
+        image = buffer.getvalue()
+        if name:
+            self.cache.put(name, image)
+        return image
+
+    def boxplot_stats(self, start_year, end_year, location="Winnipeg, MB"):
+        """ Returns the monthly box plot statistics of a span of years. """
+        from aggregation import rollup_boxplot_stats
+
+        def compute():
+            return rollup_boxplot_stats(self.db_ops.fetch_monthly_rollups(start_year, end_year, location))
+
+        with self.db_ops.snapshot():
+            version = self.db_ops.fetch_data_version(location, (start_year, 1), (end_year, 12))
+            return self.cached(self.entry_name("box-stats", location, start_year, end_year, version, ".json"),
+                               compute, dump_stats, load_stats)
+
+    def lineplot_series(self, year, month, location="Winnipeg, MB"):
+        """ Returns the (days, mean temperatures) series of a month. """
+        def compute():
+            store = self.db_ops.fetch_month(year, month, location, columnar=True)
+            return store.days(), store.mean
+
+        with self.db_ops.snapshot():
+            version = self.db_ops.fetch_data_version(location, (year, month), (year, month))
+            return self.cached(self.entry_name("line-series", location, year, month, version, ".npz"),
+                               compute, dump_series, load_series)
+
+    def boxplot_image(self, start_year, end_year, location="Winnipeg, MB", fmt="png"):
+        """ Returns a rendered box plot of a span of years as PNG or SVG bytes,
+        or None if there is no data in the span. """
+        from plot_operations import PlotOperations
+
+        def draw(figure):
+            stats = self.boxplot_stats(start_year, end_year, location)
+            if not any(month['count'] for month in stats):
+                return None
+            return PlotOperations.draw_boxplot(figure, stats, start_year, end_year)
+
+        version = self.db_ops.fetch_data_version(location, (start_year, 1), (end_year, 12))
+        return self.render(self.entry_name("box", location, start_year, end_year, version, f".{fmt}"),
+                           draw, fmt)
+
+    def lineplot_image(self, year, month, location="Winnipeg, MB", fmt="png"):
+        """ Returns a rendered line plot of a month as PNG or SVG bytes, or None if the month has no data. """
+        from plot_operations import PlotOperations
+
+        def draw(figure):
+            days, temperatures = self.lineplot_series(year, month, location)
+            if len(days) == 0:
+                return None
+            figure.set_size_inches(12, 6)
+            return PlotOperations.draw_lineplot(figure, days, temperatures, year, month)
+
+        if not self.db_ops.covered_months(location, (year, month), (year, month)):
+            return None
+        version = self.db_ops.fetch_data_version(location, (year, month), (year, month))
+        return self.render(self.entry_name("line", location, year, month, version, f".{fmt}"),
+                           draw, fmt)
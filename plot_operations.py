@@ -2,47 +2,76 @@
 This module contains the PlotOperations class,
 which contains functions for generating boxplots
 and lineplots based on user-supplied weather data.
+Data is summarized by the aggregation module before it reaches the plotting functions.
+matplotlib is imported when the first plot is drawn, as it is slow to import.
+Each chart is drawn onto a Figure, so the same drawing code serves interactive
+pyplot windows and headless rendering to files.
 """
 
-import matplotlib.pyplot as plt
+import aggregation
+from instrumentation import Metrics
+from weather_store import WeatherStore
 
 class PlotOperations:
     """ This class contains functions for generating boxplot and lineplot graphs for weather data supplied by the user. """
+    @staticmethod
+    def as_store(weather_data):
+        """ Returns the weather data as a WeatherStore, converting dictionaries of daily values. """
+        if isinstance(weather_data, WeatherStore):
+            return weather_data
+        return WeatherStore.from_dict(weather_data)
+
     def create_boxplot(self, weather_data, start_year, end_year):
         """Creates a box plot of the supplied weather data within the supplied date range."""
-        monthly_temperatures = [[] for _ in range(12)]
-
-        for date, data in weather_data.items():
-            year = int(date.split('-')[0])
-            month = int(date.split('-')[1])
-
-            if start_year <= year <= end_year:
-                monthly_temperatures[month - 1].append(data['Mean'])
-
-        plt.boxplot(monthly_temperatures)
-        plt.xlabel('Months')
-        plt.ylabel('Temperature')
-        plt.title(f'Boxplot of Mean Temperatures for {start_year} to {end_year}')
-        plt.xticks(ticks=range(1, 13), labels=[
-            'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'
-        ])
+        with Metrics.timer("plot.aggregate"):
+            stats = aggregation.monthly_boxplot_stats(self.as_store(weather_data), start_year, end_year)
+        self.plot_boxplot_summary(stats, start_year, end_year)
+
+    def plot_boxplot_summary(self, stats, start_year, end_year):
+        """Shows a box plot of precomputed monthly box plot statistics in a pyplot window."""
+        import matplotlib.pyplot as plt
+
+        with Metrics.timer("plot.draw"):
+            self.draw_boxplot(plt.figure(), stats, start_year, end_year)
         plt.show()
 
+    @staticmethod
+    def draw_boxplot(figure, stats, start_year, end_year):
+        """Draws a box plot of monthly box plot statistics onto a figure, skipping empty months."""
+        Metrics.count("plot.boxplots")
+        stats = [month for month in stats if month['count']]
+        axes = figure.add_subplot()
+        axes.bxp(stats, positions=[aggregation.MONTH_LABELS.index(month['label']) + 1 for month in stats])
+        axes.set_xlabel('Months')
+        axes.set_ylabel('Temperature')
+        axes.set_title(f'Boxplot of Mean Temperatures for {start_year} to {end_year}')
+        axes.set_xticks(range(1, 13), labels=aggregation.MONTH_LABELS)
+        return figure
 
     def create_lineplot(self, weather_data, year, month):
         """Creates a line plot of the supplied weather data from a supplied year and month."""
-        temperatures = []
-        for date, data in weather_data.items():
-            if date.startswith(f'{year:04d}-{month:02d}'):
-                temperatures.append(data['Mean'])
-
-        days = list(range(1, len(temperatures) + 1))
-        plt.figure(figsize=(12, 6))
-        plt.plot(days, temperatures, marker='o')
-        plt.xlabel('Day of the Month')
-        plt.ylabel('Avg Daily Temp')
-        plt.title('Daily Avg Temperatures')
-        plt.xticks(days, [f'{year:04d}-{month:02d}-{day:02d}' for day in range(1, len(temperatures) + 1)], rotation=45)
-        plt.tight_layout()
-        plt.grid(True)
+        with Metrics.timer("plot.aggregate"):
+            days, temperatures = aggregation.daily_series(self.as_store(weather_data), year, month)
+        self.plot_lineplot_series(days, temperatures, year, month)
+
+    def plot_lineplot_series(self, days, temperatures, year, month):
+        """Shows a line plot of a precomputed series of daily temperatures in a pyplot window."""
+        import matplotlib.pyplot as plt
+
+        with Metrics.timer("plot.draw"):
+            self.draw_lineplot(plt.figure(figsize=(12, 6)), days, temperatures, year, month)
         plt.show()
+
+    @staticmethod
+    def draw_lineplot(figure, days, temperatures, year, month):
+        """Draws a line plot of a series of daily temperatures onto a figure."""
+        Metrics.count("plot.lineplots")
+        axes = figure.add_subplot()
+        axes.plot(days, temperatures, marker='o')
+        axes.set_xlabel('Day of the Month')
+        axes.set_ylabel('Avg Daily Temp')
+        axes.set_title('Daily Avg Temperatures')
+        axes.set_xticks(days, [f'{year:04d}-{month:02d}-{day:02d}' for day in days], rotation=45)
+        axes.grid(True)
+        figure.tight_layout()
+        return figure
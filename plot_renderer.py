@@ -0,0 +1,215 @@
+"""
+This module contains the PlotRenderer class,
+which renders batches of box plots and line plots to PNG or SVG files without a display.
+A batch is described by a spec such as "line plots for every month of 1990-2020",
+which is expanded into jobs and rendered across a pool of worker processes.
+Charts are drawn with matplotlib's object-oriented Figure API on the Agg backend,
+so no pyplot state is shared between charts.
+With a plot cache directory, charts whose data has not changed are copied from the cache.
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from db_operations import DBOperations
+from instrumentation import Metrics
+from plot_cache import CachedPlotOperations, PlotCache
+from weather_logger import WeatherLogger
+
+FORMATS = ("png", "svg")
+
+PlotJob = namedtuple("PlotJob", ["kind", "location", "year", "month", "end_year", "path"])
+
+def location_slug(location):
+    """ Returns a file system friendly name for a location, e.g. "winnipeg-mb". """
+    return re.sub(r"[^a-z0-9]+", "-", location.lower()).strip("-")
+
+def expand_spec(spec, output_dir="plots"):
+    """ Expands a batch spec into a list of PlotJobs. A spec is a dictionary, or a list of them, with:
+    kind ("line" or "box"), location, years as [first, last], format ("png" or "svg"),
+    months for line plots (defaults to every month), and span for box plots:
+    the number of years in each chart, defaulting to the whole range. """
+    if isinstance(spec, list):
+        return [job for item in spec for job in expand_spec(item, output_dir)]
+
+    kind = spec.get("kind", "line")
+    location = spec.get("location", "Winnipeg, MB")
+    first_year, last_year = spec["years"]
+    fmt = spec.get("format", "png")
+    if kind not in ("line", "box"):
+        raise ValueError(f"Unknown plot kind: {kind}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    directory = os.path.join(output_dir, location_slug(location))
+    jobs = []
+    if kind == "line":
+        for year in range(first_year, last_year + 1):
+            for month in spec.get("months", range(1, 13)):
+                path = os.path.join(directory, f"line_{year:04d}-{month:02d}.{fmt}")
+                jobs.append(PlotJob(kind, location, year, month, None, path))
+    else:
+        span = spec.get("span", last_year - first_year + 1)
+        for start_year in range(first_year, last_year + 1, span):
+            end_year = min(start_year + span - 1, last_year)
+            path = os.path.join(directory, f"box_{start_year:04d}-{end_year:04d}.{fmt}")
+            jobs.append(PlotJob(kind, location, start_year, None, end_year, path))
+    return jobs
+
+worker_db = None
+worker_plots = None
+
+def init_worker(db_name, cache_dir=None):
+    """ Prepares a pool worker process: selects the Agg backend, opens its own database connections
+    and, if a cache directory is given, its own view of the plot cache.
+    It is only run in pool children, since it changes the process-wide matplotlib backend. """
+    global worker_db, worker_plots
+    import matplotlib
+    matplotlib.use("Agg")
+
+    worker_db = DBOperations(db_name)
+    worker_plots = CachedPlotOperations(worker_db, PlotCache(cache_dir)) if cache_dir else None
+
+def render_cached(job, plots):
+    """ Writes one PlotJob from the plot cache, rendering it on a miss,
+    and returns the path, or None if there was no data to plot. """
+    fmt = os.path.splitext(job.path)[1][1:]
+    if job.kind == "line":
+        image = plots.lineplot_image(job.year, job.month, job.location, fmt)
+    else:
+        image = plots.boxplot_image(job.year, job.end_year, job.location, fmt)
+    if image is None:
+        return None
+
+    os.makedirs(os.path.dirname(job.path) or ".", exist_ok=True)
+    with open(job.path, "wb") as file:
+        file.write(image)
+    return job.path
+
+def render_job(job, db_ops=None, plots=None):
+    """ Renders one PlotJob to its file and returns the path, or None if there was no data to plot.
+    Without a db_ops, the connections and plot cache of the pool worker are used. """
+    from matplotlib.figure import Figure
+    from plot_operations import PlotOperations
+
+    if db_ops is None:
+        db_ops, plots = worker_db, worker_plots
+    if plots is not None:
+        return render_cached(job, plots)
+    if job.kind == "line":
+        store = db_ops.fetch_month(job.year, job.month, job.location, columnar=True)
+        if len(store) == 0:
+            return None
+        figure = PlotOperations.draw_lineplot(Figure(figsize=(12, 6)), store.days(), store.mean,
+                                              job.year, job.month)
+    else:
+        from aggregation import rollup_boxplot_stats
+
+        rollups = db_ops.fetch_monthly_rollups(job.year, job.end_year, job.location)
+        if not rollups:
+            return None
+        figure = PlotOperations.draw_boxplot(Figure(), rollup_boxplot_stats(rollups),
+                                             job.year, job.end_year)
+
+    os.makedirs(os.path.dirname(job.path) or ".", exist_ok=True)
+    with Metrics.timer("plot.render"):
+        figure.savefig(job.path)
+    return job.path
+
+
+class PlotRenderer:
+    """ Represents a headless renderer which draws batches of plots to files in parallel. """
+    def __init__(self, db_name="weather_data.sqlite", output_dir="plots", processes=None, cache_dir=None):
+        """ Initializes an instance of the PlotRenderer class.
+        Processes is the number of worker processes, defaulting to the number of CPUs,
+        and cache_dir is an optional plot cache shared by the workers. """
+        self.db_name = db_name
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.processes = processes or os.cpu_count() or 1
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    def render(self, spec):
+        """ Renders every plot described by a spec and returns a dictionary
+        with the rendered file paths, the number of jobs skipped for lack of data, and the elapsed time. """
+        db_ops = DBOperations(self.db_name)
+        db_ops.initialize_db()
+        expanded = expand_spec(spec, self.output_dir)
+        jobs = self.covered_jobs(expanded, db_ops)
+        start = time.perf_counter()
+
+        if self.processes == 1:
+            # Figures drawn in-process need no backend, so the caller's pyplot backend is left alone.
+            plots = CachedPlotOperations(db_ops, PlotCache(self.cache_dir)) if self.cache_dir else None
+            results = [render_job(job, db_ops, plots) for job in jobs]
+        else:
+            chunksize = max(1, len(jobs) // (self.processes * 8))
+            with ProcessPoolExecutor(self.processes, initializer=init_worker,
+                                     initargs=(self.db_name, self.cache_dir)) as executor:
+                results = list(executor.map(render_job, jobs, chunksize=chunksize))
+
+        rendered = [path for path in results if path]
+        elapsed = time.perf_counter() - start
+        self.logger.info("Rendered %s plots in %.1f seconds (%s skipped).",
+                         len(rendered), elapsed, len(expanded) - len(rendered))
+        return {"rendered": rendered, "skipped": len(expanded) - len(rendered), "elapsed": elapsed}
+
+    @staticmethod
+    def covered_jobs(jobs, db_ops):
+        """ Returns the jobs whose month or span of years holds data according to the coverage index,
+        so empty months are skipped without being handed to a worker. """
+        covered = {}
+        for location in {job.location for job in jobs}:
+            years = [year for job in jobs if job.location == location
+                     for year in (job.year, job.end_year or job.year)]
+            covered[location] = set(db_ops.covered_months(location, (min(years), 1), (max(years), 12)))
+
+        def has_data(job):
+            months = covered[job.location]
+            if job.kind == "line":
+                return (job.year, job.month) in months
+            return any(job.year <= year <= job.end_year for year, _ in months)
+
+        return [job for job in jobs if has_data(job)]
+
+
+def main():
+    """ Renders a batch of plots from a JSON spec file or from command line options. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--spec", help="JSON file holding a spec or a list of specs")
+    parser.add_argument("--kind", choices=("line", "box"), default="line")
+    parser.add_argument("--location", default="Winnipeg, MB")
+    parser.add_argument("--years", type=int, nargs=2, metavar=("FIRST", "LAST"))
+    parser.add_argument("--months", type=int, nargs="*")
+    parser.add_argument("--span", type=int, help="years per box plot")
+    parser.add_argument("--format", choices=FORMATS, default="png")
+    parser.add_argument("--db", default="weather_data.sqlite")
+    parser.add_argument("--out", default="plots")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--cache-dir", help="plot cache directory to reuse unchanged charts from")
+    args = parser.parse_args()
+
+    if args.spec:
+        with open(args.spec, encoding="utf-8") as file:
+            spec = json.load(file)
+    elif args.years:
+        spec = {"kind": args.kind, "location": args.location, "years": args.years, "format": args.format}
+        if args.months:
+            spec["months"] = args.months
+        if args.span:
+            spec["span"] = args.span
+    else:
+        parser.error("either --spec or --years is required")
+
+    result = PlotRenderer(args.db, args.out, args.processes, args.cache_dir).render(spec)
+    print(f"rendered {len(result['rendered'])} plots in {result['elapsed']:.1f} s "
+          f"({len(result['rendered']) / result['elapsed']:.1f} plots/sec), skipped {result['skipped']}")
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,34 @@ WeatherScraper contains functions for scraping weather data for the city of Winn
 """
 
 from html.parser import HTMLParser
-import urllib.request
-from datetime import datetime
+from datetime import datetime, timedelta
+from data_quality import FIELDS, parse_cell, validate_page
+from fast_parser import DailyTableParser
+from fetch_engine import FetchEngine
+from instrumentation import Metrics
 from weather_logger import WeatherLogger
 
 class WeatherScraper(HTMLParser):
     """ Represents a specialized HTMLParser used for scraping
     weather information from the city of Winnipeg. """
-    def __init__(self):
-        """ Initializes an instance of the WeatherScraper class. """
+    BASE_URL = "http://climate.weather.gc.ca/climate_data/daily_data_e.html"
+    STATION_ID = 27174
+
+    def __init__(self, base_url=BASE_URL, concurrency=8, requests_per_second=None,
+                 cache=None, parser="fast", station_id=STATION_ID, logger=None):
+        """ Initializes an instance of the WeatherScraper class.
+        Concurrency is the number of month pages kept in flight at once,
+        and requests_per_second limits the request rate to the weather site.
+        If a PageCache is given, raw pages are stored in it and fresh cached months are not refetched.
+        Parser selects the streaming DailyTableParser ("fast") or this HTMLParser ("html").
+        Station_id is the climate.weather.gc.ca station to scrape. """
         super().__init__()
+        self.base_url = base_url
+        self.station_id = station_id
+        self.cache = cache
+        self.parser = parser
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
         self.is_tbody = False
         self.is_tr = False
         self.is_th = False
@@ -23,13 +41,17 @@ class WeatherScraper(HTMLParser):
         self.max = None
         self.min = None
         self.mean = None
+        self.flags = {}
+        self.cell = []
         self.nums_checked = False
         self.index = 0
         self.complete = False
         self.weather = {}
+        self.validators = {}
 
-        logger = WeatherLogger()
-        self.logger = logger.get_logger()
+        if logger is None:
+            logger = WeatherLogger().get_logger()
+        self.logger = logger
 
     def handle_starttag(self, tag, attrs):
         """ Checks if the current tag is one we need to scrape data from,
@@ -55,6 +77,7 @@ class WeatherScraper(HTMLParser):
         if tag == "td" and self.is_tr:
             try:
                 self.is_td = True
+                self.cell = []
             except Exception as e:
                 self.logger.error("Error entering td tag: %s", e)
 
@@ -74,34 +97,37 @@ class WeatherScraper(HTMLParser):
                         return
 
     def handle_data(self, data):
-        """ Parses the current tag and places
-        the data in the relevant variable. """
+        """ Collects the text of the current table cell,
+        which may be split around tags such as a legend flag. """
         if self.is_td:
-            if self.index == 1 or self.index == 2 or self.index == 3:
-                value = str(data.strip().split()).lstrip("['").rstrip("']")
-                try:
-                    value = float(value)
-                except ValueError:
-                    value = 0.0
+            self.cell.append(data)
 
-                if self.index == 1:
-                    try:
-                        self.max = value
-                    except Exception as e:
-                        self.logger.error("Error setting max value: %s", e)
-                elif self.index == 2:
-                    try:
-                        self.min = value
-                    except Exception as e:
-                        self.logger.error("Error setting min value: %s", e)
-                else:
-                    try:
-                        self.mean = value
-                        self.nums_checked = True
-                    except Exception as e:
-                        self.logger.error("Error setting mean value: %s", e)
+    def handle_cell(self):
+        """ Parses the text of a finished table cell and places
+        the value and its quality flag in the relevant variables. """
+        if self.index == 0 or self.index == 1 or self.index == 2:
+            value, flag = parse_cell(" ".join(self.cell))
+            if flag:
+                self.flags[FIELDS[self.index]] = flag
 
-            self.index += 1
+            if self.index == 0:
+                try:
+                    self.max = value
+                except Exception as e:
+                    self.logger.error("Error setting max value: %s", e)
+            elif self.index == 1:
+                try:
+                    self.min = value
+                except Exception as e:
+                    self.logger.error("Error setting min value: %s", e)
+            else:
+                try:
+                    self.mean = value
+                    self.nums_checked = True
+                except Exception as e:
+                    self.logger.error("Error setting mean value: %s", e)
+
+        self.index += 1
 
     def handle_endtag(self, tag):
         """ Resets detection variables and appends
@@ -121,6 +147,7 @@ class WeatherScraper(HTMLParser):
         if tag == "td":
             try:
                 self.is_td = False
+                self.handle_cell()
             except Exception as e:
                 self.logger.error("Error exiting td tag: %s", e)
 
@@ -131,10 +158,13 @@ class WeatherScraper(HTMLParser):
                         "Min": self.min,
                         "Mean": self.mean
                     }
+                    if self.flags:
+                        self.weather[self.date]["Flags"] = self.flags
                     # self.logger.info(f"{self.date}: {self.weather[self.date]}")
                     self.max = None
                     self.min = None
                     self.mean = None
+                    self.flags = {}
                     self.nums_checked = False
                 except Exception as e:
                     self.logger.error("Error saving weather data: %s", e)
@@ -145,56 +175,191 @@ class WeatherScraper(HTMLParser):
             except Exception as e:
                 self.logger.error("Error exiting tbody tag: %s", e)
 
-    def scrape_weather_data(self):
-        """ Scrapes data from the
-        weather information website. """
+    def month_url(self, year, month):
+        """ Returns the URL of the daily data page for the given month. """
+        return (f"{self.base_url}?StationID={self.station_id}&timeframe=2&StartYear=1840"
+                f"&EndYear={year}&Day=1&Year={year}&Month={month}#")
+
+    def month_urls(self, current_date):
+        """ Yields ((year, month), url) pairs, looping back
+        one month at a time from the given date. """
+        year, month = current_date.year, current_date.month
+        while True:
+            yield (year, month), self.month_url(year, month)
+            if month == 1:
+                year, month = year - 1, 12
+            else:
+                month -= 1
+
+    def parse_page(self, html):
+        """ Parses a single month page with its own parser instance
+        and returns the weather data found on it, checked by the data quality stage. """
+        with Metrics.timer("scrape.parse"):
+            if self.parser == "fast":
+                return validate_page(DailyTableParser().feed(html).close())
+
+            if isinstance(html, bytes):
+                html = html.decode("utf-8", errors="replace")
+
+            parser = WeatherScraper(logger=self.logger)
+            parser.feed(html)
+            parser.close()
+            return validate_page(parser.weather)
+
+    def fetch_month(self, engine, key, url):
+        """ Returns the parsed weather data for a month, reading the page from the
+        page cache when a fresh copy exists and storing downloaded pages in it.
+        With the fast parser, downloaded pages are parsed as their bytes arrive.
+        Returns None if a conditional request found the month unchanged. """
+        year, month = key
+        if self.cache is not None:
+            body = self.cache.get_fresh(self.station_id, year, month)
+            if body is not None:
+                Metrics.count("scrape.cache_hits")
+                return self.parse_page(body)
+
+        parsers = []
+
+        def new_parser():
+            parsers.append(DailyTableParser())
+            return parsers[-1]
+
+        with Metrics.timer("scrape.fetch") as timing:
+            body = engine.fetch(url, stream=new_parser if self.parser == "fast" else None)
+            timing.items = len(body or b"")
+        Metrics.count("scrape.pages")
+        if body is None:
+            return None
+        if self.cache is not None:
+            self.cache.put(self.station_id, year, month, body)
+
+        if parsers:
+            # The page was parsed while it streamed in, so its parse time is part of the fetch.
+            Metrics.observe("scrape.parse", parsers[-1].parse_time)
+            return validate_page(parsers[-1].close())
+        return self.parse_page(body)
+
+    def replay_weather_data(self):
+        """ Rebuilds the weather data from every month in the
+        page cache without touching the network. """
+        if self.cache is None:
+            raise ValueError("Replaying weather data requires a page cache.")
+
+        for year, month in self.cache.months(self.station_id):
+            body = self.cache.get(self.station_id, year, month)
+            if body is not None:
+                self.weather.update(self.parse_page(body))
+
+        self.logger.info("Replayed %s days from the page cache.", len(self.weather))
+        return self.weather
+
+    def iter_month_pages(self, start_date, concurrency=None):
+        """ Yields ((year, month), weather) pairs for each month, looping back from the given date.
+        Unlike iter_weather_data, errors are raised rather than ending the scrape early. """
+        engine = FetchEngine(max_workers=concurrency or self.concurrency,
+                             requests_per_second=self.requests_per_second,
+                             validators=self.validators)
+
+        with engine:
+            yield from engine.fetch_ordered(self.month_urls(start_date),
+                                            lambda key, url: self.fetch_month(engine, key, url))
+
+    def iter_weather_data(self, concurrency=None, conditional=False):
+        """ Scrapes data from the weather information website,
+        yielding (date, values) pairs as each month comes in
+        without keeping the whole dataset in memory.
+        When conditional is set, months are requested with the stored validators
+        and scraping stops at the first month which has not changed. """
         current_date = datetime.now()
         current_date = current_date.replace(day=1)
+        engine = FetchEngine(max_workers=concurrency or self.concurrency,
+                             requests_per_second=self.requests_per_second,
+                             validators=self.validators, conditional=conditional)
 
         try:
-            while True:
-                """ Loops back from the current date,
-                querying the weather data website until dataset is complete. """
-                url = f"http://climate.weather.gc.ca/climate_data/daily_data_e.html?StationID=27174&timeframe=2&StartYear=1840&EndYear={current_date.year}&Day={current_date.day}&Year={current_date.year}&Month={current_date.month}#"
-
-                with urllib.request.urlopen(url) as response:
-                    html = str(response.read())
-
-                # Perform operations with html content
-                self.feed(html)
-
-                if current_date.month == 1:
-                    current_date = current_date.replace(year=current_date.year - 1, month=12)
-                else:
-                    current_date = current_date.replace(month=current_date.month - 1)
-
-                if self.complete:
-                    break
-
-                self.logger.info("Finished scraping: %s", current_date.strftime('%B - %Y'))
+            with engine:
+                months = engine.fetch_ordered(self.month_urls(current_date),
+                                              lambda key, url: self.fetch_month(engine, key, url))
+                for (year, month), page in months:
+                    # Loops back from the current date, merging pages in order
+                    # until a page repeats dates that were already scraped.
+                    if page is None:
+                        self.complete = True
+                        self.logger.info("Scraping stopped at unchanged month: %s",
+                                         datetime(year, month, 1).strftime('%B - %Y'))
+                        break
+
+                    if any(date in self.date_log for date in page):
+                        self.complete = True
+                        page = {date: data for date, data in page.items() if date not in self.date_log}
+                    self.date_log.update(page)
+                    yield from page.items()
+
+                    if self.complete:
+                        self.logger.info("Scraping website completed successfully.")
+                        break
+
+                    self.logger.info("Finished scraping: %s",
+                                     datetime(year, month, 1).strftime('%B - %Y'))
         except Exception as e:
             self.logger.error("Error scraping weather data: %s", e)
 
+    def scrape_weather_data(self, concurrency=None, conditional=False):
+        """ Scrapes data from the
+        weather information website. """
+        self.weather.update(self.iter_weather_data(concurrency, conditional))
         return self.weather
 
-    def get_new_weather_data(self, outdated_weather_data):
-        """ Accepts a list of weather data and
-        returns a list of weather data for the dates missing on the original list. """
+    @staticmethod
+    def missing_months(most_recent_date, today=None):
+        """ Returns the (year, month) pairs which still need to be scraped after the given
+        most recent stored date: its own month, unless it ends on the month's last day,
+        through to the current month. """
+        today = today or datetime.now()
+        latest = datetime.strptime(most_recent_date, "%Y-%m-%d")
+        next_day = latest + timedelta(days=1)
+        year, month = (next_day.year, next_day.month)
+        months = []
+
+        while (year, month) <= (today.year, today.month):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
+
+    def scrape_months(self, months, concurrency=None, conditional=True):
+        """ Scrapes only the given (year, month) pairs and returns their weather data.
+        Months which a conditional request finds unchanged are skipped. """
+        weather = {}
+        engine = FetchEngine(max_workers=concurrency or self.concurrency,
+                             requests_per_second=self.requests_per_second,
+                             validators=self.validators, conditional=conditional)
 
-        most_recent_date = str(list(outdated_weather_data.keys())[0])
-
-        self.date_log.add(most_recent_date)
-
-        new_data = self.scrape_weather_data()
-
-        for date in list(new_data.keys()):
-            if date < most_recent_date:
-                del new_data[date]
-
-        return new_data
+        try:
+            with engine:
+                jobs = [(key, self.month_url(*key)) for key in months]
+                for (year, month), page in engine.fetch_ordered(
+                        jobs, lambda key, url: self.fetch_month(engine, key, url)):
+                    if page is None:
+                        self.logger.info("Month unchanged: %s", datetime(year, month, 1).strftime('%B - %Y'))
+                        continue
+                    weather.update(page)
+                    self.logger.info("Finished scraping: %s", datetime(year, month, 1).strftime('%B - %Y'))
+        except Exception as e:
+            self.logger.error("Error scraping weather data: %s", e)
 
+        return weather
 
+    def get_new_weather_data(self, outdated_weather_data=None, most_recent_date=None):
+        """ Accepts a list of weather data, or the most recent stored date, and
+        returns the weather data of every month from that date's month onwards.
+        The weather data may be a dictionary keyed by date or a WeatherStore.
+        Only the missing or still open months are requested. """
+        if most_recent_date is None:
+            most_recent_date = getattr(outdated_weather_data, "last_date", None) or max(outdated_weather_data)
 
+        months = self.missing_months(most_recent_date)
+        self.logger.info("Updating %s months since %s.", len(months), most_recent_date)
+        return self.scrape_months(months)
 
 
 if __name__ == "__main__":
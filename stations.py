@@ -0,0 +1,57 @@
+"""
+This module contains the Station record and the StationRegistry class,
+which keeps track of the climate.weather.gc.ca stations this application ingests.
+"""
+
+import json
+from collections import namedtuple
+
+Station = namedtuple("Station", ["station_id", "location", "first_year"], defaults=[1840])
+
+class StationRegistry:
+    """ Represents the set of stations to scrape, keyed by station ID.
+    The location of each station is the value stored in the weather table's location column. """
+    DEFAULT_STATIONS = (
+        Station(27174, "Winnipeg, MB"),
+    )
+
+    def __init__(self, stations=DEFAULT_STATIONS):
+        """ Initializes an instance of the StationRegistry class. """
+        self.stations = {}
+        for station in stations:
+            self.add(station)
+
+    @classmethod
+    def load(cls, path):
+        """ Loads a registry from a JSON file holding a list of
+        {"station_id": ..., "location": ..., "first_year": ...} objects. """
+        with open(path, encoding="utf-8") as file:
+            return cls(Station(**entry) for entry in json.load(file))
+
+    def save(self, path):
+        """ Writes the registry to a JSON file. """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump([station._asdict() for station in self.stations.values()], file, indent=2)
+
+    def add(self, station):
+        """ Adds or replaces a station. """
+        self.stations[station.station_id] = station
+
+    def get(self, station_id):
+        """ Returns the station with the given ID. """
+        return self.stations[station_id]
+
+    def by_location(self, location):
+        """ Returns the station stored under the given location name, or None if there is none. """
+        for station in self.stations.values():
+            if station.location == location:
+                return station
+        return None
+
+    def __iter__(self):
+        """ Iterates over the registered stations. """
+        return iter(self.stations.values())
+
+    def __len__(self):
+        """ Returns the number of registered stations. """
+        return len(self.stations)
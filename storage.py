@@ -0,0 +1,274 @@
+"""
+This module contains the storage backends of the application and a converter between them.
+SQLiteBackend reads and writes the weather table through DBOperations and remains the default,
+while ColumnarBackend keeps each location's days as columnar files partitioned by decade,
+which are memory-mapped on read so analytical scans work on the file pages directly
+instead of building Python tuples row by row.
+Partitions are written as NumPy .npy columns, or as Arrow IPC files when pyarrow is installed.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import numpy as np
+from abc import ABC, abstractmethod
+from datetime import date
+from page_cache import PageCache
+from weather_logger import WeatherLogger
+from weather_store import QUALITY_DTYPE, WeatherStore
+
+COLUMNS = ("ordinals", "min", "max", "mean", "quality")
+DTYPES = {"ordinals": np.int32, "min": np.float32, "max": np.float32, "mean": np.float32,
+          "quality": np.dtype(QUALITY_DTYPE)}
+
+def decade_bounds(decade):
+    """ Returns the first and last day ordinals of a decade. """
+    return date(decade, 1, 1).toordinal(), date(decade + 9, 12, 31).toordinal()
+
+
+class StorageBackend(ABC):
+    """ Represents a store of daily weather data per location.
+    Subclasses implement reading and writing, and report the data version they hold. """
+    @abstractmethod
+    def locations(self):
+        """ Returns the locations held by the backend. """
+
+    @abstractmethod
+    def read(self, location, start_date=None, end_date=None):
+        """ Returns the days of a location between two dates (inclusive) as a WeatherStore. """
+
+    @abstractmethod
+    def write(self, location, store, version=None):
+        """ Replaces the days of a location with the contents of a WeatherStore,
+        recording the data version it was copied at. """
+
+    @abstractmethod
+    def version(self, location):
+        """ Returns the data version of a location's days. """
+
+
+class SQLiteBackend(StorageBackend):
+    """ Represents the SQLite weather table as a storage backend. """
+    def __init__(self, db_ops):
+        """ Initializes an instance of the SQLiteBackend class over a DBOperations instance. """
+        self.db_ops = db_ops
+
+    def locations(self):
+        """ Returns the locations which have rows in the weather table. """
+        return sorted(self.db_ops.latest_dates())
+
+    def read(self, location, start_date=None, end_date=None):
+        """ Returns the days of a location between two dates (inclusive) as a WeatherStore. """
+        return self.db_ops.fetch_range(start_date or "0000-01-01", end_date or "9999-12-31",
+                                       location, columnar=True)
+
+    def write(self, location, store, version=None):
+        """ Replaces the days of a location, and their quality flags, with the contents of a WeatherStore
+        in one transaction, so readers never see the location half written. """
+        self.db_ops.save_data(store.to_dict(), location, replace=True)
+
+    def version(self, location):
+        """ Returns the data version of all of a location's months. """
+        return self.db_ops.fetch_data_version(location, (0, 1), (9999, 12))
+
+
+class ColumnarBackend(StorageBackend):
+    """ Represents a directory of columnar partitions, one per location and decade:
+    <directory>/<location>/<decade>.<generation>/<column>.npy, or <directory>/<location>/<decade>.<generation>.arrow.
+    A manifest.json records the location names, the data version each was copied at and the generation
+    of its partitions. Each write of a location goes to a new generation, which readers only see once
+    the manifest is replaced, so they never mix the columns of two writes. """
+    def __init__(self, directory="weather_columnar", fmt="npy"):
+        """ Initializes an instance of the ColumnarBackend class.
+        Fmt selects NumPy ("npy") or Arrow IPC ("arrow") partitions, which needs pyarrow. """
+        if fmt not in ("npy", "arrow"):
+            raise ValueError(f"Unknown columnar format: {fmt}")
+        self.directory = directory
+        self.fmt = fmt
+        self.manifest_path = os.path.join(directory, "manifest.json")
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    @staticmethod
+    def pyarrow():
+        """ Returns the pyarrow module, which is only needed for Arrow partitions. """
+        try:
+            import pyarrow
+            import pyarrow.ipc  # noqa: F401
+        except ImportError:
+            raise ImportError("Arrow partitions need pyarrow: pip install pyarrow")
+        return pyarrow
+
+    def manifest(self):
+        """ Returns the manifest, a dictionary of location: {"slug", "version", "format", "decades", "generation"}. """
+        try:
+            with open(self.manifest_path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def locations(self):
+        """ Returns the locations held by the backend. """
+        return sorted(self.manifest())
+
+    def version(self, location):
+        """ Returns the data version a location was copied at, or None if it is not held. """
+        entry = self.manifest().get(location)
+        return entry["version"] if entry else None
+
+    def partition_path(self, slug, decade, fmt, column=None, generation=None):
+        """ Returns the path of a partition directory, column file or Arrow file.
+        Partitions written before generations were recorded have none in their names. """
+        name = str(decade) if generation is None else f"{decade}.{generation}"
+        if fmt == "arrow":
+            return os.path.join(self.directory, slug, f"{name}.arrow")
+        if column is None:
+            return os.path.join(self.directory, slug, name)
+        return os.path.join(self.directory, slug, name, f"{column}.npy")
+
+    def load_partition(self, slug, decade, fmt, generation=None):
+        """ Memory-maps the columns of one partition and returns them as a WeatherStore.
+        The arrays are views of the mapped file, so nothing is copied until they are changed.
+        Arrow holds the quality codes as variable-length strings, so that column is copied.
+        Partitions written before quality codes were kept have none. """
+        if fmt == "arrow":
+            pa = self.pyarrow()
+            table = pa.ipc.open_file(pa.memory_map(self.partition_path(slug, decade, fmt, generation=generation))
+                                     ).read_all()
+            columns = [table.column(name).combine_chunks().to_numpy(zero_copy_only=name != "quality")
+                       if name in table.column_names else None for name in COLUMNS]
+        else:
+            paths = [self.partition_path(slug, decade, fmt, name, generation) for name in COLUMNS]
+            columns = [np.load(path, mmap_mode="r") if os.path.exists(path) else None for path in paths]
+        return WeatherStore(*columns)
+
+    def iter_partitions(self, location):
+        """ Yields (decade, WeatherStore) pairs of a location's memory-mapped partitions in date order,
+        for scans which can work one decade at a time without concatenating them. """
+        entry = self.manifest().get(location)
+        if entry is None:
+            return
+        for decade in entry["decades"]:
+            yield decade, self.load_partition(entry["slug"], decade, entry["format"], entry.get("generation"))
+
+    def read(self, location, start_date=None, end_date=None):
+        """ Returns the days of a location between two dates (inclusive) as a WeatherStore.
+        A range within one decade is a view of the mapped partition; longer ranges are concatenated. """
+        start = WeatherStore.to_ordinal(start_date) if start_date else None
+        end = WeatherStore.to_ordinal(end_date) if end_date else None
+        parts = []
+        for decade, partition in self.iter_partitions(location):
+            first, last = decade_bounds(decade)
+            if (start is not None and last < start) or (end is not None and first > end):
+                continue
+            lower = np.searchsorted(partition.ordinals, start, side="left") if start is not None else 0
+            upper = np.searchsorted(partition.ordinals, end, side="right") if end is not None else None
+            parts.append(partition.take(slice(lower, upper)))
+
+        if not parts:
+            return WeatherStore()
+        if len(parts) == 1:
+            return parts[0]
+        return WeatherStore(*(np.concatenate([getattr(part, column) for part in parts]) for column in COLUMNS))
+
+    def write(self, location, store, version=None):
+        """ Replaces the partitions of a location with the contents of a WeatherStore.
+        The partitions are written under a new generation and the manifest is switched to it
+        in one atomic replace, after which the previous generation is deleted. """
+        manifest = self.manifest()
+        slug = re.sub(r"[^a-z0-9]+", "-", location.lower()).strip("-")
+        decades = np.unique(store.years() // 10 * 10).tolist()
+        old = manifest.get(location)
+        generation = (old.get("generation") or 0) + 1 if old else 1
+
+        written = []
+        for decade in decades:
+            first, last = decade_bounds(decade)
+            lower = np.searchsorted(store.ordinals, first, side="left")
+            upper = np.searchsorted(store.ordinals, last, side="right")
+            self.write_partition(slug, decade, generation, {column: np.ascontiguousarray(
+                getattr(store, column)[lower:upper], dtype=DTYPES[column]) for column in COLUMNS})
+            written.append(decade)
+
+        manifest[location] = {"slug": slug, "version": version, "format": self.fmt, "decades": written,
+                              "generation": generation}
+        PageCache.write_atomic(self.manifest_path, json.dumps(manifest, indent=2).encode())
+        if old:
+            self.remove_partitions(old["slug"], old["decades"], old["format"], old.get("generation"))
+        self.logger.info("Wrote %s days of %s in %s %s partitions.", len(store), location, len(written), self.fmt)
+
+    def write_partition(self, slug, decade, generation, columns):
+        """ Writes the columns of one partition of a generation, replacing any copy left by an interrupted write. """
+        if self.fmt == "arrow":
+            pa = self.pyarrow()
+            table = pa.table({name: columns[name] for name in COLUMNS})
+            path = self.partition_path(slug, decade, "arrow", generation=generation)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            return
+
+        for name in COLUMNS:
+            path = self.partition_path(slug, decade, "npy", name, generation)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                np.save(file, columns[name])
+
+    def remove_partitions(self, slug, decades, fmt, generation=None):
+        """ Deletes the partitions of a generation which is no longer listed in the manifest.
+        A partition still mapped by a reader on Windows cannot be deleted and is left behind. """
+        for decade in decades:
+            path = self.partition_path(slug, decade, fmt, generation=generation)
+            if fmt == "arrow":
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def convert(source, target, locations=None):
+    """ Copies every location, or the given ones, from one backend to another,
+    recording the source's data version in the target. Returns the number of days copied. """
+    copied = 0
+    for location in locations or source.locations():
+        version = source.version(location)
+        store = source.read(location)
+        target.write(location, store, version)
+        copied += len(store)
+    return copied
+
+def main():
+    """ Exports the SQLite database to columnar partitions, or imports partitions back into SQLite. """
+    from db_operations import DBOperations
+    from dbcm import ConnectionPool
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("direction", choices=("export", "import"))
+    parser.add_argument("--db", default="weather_data.sqlite")
+    parser.add_argument("--dir", default="weather_columnar")
+    parser.add_argument("--format", choices=("npy", "arrow"), default="npy")
+    parser.add_argument("--location", nargs="*", help="only convert these locations")
+    args = parser.parse_args()
+
+    db_ops = DBOperations(args.db)
+    db_ops.initialize_db()
+    sqlite_backend = SQLiteBackend(db_ops)
+    columnar_backend = ColumnarBackend(args.dir, args.format)
+
+    try:
+        if args.direction == "export":
+            days = convert(sqlite_backend, columnar_backend, args.location)
+        else:
+            days = convert(columnar_backend, sqlite_backend, args.location)
+    finally:
+        # Closing the connections checkpoints the WAL, so the database is a single file again.
+        ConnectionPool.release(args.db)
+    print(f"{args.direction}ed {days} days")
+
+if __name__ == "__main__":
+    main()
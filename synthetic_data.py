@@ -0,0 +1,139 @@
+"""
+This module contains helpers for generating synthetic weather data,
+including month pages shaped like the climate.weather.gc.ca daily data table
+and the LocalWeatherServer class, which serves those pages over HTTP for offline runs.
+"""
+
+import calendar
+import hashlib
+import math
+import random
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+DAILY_COLUMNS = 11
+
+def synthetic_day(station_id, year, month, day, missing_rate=0.0):
+    """ Returns deterministic (max, min, mean) temperatures for a day,
+    following a seasonal curve. Missing values are returned as None. """
+    rng = random.Random(f"{station_id}-{year}-{month}-{day}")
+    day_of_year = date(year, month, day).timetuple().tm_yday
+    seasonal = -20.0 * math.cos(2 * math.pi * (day_of_year - 15) / 365) + 3.0
+    mean = round(seasonal + rng.gauss(0, 4), 1)
+    spread = abs(rng.gauss(5, 2))
+    values = [round(mean + spread, 1), round(mean - spread, 1), mean]
+    return tuple(None if rng.random() < missing_rate else value for value in values)
+
+def synthetic_month_page(station_id, year, month, missing_rate=0.0):
+    """ Returns an HTML page shaped like the climate.weather.gc.ca
+    daily data report for the given station and month. """
+    month_name = calendar.month_name[month]
+    rows = []
+
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        cells = synthetic_day(station_id, year, month, day, missing_rate)
+        mean = cells[2]
+        heat = round(max(0.0, 18.0 - mean), 1) if mean is not None else None
+        cool = round(max(0.0, mean - 18.0), 1) if mean is not None else None
+        values = list(cells) + [heat, cool, 0.0, 0.0, 0.0, None, None]
+        tds = "".join(f"<td>{'M' if v is None else v}</td>" for v in values[:DAILY_COLUMNS])
+        rows.append(f'<tr>\n<th scope="row"><abbr title="{month_name} {day}, {year}">'
+                    f'{day:02d}</abbr></th>\n{tds}\n</tr>')
+
+    for label in ("Sum", "Avg", "Xtrm"):
+        tds = "<td>&nbsp;</td>" * DAILY_COLUMNS
+        rows.append(f'<tr>\n<th scope="row">{label}</th>\n{tds}\n</tr>')
+
+    body = "\n".join(rows)
+    return (
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head><title>Daily Data Report for "
+        f"{month_name} {year}</title></head>\n<body>\n<main>\n"
+        f"<h1>Daily Data Report for {month_name} {year}</h1>\n"
+        "<table class=\"data-table\">\n<caption>Daily Data Report</caption>\n"
+        "<thead>\n<tr><th>DAY</th><th>Max Temp</th><th>Min Temp</th><th>Mean Temp</th>"
+        "<th>Heat Deg Days</th><th>Cool Deg Days</th><th>Total Rain</th><th>Total Snow</th>"
+        "<th>Total Precip</th><th>Snow on Grnd</th><th>Dir of Max Gust</th>"
+        "<th>Spd of Max Gust</th></tr>\n</thead>\n"
+        f"<tbody>\n{body}\n</tbody>\n</table>\n</main>\n</body>\n</html>\n"
+    )
+
+
+class LocalWeatherServer:
+    """ Represents a local stand-in for the climate.weather.gc.ca daily data site.
+    Months outside of the available range are clamped to the nearest available month,
+    as the real site does. """
+    def __init__(self, first_month=(1840, 3), last_month=None, latency=0.0, missing_rate=0.0):
+        """ Initializes an instance of the LocalWeatherServer class.
+        Latency is the number of seconds each response is delayed by. """
+        today = time.localtime()
+        self.first_month = first_month
+        self.last_month = last_month or (today.tm_year, today.tm_mon)
+        self.latency = latency
+        self.missing_rate = missing_rate
+        self.requests = 0
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """ Returns the URL of the daily data page served by this server. """
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/climate_data/daily_data_e.html"
+
+    def clamp(self, year, month):
+        """ Clamps the given month to the range of available months. """
+        return min(max((year, month), self.first_month), self.last_month)
+
+    def __enter__(self):
+        """ Starts serving on a free localhost port in a background thread. """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """ Serves synthetic month pages. """
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                """ Responds with the month page named in the query string. """
+                query = parse_qs(urlsplit(self.path).query)
+                try:
+                    station_id = int(query.get("StationID", ["27174"])[0])
+                    year, month = server.clamp(int(query["Year"][0]), int(query["Month"][0]))
+                except (KeyError, ValueError):
+                    self.send_error(400)
+                    return
+
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+                body = synthetic_month_page(station_id, year, month, server.missing_rate).encode()
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                """ Silences per-request logging. """
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_trace):
+        """ Stops the server. """
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,120 @@
+"""
+Shared fixtures for the test suite. The application modules live in the repository root,
+so it is put on the import path, and the log file is written to a temporary directory.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from weather_logger import WeatherLogger
+
+WeatherLogger.log_file = os.path.join(tempfile.gettempdir(), "weather_processor_tests.log")
+
+
+def table_page(rows):
+    """ Returns a month page holding a daily data table with the given
+    (month name, day, year, [cell markup, ...]) rows. """
+    body = "\n".join(
+        f'<tr><th scope="row"><abbr title="{month} {day}, {year}">{day:02d}</abbr></th>'
+        + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>"
+        for month, day, year, cells in rows)
+    return ("<html><body><table><thead><tr><th>DAY</th><th>Max Temp</th><th>Min Temp</th>"
+            f"<th>Mean Temp</th><th>Heat Deg Days</th></tr></thead><tbody>\n{body}\n</tbody></table>"
+            "</body></html>")
+
+
+class ScriptedServer:
+    """ Represents a local HTTP/1.1 server which answers each path with a scripted list of responses,
+    repeating the last one, and records every request it receives. A response is a dictionary of
+    status (200), body (b""), headers ({}) and delay (0.0 seconds). Like the weather site,
+    a 200 response whose ETag matches the request's If-None-Match is sent as a 304. """
+    def __init__(self):
+        """ Initializes an instance of the ScriptedServer class and starts serving on a free port. """
+        self.routes = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """ Serves the scripted responses. """
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                """ Sends the next scripted response for the requested path. """
+                with server.lock:
+                    server.requests.append({"path": self.path, "headers": dict(self.headers),
+                                            "port": self.client_address[1], "time": time.monotonic()})
+                    responses = server.routes.get(urlsplit(self.path).path, [{"status": 404}])
+                    response = responses.pop(0) if len(responses) > 1 else responses[0]
+
+                if response.get("delay"):
+                    time.sleep(response["delay"])
+                status, body = response.get("status", 200), response.get("body", b"")
+                headers = response.get("headers", {})
+                if status == 200 and headers.get("ETag") and headers["ETag"] == self.headers.get("If-None-Match"):
+                    status, body = 304, b""
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                """ Silences per-request logging. """
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def route(self, path, *responses):
+        """ Scripts the responses to a path. """
+        with self.lock:
+            self.routes[path] = [dict(response) for response in responses]
+
+    def url(self, path):
+        """ Returns the URL of a path on this server. """
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def close(self):
+        """ Stops the server. """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def http_server():
+    """ Returns a ScriptedServer, stopping it afterwards. """
+    server = ScriptedServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def db_ops(tmp_path):
+    """ Returns a DBOperations over a new, initialized database in a temporary directory,
+    releasing its pooled connections afterwards. """
+    from db_operations import DBOperations
+    from dbcm import ConnectionPool
+
+    db_ops = DBOperations(str(tmp_path / "weather.sqlite"))
+    db_ops.initialize_db()
+    yield db_ops
+    ConnectionPool.release(db_ops.db_name)
+
+
+def days(month, count, start=1, mean=-10.0):
+    """ Returns a dictionary of count days of 'YYYY-MM' weather data with distinct values. """
+    return {f"{month}-{day:02d}": {"Max": mean + day / 10 + 5, "Min": mean + day / 10 - 5, "Mean": mean + day / 10}
+            for day in range(start, start + count)}
@@ -0,0 +1,51 @@
+""" Tests for the vectorized aggregation functions. """
+
+import numpy as np
+import pytest
+from matplotlib import cbook
+
+from aggregation import grouped_boxplot_stats, grouped_quantiles, yearly_summary
+from weather_store import WeatherStore
+
+KEYS = ("mean", "med", "q1", "q3", "whislo", "whishi")
+
+
+@pytest.mark.parametrize("whis", [1.5, 0.5])
+def test_grouped_boxplot_stats_match_matplotlib(whis):
+    rng = np.random.default_rng(1)
+    groups = rng.integers(0, 12, 2000)
+    values = np.round(rng.normal(0, 10, 2000) + rng.standard_t(2, 2000), 1)
+    values[::50] = np.nan
+
+    stats = grouped_boxplot_stats(groups, values, 12, whis=whis)
+    for index, group in enumerate(stats):
+        expected = cbook.boxplot_stats(values[(groups == index) & ~np.isnan(values)], whis=whis)[0]
+        for key in KEYS:
+            assert group[key] == pytest.approx(expected[key])
+        assert sorted(group["fliers"]) == pytest.approx(sorted(expected["fliers"]))
+
+
+def test_grouped_boxplot_stats_of_an_empty_group():
+    stats = grouped_boxplot_stats(np.array([0, 0, 0]), np.array([1.0, 2.0, 3.0]), 2, ["a", "b"])
+    assert stats[0]["med"] == 2.0 and stats[0]["label"] == "a"
+    assert stats[1]["count"] == 0 and np.isnan(stats[1]["med"]) and len(stats[1]["fliers"]) == 0
+
+
+def test_grouped_quantiles_match_numpy_percentile():
+    rng = np.random.default_rng(2)
+    groups = rng.integers(0, 5, 300)
+    values = rng.normal(size=300)
+    result = grouped_quantiles(groups, values, 5, [0.1, 0.5, 0.9])
+    for index in range(5):
+        assert result[index] == pytest.approx(np.percentile(values[groups == index], [10, 50, 90]))
+
+
+def test_yearly_summary_skips_missing_means():
+    store = WeatherStore.from_dict({"2000-01-01": {"Max": 1.0, "Min": -1.0, "Mean": 0.0},
+                                    "2000-06-01": {"Max": 30.0, "Min": 10.0, "Mean": 20.0},
+                                    "2001-01-01": {"Max": None, "Min": None, "Mean": None},
+                                    "2002-01-01": {"Max": 5.0, "Min": 1.0, "Mean": 3.0}})
+    summary = yearly_summary(store)
+    assert summary["year"].tolist() == [2000, 2002]
+    assert summary["count"].tolist() == [2, 1]
+    assert summary["mean"].tolist() == [10.0, 3.0]
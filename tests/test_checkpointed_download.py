@@ -0,0 +1,73 @@
+""" Tests for the staged, resumable full download. """
+
+import pytest
+
+from checkpointed_download import CheckpointedDownload
+from conftest import days
+
+
+class FakeScraper:
+    """ Serves prepared month pages, newest first, from a dictionary of (year, month): page. """
+    station_id = 27174
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def iter_month_pages(self, start_date):
+        for key in sorted(self.pages, reverse=True):
+            if key <= (start_date.year, start_date.month):
+                self.requested.append(key)
+                yield key, self.pages[key]
+
+
+def test_finish_download_swaps_the_staged_rows_into_place(db_ops):
+    db_ops.save_data(days("2019-12", 31), "A")
+    db_ops.start_download("A", 27174, "2020-01")
+    db_ops.save_month("A", days("2020-01", 20), "2020-01")
+
+    assert db_ops.finish_download("A") == 20
+    assert db_ops.fetch_date_bounds() == ("2020-01-01", "2020-01-20")
+    assert list(db_ops.fetch_coverage("A", (0, 1), (9999, 12))) == [(2020, 1)]
+    assert [row[:2] for row in db_ops.fetch_monthly_rollups(0, 9999, "A")] == [(1, 20)]
+    assert db_ops.count_staged("A") == 0
+
+
+def test_finish_download_refuses_an_empty_staging_table(db_ops):
+    db_ops.save_data(days("2020-01", 31), "A")
+    db_ops.start_download("A", 27174, "2020-01")
+
+    with pytest.raises(ValueError):
+        db_ops.finish_download("A")
+    assert db_ops.fetch_date_bounds() == ("2020-01-01", "2020-01-31")
+    assert list(db_ops.fetch_coverage("A", (0, 1), (9999, 12))) == [(2020, 1)]
+
+
+def test_download_without_any_month_keeps_the_stored_data(db_ops):
+    db_ops.save_data(days("2020-01", 31), "A")
+    # The first page answered holds another month's rows, so the download stops before staging anything.
+    scraper = FakeScraper({(2021, 1): days("2020-01", 31)})
+    download = CheckpointedDownload(scraper, db_ops, "A", first_year=2000)
+
+    assert download.run() == 0
+    assert scraper.requested == [(2021, 1)]
+    assert db_ops.fetch_date_bounds() == ("2020-01-01", "2020-01-31")
+
+
+def test_download_stops_at_the_start_of_the_record(db_ops):
+    pages = {(2021, month): days(f"2021-{month:02d}", 28) for month in range(1, 4)}
+    pages[(2020, 12)] = days("2021-01", 28)
+    download = CheckpointedDownload(FakeScraper(pages), db_ops, "A", first_year=2000)
+
+    assert download.run() == 3 * 28
+    assert download.months_completed == 3
+    assert db_ops.fetch_date_bounds() == ("2021-01-01", "2021-03-28")
+
+
+def test_interrupted_download_resumes_after_the_last_completed_month(db_ops):
+    db_ops.start_download("A", 27174, "2099-03")
+    db_ops.save_month("A", days("2099-03", 28), "2099-03")
+
+    assert db_ops.start_download("A", 27174, "2099-03") == "2099-02"
+    assert db_ops.start_download("A", 99999, "2099-03") == "2099-03"
+    assert db_ops.count_staged("A") == 0
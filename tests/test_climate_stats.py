@@ -0,0 +1,88 @@
+""" Tests for the climate normals, anomalies, rolling means and degree days against a synthetic record. """
+
+import calendar
+import math
+
+import numpy as np
+import pytest
+
+from climate_stats import ClimateStats
+
+
+def month_of(year, month, mean):
+    """ Returns a month of days which all have the same mean, 5 degrees above the minimum and below the maximum. """
+    return {f"{year}-{month:02d}-{day:02d}": {"Max": mean + 5, "Min": mean - 5, "Mean": mean}
+            for day in range(1, calendar.monthrange(year, month)[1] + 1)}
+
+
+@pytest.fixture
+def climate(db_ops):
+    """ Returns ClimateStats over three years of Januaries at -10, -8 and -6 and Julys at 20 for location A,
+    and January 2010 for location B with each day's mean equal to its day of the month, day 6 missing. """
+    for year, january in ((2000, -10.0), (2001, -8.0), (2002, -6.0)):
+        db_ops.save_data({**month_of(year, 1, january), **month_of(year, 7, 20.0)}, "A")
+    ramp = {f"2010-01-{day:02d}": {"Max": day + 1.0, "Min": day - 1.0, "Mean": float(day)} for day in range(1, 32)}
+    ramp["2010-01-06"] = {"Max": None, "Min": None, "Mean": None}
+    db_ops.save_data(ramp, "B")
+    return ClimateStats(db_ops)
+
+
+def test_normals_of_each_calendar_month(climate):
+    normals = climate.normals("A", (2000, 2002))
+    assert normals["years"].tolist() == [3, 0, 0, 0, 0, 0, 3, 0, 0, 0, 0, 0]
+    assert normals["mean"][0] == pytest.approx(-8.0)
+    assert normals["std"][0] == pytest.approx(math.sqrt(8 / 3))
+    assert (normals["min"][0], normals["max"][0]) == pytest.approx((-13.0, -3.0))
+    assert normals["hdd"][0] == pytest.approx(31 * 26.0)
+    assert (normals["mean"][6], normals["std"][6], normals["hdd"][6], normals["cdd"][6]) == pytest.approx(
+        (20.0, 0.0, 0.0, 31 * 2.0))
+    assert np.isnan(normals["mean"][1])
+    assert climate.normals("A", (2000, 2000))["mean"][0] == pytest.approx(-10.0)
+
+
+def test_monthly_statistics_of_a_year(climate):
+    months = climate.monthly("A", 2001, 2001)
+    assert months["month"].tolist() == [1, 7]
+    assert months["days"].tolist() == [31, 31]
+    assert months["mean"] == pytest.approx([-8.0, 20.0])
+    assert months["std"] == pytest.approx([0.0, 0.0], abs=1e-6)
+    assert (months["low"].tolist(), months["high"].tolist()) == ([-13.0, 15.0], [-3.0, 25.0])
+    assert months["hdd"] == pytest.approx([31 * 26.0, 0.0])
+
+
+def test_rolling_normals_over_windows_of_years(climate):
+    rolling = climate.rolling_normals("A", window=2)
+    assert rolling["year"].tolist() == [2001, 2002]
+    assert rolling["mean"][:, 0] == pytest.approx([-9.0, -7.0])
+    assert rolling["mean"][:, 6] == pytest.approx([20.0, 20.0])
+
+
+def test_anomalies_from_the_normals(climate):
+    # Mid-January, the interpolated daily normal is the January normal itself.
+    daily = climate.anomalies("A", "2002-01-16", "2002-01-16", (2000, 2002))
+    assert daily["normal"] == pytest.approx([-8.0])
+    assert daily["anomaly"] == pytest.approx([2.0])
+
+    monthly = climate.monthly_anomalies("A", 2000, 2002, (2000, 2002))
+    assert monthly["anomaly"] == pytest.approx([-2.0, 0.0, 0.0, 0.0, 2.0, 0.0])
+
+
+def test_rolling_means_skip_missing_days(climate):
+    rolling = climate.rolling_mean("B", "2010-01-04", "2010-01-08", window=3)
+    assert [str(day) for day in rolling["date"]] == [f"2010-01-{day:02d}" for day in range(4, 9)]
+    assert rolling["mean"] == pytest.approx([3.0, 4.0, 4.5, 6.0, 7.5])
+    assert rolling["days"].tolist() == [3, 3, 2, 2, 2]
+
+    # Before the record starts the window is short, and below min_days the mean is missing.
+    start = climate.rolling_mean("B", "2010-01-01", "2010-01-02", window=3, min_days=2)
+    assert np.isnan(start["mean"][0])
+    assert start["mean"][1] == pytest.approx(1.5)
+
+
+def test_degree_days_per_year(climate):
+    degree_days = climate.degree_days("A")
+    assert degree_days["year"].tolist() == [2000, 2001, 2002]
+    assert degree_days["days"].tolist() == [62, 62, 62]
+    assert degree_days["hdd"] == pytest.approx([31 * 28.0, 31 * 26.0, 31 * 24.0])
+    assert degree_days["cdd"] == pytest.approx([62.0, 62.0, 62.0])
+    assert climate.degree_days("A", 2001, 2001)["hdd"] == pytest.approx([31 * 26.0])
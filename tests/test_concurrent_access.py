@@ -0,0 +1,140 @@
+""" Tests for WAL mode, the writer thread, snapshot reads and atomic replacement of a location. """
+
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import days
+from db_operations import DBOperations
+from dbcm import ConnectionPool, DatabaseWriter
+
+
+def test_database_is_in_wal_mode(db_ops):
+    assert sqlite3.connect(db_ops.db_name).execute("pragma journal_mode").fetchone() == ("wal",)
+
+
+def test_save_data_replace_swaps_a_location_in_one_write(db_ops):
+    db_ops.save_data(days("2020-01", 31), "A")
+    db_ops.save_data(days("2020-01", 5), "B")
+
+    assert db_ops.save_data(days("2020-02", 10), "A", replace=True) == 10
+    assert db_ops.fetch_range("0000-01-01", "9999-12-31", "A") == days("2020-02", 10)
+    assert list(db_ops.fetch_coverage("A", (0, 1), (9999, 12))) == [(2020, 2)]
+    assert [row[0] for row in db_ops.fetch_monthly_rollups(0, 9999, "A")] == [2]
+    assert len(db_ops.fetch_range("0000-01-01", "9999-12-31", "B")) == 5
+
+
+def test_save_data_replace_with_no_rows_empties_the_location(db_ops):
+    db_ops.save_data(days("2020-01", 31), "A")
+    assert db_ops.save_data({}, "A", replace=True) == 0
+    assert db_ops.fetch_range("0000-01-01", "9999-12-31", "A") == {}
+    assert db_ops.fetch_coverage("A", (0, 1), (9999, 12)) == {}
+    assert db_ops.fetch_monthly_rollups(0, 9999, "A") == []
+
+
+def test_writes_run_on_the_writer_thread(db_ops, monkeypatch):
+    threads = []
+    update_rollups = type(db_ops).update_rollups
+
+    def record_thread(self, *args):
+        threads.append(threading.current_thread())
+        return update_rollups(self, *args)
+
+    monkeypatch.setattr(type(db_ops), "update_rollups", record_thread)
+    db_ops.save_data(days("2020-01", 3), "A")
+    assert threads == [DatabaseWriter.get(db_ops.db_name).thread]
+
+
+def test_writer_returns_results_and_raises_errors_in_the_caller():
+    writer = DatabaseWriter("writer-test.sqlite")
+    try:
+        assert writer.call(lambda a, b: a + b, 1, b=2) == 3
+        assert writer.call(lambda: writer.call(lambda: "inline")) == "inline"
+        with pytest.raises(ZeroDivisionError):
+            writer.call(lambda: 1 / 0)
+    finally:
+        writer.stop()
+    assert not writer.thread.is_alive()
+
+
+def test_writes_from_many_threads_all_land(db_ops):
+    months = [f"2020-{month:02d}" for month in range(1, 13)]
+    threads = [threading.Thread(target=db_ops.save_data, args=(days(month, 20), "A")) for month in months]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(db_ops.fetch_range("0000-01-01", "9999-12-31", "A")) == 12 * 20
+    assert len(db_ops.covered_months("A", (2020, 1), (2020, 12))) == 12
+
+
+def test_snapshot_reads_ignore_writes_committed_during_the_block(db_ops):
+    db_ops.save_data(days("2020-01", 10), "A")
+    with db_ops.snapshot():
+        version = db_ops.fetch_data_version("A", (0, 1), (9999, 12))
+        db_ops.save_data(days("2020-01", 31), "A", replace=True)
+        assert len(db_ops.fetch_range("2020-01-01", "2020-01-31", "A")) == 10
+        assert db_ops.fetch_data_version("A", (0, 1), (9999, 12)) == version
+        with db_ops.snapshot():
+            assert len(db_ops.fetch_range("2020-01-01", "2020-01-31", "A")) == 10
+
+    assert len(db_ops.fetch_range("2020-01-01", "2020-01-31", "A")) == 31
+    assert db_ops.fetch_data_version("A", (0, 1), (9999, 12)) != version
+
+
+def test_readers_never_see_a_replaced_location_half_written(db_ops):
+    db_ops.save_data(days("2020-01", 31), "A")
+    sizes = set()
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            sizes.add(len(db_ops.fetch_range("0000-01-01", "9999-12-31", "A")))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for _ in range(5):
+            db_ops.save_data({**days("2020-02", 29), **days("2020-03", 31)}, "A", replace=True)
+            db_ops.save_data(days("2020-01", 31), "A", replace=True)
+    finally:
+        done.set()
+        reader.join()
+    assert sizes <= {31, 60}
+
+
+def test_checkout_from_a_full_pool_times_out_with_a_clear_error(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.sqlite"), max_size=1, timeout=0.05)
+    conn = pool.checkout()
+    with pytest.raises(TimeoutError, match="all 1 are checked out"):
+        pool.checkout()
+    pool.checkin(conn)
+    assert pool.checkout() is conn
+    pool.checkin(conn)
+    pool.close()
+
+
+def test_release_lets_the_database_file_be_replaced(db_ops, tmp_path):
+    other = DBOperations(str(tmp_path / "other.sqlite"))
+    other.initialize_db()
+    other.save_data(days("2020-01", 2, mean=10.0), "A")
+    db_ops.save_data(days("2020-01", 2), "A")
+    assert db_ops.fetch_range("2020-01-01", "2020-01-01", "A")["2020-01-01"]["Mean"] == -9.9
+
+    ConnectionPool.release(other.db_name)
+    ConnectionPool.release(db_ops.db_name)
+    assert not (tmp_path / "weather.sqlite-wal").exists()
+    os.replace(other.db_name, db_ops.db_name)
+    assert db_ops.fetch_range("2020-01-01", "2020-01-01", "A")["2020-01-01"]["Mean"] == 10.1
+
+
+def test_connections_checked_in_after_release_are_closed(db_ops):
+    pool = ConnectionPool.get(db_ops.db_name, read_only=True)
+    conn = pool.checkout()
+    ConnectionPool.release(db_ops.db_name)
+    pool.checkin(conn)
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("select 1")
+    assert ConnectionPool.get(db_ops.db_name, read_only=True) is not pool
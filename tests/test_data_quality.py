@@ -0,0 +1,120 @@
+""" Tests for cell parsing, day validation, stored quality flags and the coverage index. """
+
+import sqlite3
+
+import pytest
+
+from conftest import days, table_page
+from data_quality import (BLANK, INCONSISTENT, INVALID, MISSING, OUT_OF_RANGE, decode_flags, encode_flags,
+                          month_runs, parse_cell, validate_day)
+from db_operations import DBOperations
+from dbcm import ConnectionPool
+from scrape_weather import WeatherScraper
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("12.3", (12.3, None)),
+    ("-0.5", (-0.5, None)),
+    ("12.3 E", (12.3, "E")),
+    ("12.3E", (12.3, "E")),
+    ("M", (None, MISSING)),
+    ("LegendM", (None, MISSING)),
+    ("&nbsp;", (None, BLANK)),
+    ("", (None, BLANK)),
+    ("\xa0", (None, BLANK)),
+    ("abc", (None, INVALID)),
+    ("1.0 zz", (None, INVALID)),
+])
+def test_parse_cell(text, expected):
+    assert parse_cell(text) == expected
+
+
+def test_validate_day_leaves_clean_days_alone():
+    day = {"Max": 5.0, "Min": -5.0, "Mean": 0.0}
+    assert validate_day(day) is day
+
+
+def test_validate_day_flags_missing_out_of_range_and_inconsistent_values():
+    assert validate_day({"Max": None, "Min": -5.0, "Mean": 0.0}) == {
+        "Max": None, "Min": -5.0, "Mean": 0.0, "Flags": {"Max": MISSING}}
+    assert validate_day({"Max": 5.0, "Min": -5.0, "Mean": 99.0}) == {
+        "Max": 5.0, "Min": -5.0, "Mean": None, "Flags": {"Mean": OUT_OF_RANGE}}
+    assert validate_day({"Max": -5.0, "Min": 5.0, "Mean": 0.0})["Flags"] == {
+        "Max": INCONSISTENT, "Min": INCONSISTENT}
+    assert validate_day({"Max": None, "Min": 1.0, "Mean": 2.0, "Flags": {"Max": BLANK}})["Flags"] == {
+        "Max": BLANK}
+
+
+def test_flag_codes_round_trip():
+    assert encode_flags({}) is None
+    assert encode_flags({"Max": "E", "Mean": "M"}) == "E-M"
+    assert decode_flags("E-M") == {"Max": "E", "Mean": "M"}
+    assert decode_flags(None) == {}
+
+
+def test_month_runs():
+    assert list(month_runs(["2020-12", "2020-02", "2021-01", "2020-03"])) == [
+        ("2020-02", "2020-03"), ("2020-12", "2021-01")]
+
+
+@pytest.mark.parametrize("parser", ["fast", "html"])
+def test_parsers_keep_columns_aligned_around_blank_and_flagged_cells(parser):
+    page = table_page([
+        ("June", 1, 2010, ["", "10.5", "15.0", "3.0"]),
+        ('June', 2, 2010, ["25.1<abbr title=\"Estimated\">E</abbr>", "M", "18.0", "0.0"]),
+        ("June", 3, 2010, ["22.0", "12.0", "&nbsp;", "1.0"]),
+    ])
+    weather = WeatherScraper(parser=parser).parse_page(page.encode())
+    assert weather == {
+        "2010-06-01": {"Max": None, "Min": 10.5, "Mean": 15.0, "Flags": {"Max": BLANK}},
+        "2010-06-02": {"Max": 25.1, "Min": None, "Mean": 18.0, "Flags": {"Max": "E", "Min": MISSING}},
+        "2010-06-03": {"Max": 22.0, "Min": 12.0, "Mean": None, "Flags": {"Mean": BLANK}},
+    }
+
+
+def test_missing_values_are_stored_as_null_with_their_flags(db_ops):
+    db_ops.save_data({"2020-01-01": {"Max": None, "Min": -5.0, "Mean": -2.0, "Flags": {"Max": MISSING}},
+                      "2020-01-02": {"Max": 1.0, "Min": -5.0, "Mean": -2.0}}, "A")
+    stored = db_ops.fetch_range("2020-01-01", "2020-01-31", "A")
+    assert stored["2020-01-01"] == {"Max": None, "Min": -5.0, "Mean": -2.0, "Flags": {"Max": MISSING}}
+    assert "Flags" not in stored["2020-01-02"]
+    assert db_ops.fetch_data("A") == stored
+
+
+def test_older_databases_gain_the_quality_column_in_their_range_index(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute('''create table weather (id integer primary key autoincrement not null, sample_date text,
+                        location text, min_temp real, max_temp real, avg_temp real, unique (sample_date, location))''')
+        conn.execute("create index weather_location_date on weather "
+                     "(location, sample_date, min_temp, max_temp, avg_temp)")
+        conn.execute("insert into weather (sample_date, location, min_temp, max_temp, avg_temp) "
+                     "values ('2020-01-01', 'A', -5.0, 1.0, -2.0)")
+    conn.close()
+
+    db_ops = DBOperations(path)
+    db_ops.initialize_db()
+    assert db_ops.fetch_range("2020-01-01", "2020-01-31", "A") == {
+        "2020-01-01": {"Max": 1.0, "Min": -5.0, "Mean": -2.0}}
+    ConnectionPool.release(path)
+    with sqlite3.connect(path) as conn:
+        columns = [row[2] for row in conn.execute("pragma index_info(weather_location_date)")]
+    conn.close()
+    assert columns == ["location", "sample_date", "min_temp", "max_temp", "avg_temp", "quality"]
+
+
+def test_coverage_follows_writes(db_ops):
+    january = days("2020-01", 10)
+    january["2020-01-05"] = {"Max": None, "Min": None, "Mean": None,
+                             "Flags": {"Max": MISSING, "Min": MISSING, "Mean": MISSING}}
+    db_ops.save_data(january, "A")
+    db_ops.save_data({"2020-03-01": {"Max": 1.0, "Min": None, "Mean": None,
+                                     "Flags": {"Min": MISSING, "Mean": MISSING}}}, "A")
+
+    coverage = db_ops.fetch_coverage("A", (2020, 1), (2020, 12))
+    assert coverage == {(2020, 1): (31, 10, 9, 9, 9, 1), (2020, 3): (31, 1, 1, 0, 0, 1)}
+    assert db_ops.covered_months("A", (2020, 1), (2020, 12)) == [(2020, 1)]
+
+    db_ops.upsert_data({"2020-03-02": {"Max": 2.0, "Min": 0.0, "Mean": 1.0}}, "A")
+    assert db_ops.fetch_coverage("A", (2020, 3), (2020, 3)) == {(2020, 3): (31, 2, 2, 1, 1, 1)}
+    assert db_ops.covered_months("A", (2020, 1), (2020, 12)) == [(2020, 1), (2020, 3)]
@@ -0,0 +1,70 @@
+""" Tests for the range reads behind the plots and the index which answers them. """
+
+import re
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from conftest import days
+from dbcm import ConnectionPool
+
+WEATHER_TABLE = re.compile(r"\bfrom weather\b(?!_)", re.IGNORECASE)
+
+
+def query_plans(db_ops, monkeypatch, read):
+    """ Runs a read on fresh connections and returns the query plan of each statement it ran
+    against the weather table, keyed by the statement. """
+    statements = []
+    connect = ConnectionPool.connect
+
+    def traced(pool):
+        conn = connect(pool)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    ConnectionPool.release(db_ops.db_name)
+    monkeypatch.setattr(ConnectionPool, "connect", traced)
+    read()
+    monkeypatch.setattr(ConnectionPool, "connect", connect)
+
+    with closing(sqlite3.connect(db_ops.db_name)) as conn:
+        return {statement: [row[3] for row in conn.execute(f"explain query plan {statement}")]
+                for statement in statements if WEATHER_TABLE.search(statement)}
+
+
+@pytest.fixture
+def stored(db_ops):
+    """ Returns the test database holding two years of days for two locations, some of them flagged. """
+    for location in ("A", "B"):
+        for year in (2019, 2020):
+            db_ops.save_data({**days(f"{year}-01", 31), **days(f"{year}-07", 31)}, location)
+    db_ops.upsert_data({"2020-07-04": {"Max": None, "Min": 10.0, "Mean": None,
+                                       "Flags": {"Max": "M", "Mean": "M"}}}, "A")
+    return db_ops
+
+
+@pytest.mark.parametrize("read", [
+    lambda db_ops: db_ops.fetch_month(2020, 7, "A"),
+    lambda db_ops: db_ops.fetch_month(2020, 7, "A", columnar=True),
+    lambda db_ops: db_ops.fetch_years(2019, 2020, "A"),
+    lambda db_ops: db_ops.fetch_years(2019, 2020, "A", columnar=True),
+    lambda db_ops: db_ops.fetch_data("A"),
+    lambda db_ops: db_ops.fetch_data("A", columnar=True),
+], ids=["month", "month-columnar", "years", "years-columnar", "all", "all-columnar"])
+def test_range_reads_are_answered_from_the_covering_index(stored, monkeypatch, read):
+    plans = query_plans(stored, monkeypatch, lambda: read(stored))
+    assert plans
+    for steps in plans.values():
+        assert len(steps) == 1
+        assert steps[0].startswith("SEARCH weather USING COVERING INDEX weather_location_date (location=?")
+
+
+def test_range_reads_return_only_the_days_asked_for(stored):
+    july = stored.fetch_month(2020, 7, "A")
+    assert (min(july), max(july), len(july)) == ("2020-07-01", "2020-07-31", 31)
+    assert july["2020-07-04"] == {"Min": 10.0, "Max": None, "Mean": None, "Flags": {"Max": "M", "Mean": "M"}}
+
+    years = stored.fetch_years(2020, 2020, "B", columnar=True)
+    assert (years.first_date, years.last_date, len(years)) == ("2020-01-01", "2020-07-31", 62)
+    assert len(stored.fetch_years(2018, 2018, "A")) == 0
@@ -0,0 +1,41 @@
+""" Tests for the streaming daily table parser. """
+
+from conftest import table_page
+from fast_parser import DailyTableParser, page_months
+from scrape_weather import WeatherScraper
+from synthetic_data import synthetic_month_page
+
+
+def test_maps_max_min_and_mean_columns():
+    page = table_page([("January", 1, 2020, ["1.5", "-7.5", "-3.0", "21.0"]),
+                       ("January", 2, 2020, ["-0.5", "-9.1", "-4.8", "22.8"])])
+    weather = DailyTableParser().feed(page).close()
+    assert weather == {"2020-01-01": {"Max": 1.5, "Min": -7.5, "Mean": -3.0},
+                       "2020-01-02": {"Max": -0.5, "Min": -9.1, "Mean": -4.8}}
+
+
+def test_skips_summary_rows_and_rows_outside_the_table_body():
+    page = table_page([("March", 3, 1999, ["2.0", "1.0", "1.5"])]).replace(
+        "</tbody>", '<tr><th scope="row">Avg</th><td>9.9</td><td>9.9</td><td>9.9</td></tr></tbody>')
+    assert list(DailyTableParser().feed(page).close()) == ["1999-03-03"]
+
+
+def test_rows_split_across_chunks():
+    page = synthetic_month_page(27174, 2000, 2).encode()
+    whole = DailyTableParser().feed(page).close()
+    parser = DailyTableParser()
+    for offset in range(0, len(page), 7):
+        parser.feed(page[offset:offset + 7])
+    assert parser.close() == whole
+    assert len(whole) == 29
+
+
+def test_matches_the_html_parser():
+    page = synthetic_month_page(27174, 1987, 7, missing_rate=0.2).encode()
+    assert WeatherScraper(parser="fast").parse_page(page) == WeatherScraper(parser="html").parse_page(page)
+
+
+def test_page_months():
+    page = table_page([("May", 1, 2001, ["1", "2", "3"]), ("May", 2, 2001, ["1", "2", "3"])])
+    assert page_months(page.encode()) == {(2001, 5)}
+    assert page_months(b"<html></html>") == set()
@@ -0,0 +1,83 @@
+""" Tests for the concurrent fetch engine: rate limiting, retries with backoff and ordered delivery. """
+
+import time
+import urllib.error
+from itertools import count
+
+import pytest
+
+import fetch_engine
+from fetch_engine import FetchEngine, RateLimiter
+
+
+def test_rate_limiter_spaces_requests_to_the_same_host():
+    limiter = RateLimiter(requests_per_second=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait("a")
+    assert time.monotonic() - start >= 4 / 20 - 0.01
+
+    start = time.monotonic()
+    limiter.wait("b")
+    assert time.monotonic() - start < 0.04
+
+
+def test_engine_keeps_to_the_request_rate_with_many_workers(http_server):
+    http_server.route("/page", {"body": b"ok"})
+    with FetchEngine(max_workers=4, requests_per_second=25) as engine:
+        bodies = [body for _, body in engine.fetch_ordered((index, http_server.url("/page")) for index in range(6))]
+
+    assert bodies == [b"ok"] * 6
+    times = sorted(request["time"] for request in http_server.requests)
+    assert min(later - earlier for earlier, later in zip(times, times[1:])) >= 1 / 25 - 0.01
+
+
+def test_throttling_and_server_errors_are_retried_with_exponential_backoff(http_server, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(fetch_engine.time, "sleep", sleeps.append)
+    monkeypatch.setattr(fetch_engine.random, "random", lambda: 0.0)
+    http_server.route("/flaky", {"status": 503}, {"status": 429}, {"status": 500}, {"body": b"done"})
+
+    engine = FetchEngine(max_retries=3, backoff=0.5)
+    assert engine.fetch(http_server.url("/flaky")) == b"done"
+    assert sleeps == [0.5, 1.0, 2.0]
+    assert len(http_server.requests) == 4
+
+
+def test_client_errors_and_exhausted_retries_are_raised(http_server, monkeypatch):
+    monkeypatch.setattr(fetch_engine.time, "sleep", lambda seconds: None)
+    http_server.route("/missing", {"status": 404})
+    http_server.route("/down", {"status": 502})
+    engine = FetchEngine(max_retries=2)
+
+    with pytest.raises(urllib.error.HTTPError) as missing:
+        engine.fetch(http_server.url("/missing"))
+    assert missing.value.code == 404
+    assert len(http_server.requests) == 1
+
+    with pytest.raises(urllib.error.HTTPError) as down:
+        engine.fetch(http_server.url("/down"))
+    assert down.value.code == 502
+    assert len(http_server.requests) == 1 + 3
+
+
+def test_fetch_ordered_yields_in_job_order_while_requests_overlap(http_server):
+    for index, delay in enumerate((0.3, 0.15, 0.0)):
+        http_server.route(f"/{index}", {"body": str(index).encode(), "delay": delay})
+
+    start = time.monotonic()
+    with FetchEngine(max_workers=3) as engine:
+        results = list(engine.fetch_ordered((index, http_server.url(f"/{index}")) for index in range(3)))
+
+    assert results == [(0, b"0"), (1, b"1"), (2, b"2")]
+    assert time.monotonic() - start < 0.3 + 0.15
+
+
+def test_closing_fetch_ordered_stops_an_endless_job_stream(http_server):
+    http_server.route("/page", {"body": b"ok"})
+    with FetchEngine(max_workers=2) as engine:
+        pages = engine.fetch_ordered((index, http_server.url("/page")) for index in count())
+        assert [next(pages)[0] for _ in range(5)] == [0, 1, 2, 3, 4]
+        pages.close()
+
+    assert len(http_server.requests) <= 5 + 2
@@ -0,0 +1,61 @@
+""" Tests for the pooled HTTP client: keep-alive connection reuse and conditional requests. """
+
+from fetch_engine import FetchEngine
+from http_client import PooledHTTPClient
+
+PAGE_HEADERS = {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jun 2020 00:00:00 GMT"}
+
+
+def test_sequential_requests_reuse_one_connection(http_server):
+    http_server.route("/page", {"body": b"ok"})
+    client = PooledHTTPClient()
+    for _ in range(5):
+        assert client.get(http_server.url("/page")).body == b"ok"
+    client.close()
+
+    assert len(http_server.requests) == 5
+    assert len({request["port"] for request in http_server.requests}) == 1
+
+
+def test_concurrent_requests_open_at_most_one_connection_per_worker(http_server):
+    http_server.route("/page", {"body": b"ok", "delay": 0.02})
+    with FetchEngine(max_workers=3) as engine:
+        assert len(list(engine.fetch_ordered((index, http_server.url("/page")) for index in range(12)))) == 12
+    assert len({request["port"] for request in http_server.requests}) <= 3
+
+
+def test_a_connection_closed_by_the_server_is_replaced(http_server):
+    http_server.route("/page", {"body": b"first", "headers": {"Connection": "close"}}, {"body": b"second"})
+    client = PooledHTTPClient()
+    assert client.get(http_server.url("/page")).body == b"first"
+    assert client.get(http_server.url("/page")).body == b"second"
+    client.close()
+    assert len({request["port"] for request in http_server.requests}) == 2
+
+
+def test_conditional_requests_send_the_stored_validators(http_server, db_ops):
+    http_server.route("/page", {"body": b"page", "headers": PAGE_HEADERS})
+    url = http_server.url("/page")
+
+    engine = FetchEngine(conditional=True)
+    assert engine.fetch(url) == b"page"
+    assert engine.validators == {url: (PAGE_HEADERS["ETag"], PAGE_HEADERS["Last-Modified"])}
+    db_ops.save_validators(engine.validators)
+
+    # A later run loads the stored validators, and the unchanged page comes back as a 304 with no body.
+    engine = FetchEngine(conditional=True, validators=db_ops.fetch_validators())
+    assert engine.fetch(url) is None
+    assert http_server.requests[-1]["headers"]["If-None-Match"] == '"v1"'
+    assert http_server.requests[-1]["headers"]["If-Modified-Since"] == PAGE_HEADERS["Last-Modified"]
+
+    http_server.route("/page", {"body": b"changed", "headers": {"ETag": '"v2"'}})
+    assert engine.fetch(url) == b"changed"
+    assert engine.validators[url] == ('"v2"', None)
+
+
+def test_unconditional_requests_ignore_the_validators(http_server):
+    http_server.route("/page", {"body": b"page", "headers": PAGE_HEADERS})
+    url = http_server.url("/page")
+    engine = FetchEngine(validators={url: ('"v1"', None)})
+    assert engine.fetch(url) == b"page"
+    assert "If-None-Match" not in http_server.requests[-1]["headers"]
@@ -0,0 +1,69 @@
+""" Tests for the incremental update: the months left to scrape and the upsert of changed rows. """
+
+from datetime import datetime
+
+import pytest
+
+from conftest import days
+from scrape_weather import WeatherScraper
+
+
+def test_missing_months_start_from_the_month_of_the_last_stored_day():
+    today = datetime(2021, 2, 10)
+    assert WeatherScraper.missing_months("2020-12-15", today) == [(2020, 12), (2021, 1), (2021, 2)]
+    assert WeatherScraper.missing_months("2020-12-31", today) == [(2021, 1), (2021, 2)]
+    assert WeatherScraper.missing_months("2021-02-09", today) == [(2021, 2)]
+
+
+def test_upsert_writes_only_new_and_changed_rows(db_ops):
+    stored = days("2020-01", 10)
+    db_ops.save_data(stored, "A")
+
+    update = days("2020-01", 12)
+    update["2020-01-03"] = {**update["2020-01-03"], "Max": 99.0}
+    changed = db_ops.upsert_data(update, "A")
+
+    assert sorted(changed) == ["2020-01-03", "2020-01-11", "2020-01-12"]
+    assert db_ops.fetch_range("2020-01-03", "2020-01-03", "A")["2020-01-03"]["Max"] == 99.0
+    assert len(db_ops.fetch_range("2020-01-01", "2020-01-31", "A")) == 12
+    assert db_ops.upsert_data(update, "A") == {}
+
+
+def test_upsert_detects_changed_quality_flags(db_ops):
+    db_ops.save_data(days("2020-01", 2), "A")
+    flagged = days("2020-01", 2)
+    flagged["2020-01-02"]["Flags"] = {"Max": "E"}
+    assert list(db_ops.upsert_data(flagged, "A")) == ["2020-01-02"]
+    assert db_ops.fetch_range("2020-01-02", "2020-01-02", "A")["2020-01-02"]["Flags"] == {"Max": "E"}
+
+
+def test_upsert_leaves_the_version_of_unchanged_months(db_ops):
+    db_ops.save_data({**days("2020-01", 5), **days("2020-02", 5)}, "A")
+    january = db_ops.fetch_data_version("A", (2020, 1), (2020, 1))
+    february = db_ops.fetch_data_version("A", (2020, 2), (2020, 2))
+
+    update = days("2020-02", 6)
+    db_ops.upsert_data({**days("2020-01", 5), **update}, "A")
+    assert db_ops.fetch_data_version("A", (2020, 1), (2020, 1)) == january
+    assert db_ops.fetch_data_version("A", (2020, 2), (2020, 2)) != february
+
+
+def test_validators_are_only_saved_with_the_rows_they_describe(db_ops, monkeypatch):
+    validators = {"https://example.com/2020-01": ('"v1"', None)}
+
+    def fail(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(db_ops, "update_rollups", fail)
+    with pytest.raises(RuntimeError, match="disk full"):
+        db_ops.upsert_data(days("2020-01", 3), "A", validators=validators)
+    assert db_ops.fetch_validators() == {}
+    assert db_ops.fetch_range("2020-01-01", "2020-01-31", "A") == {}
+
+    monkeypatch.undo()
+    assert len(db_ops.upsert_data(days("2020-01", 3), "A", validators=validators)) == 3
+    assert db_ops.fetch_validators() == validators
+
+    # Months answered with 304s leave nothing to write, but their validators are still saved.
+    assert db_ops.upsert_data({}, "A", validators={"https://example.com/2020-02": (None, "Sat")}) == {}
+    assert len(db_ops.fetch_validators()) == 2
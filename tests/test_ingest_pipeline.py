@@ -0,0 +1,100 @@
+""" Tests for the multi-station ingest pipeline. """
+
+import calendar
+import os
+import queue
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import ingest_pipeline
+from conftest import table_page
+from data_quality import MISSING, OUT_OF_RANGE
+from ingest_pipeline import IngestPipeline, parse_worker
+from stations import Station, StationRegistry
+from synthetic_data import LocalWeatherServer
+
+
+def recent_months(count):
+    """ Returns the last count months, oldest first, ending with the current month. """
+    today = datetime.now()
+    index = today.year * 12 + today.month - 1
+    return [(month // 12, month % 12 + 1) for month in range(index - count + 1, index + 1)]
+
+
+def test_parse_worker_validates_the_rows_it_passes_on():
+    page_queue, row_queue, stats_queue = queue.Queue(), queue.Queue(), queue.Queue()
+    page_queue.put(("A", table_page([
+        ("June", 1, 2010, ["25.0", "10.0", "17.5"]),
+        ("June", 2, 2010, ["99.9", "M", "18.0"]),
+    ]).encode()))
+    page_queue.put(None)
+
+    parse_worker(page_queue, row_queue, stats_queue)
+
+    location, rows = row_queue.get_nowait()
+    assert location == "A"
+    assert dict(rows) == {
+        "2010-06-01": {"Max": 25.0, "Min": 10.0, "Mean": 17.5},
+        "2010-06-02": {"Max": None, "Min": None, "Mean": 18.0,
+                       "Flags": {"Max": OUT_OF_RANGE, "Min": MISSING}},
+    }
+    assert row_queue.get_nowait() is None
+    assert stats_queue.get_nowait()["items"] == 1
+
+
+def test_parse_worker_skips_a_malformed_page_and_still_signals_the_writer():
+    page_queue, row_queue, stats_queue = queue.Queue(), queue.Queue(), queue.Queue()
+    page_queue.put(("A", None))
+    page_queue.put(("A", table_page([("June", 1, 2010, ["25.0", "10.0", "17.5"])]).encode()))
+    page_queue.put(None)
+
+    parse_worker(page_queue, row_queue, stats_queue)
+
+    assert [row[0] for row in row_queue.get_nowait()[1]] == ["2010-06-01"]
+    assert row_queue.get_nowait() is None
+    assert stats_queue.get_nowait()["items"] == 1
+
+
+def test_station_registry_round_trips_through_json(tmp_path):
+    registry = StationRegistry([Station(1, "A", 1990), Station(2, "B")])
+    registry.add(Station(1, "A", 2000))
+    registry.save(tmp_path / "stations.json")
+
+    loaded = StationRegistry.load(tmp_path / "stations.json")
+    assert len(loaded) == 2
+    assert list(loaded) == [Station(1, "A", 2000), Station(2, "B", 1840)]
+    assert loaded.get(2).location == "B"
+    assert loaded.by_location("A").station_id == 1
+    assert loaded.by_location("C") is None
+    assert [station.station_id for station in StationRegistry()] == [27174]
+
+
+def test_pipeline_loads_every_station_from_a_local_server(tmp_path):
+    months = recent_months(3)
+    db_name = str(tmp_path / "weather.sqlite")
+    stations = [Station(1, "A"), Station(2, "B")]
+
+    with LocalWeatherServer(first_month=months[0]) as server:
+        report = IngestPipeline(stations, db_name, server.base_url, fetch_workers=2,
+                                parse_workers=1, concurrency=2, batch_size=50).run()
+
+    connection = sqlite3.connect(db_name)
+    counts = dict(connection.execute("select location, count(*) from weather group by location"))
+    connection.close()
+    days = sum(calendar.monthrange(year, month)[1] for year, month in months)
+    assert counts == {"A": days, "B": days}
+    assert report["fetch"]["items"] == report["parse"]["items"] == 2 * len(months)
+    assert report["write"]["items"] == 2 * days
+
+
+def test_pipeline_aborts_when_a_worker_dies(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, "parse_worker", lambda *args: os._exit(3))
+    pipeline = IngestPipeline([Station(1, "A")], str(tmp_path / "weather.sqlite"), "http://127.0.0.1:9/",
+                              fetch_workers=1, parse_workers=1)
+    pipeline.POLL_INTERVAL = 0.1
+
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        pipeline.run()
+    assert not any(process.is_alive() for process in pipeline.workers)
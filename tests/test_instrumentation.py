@@ -0,0 +1,112 @@
+""" Tests for the shared counters and timers, their percentiles and export, and the opt-in profiler. """
+
+import json
+import os
+
+import pytest
+
+import instrumentation
+from instrumentation import Metrics, Profiler, TimerStats
+
+
+@pytest.fixture
+def metrics():
+    """ Returns the Metrics registry emptied and enabled, restoring its contents afterwards. """
+    counters, timers, enabled = Metrics.counters, Metrics.timers, Metrics.enabled
+    Metrics.reset()
+    Metrics.enabled = True
+    yield Metrics
+    Metrics.counters, Metrics.timers, Metrics.enabled = counters, timers, enabled
+
+
+def test_percentiles_of_known_samples():
+    stats = TimerStats()
+    for milliseconds in range(100, 0, -1):
+        stats.add(milliseconds / 1000, items=2)
+
+    summary = stats.as_dict()
+    assert summary["count"] == 100
+    assert (summary["min"], summary["max"]) == (0.001, 0.1)
+    assert summary["total"] == pytest.approx(5.05)
+    assert summary["mean"] == pytest.approx(0.0505)
+    assert (summary["p50"], summary["p99"]) == (0.051, 0.1)
+    assert summary["items"] == 200
+    assert summary["items_per_sec"] == pytest.approx(200 / 5.05)
+
+    assert TimerStats().as_dict() == {"count": 0, "total": 0.0, "mean": None, "min": None, "max": 0.0,
+                                      "p50": None, "p99": None}
+
+
+def test_the_sample_of_durations_is_bounded(monkeypatch):
+    monkeypatch.setattr(TimerStats, "SAMPLE_SIZE", 10)
+    stats = TimerStats()
+    for index in range(1000):
+        stats.add(float(index))
+    assert len(stats.samples) == 10
+    assert stats.count == 1000 and stats.max == 999.0
+
+
+def test_counters_and_timer_items_add_up(metrics):
+    metrics.count("pages")
+    metrics.count("pages", 4)
+    metrics.observe("db.save_data", 0.5, items=100)
+    with metrics.timer("db.save_data") as timing:
+        timing.items = 50
+    with pytest.raises(ValueError):
+        with metrics.timer("plot.render"):
+            raise ValueError("no data")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"pages": 5}
+    assert snapshot["timers"]["db.save_data"]["count"] == 2
+    assert snapshot["timers"]["db.save_data"]["items"] == 150
+    assert snapshot["timers"]["plot.render"]["count"] == 1
+    assert "items" not in snapshot["timers"]["plot.render"]
+
+
+def test_disabled_metrics_record_nothing(metrics):
+    metrics.enabled = False
+    metrics.count("pages")
+    metrics.observe("db.fetch_range", 0.1)
+    with metrics.timer("db.save_data") as timing:
+        timing.items = 10
+    assert metrics.snapshot()["counters"] == {}
+    assert metrics.snapshot()["timers"] == {}
+
+
+def test_export_writes_a_json_snapshot(metrics, tmp_path):
+    metrics.count("scrape.pages", 3)
+    metrics.observe("scrape.fetch", 0.25, items=1)
+    metrics.export(tmp_path / "metrics.json")
+
+    exported = json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8"))
+    assert set(exported) == {"time", "pid", "counters", "timers"}
+    assert exported["counters"] == {"scrape.pages": 3}
+    assert exported["timers"]["scrape.fetch"] == {"count": 1, "total": 0.25, "mean": 0.25, "min": 0.25,
+                                                  "max": 0.25, "p50": 0.25, "p99": 0.25, "items": 1,
+                                                  "items_per_sec": 4.0}
+
+
+def test_profiler_writes_a_cpu_profile_and_an_allocation_listing(tmp_path):
+    profiler = Profiler(cpu=True, memory=True, output_dir=str(tmp_path), top=5).start()
+    sum(range(10000))
+    cpu, memory = profiler.stop()
+
+    assert cpu.endswith(".prof") and os.path.getsize(cpu) > 0
+    with open(memory, encoding="utf-8") as listing:
+        assert listing.readline().startswith("current ")
+        assert len(listing.readlines()) <= 5
+
+
+def test_environment_variables_switch_on_the_metrics_export_and_profiling(monkeypatch, tmp_path):
+    exits = []
+    monkeypatch.setattr(instrumentation.atexit, "register", lambda function, *args: exits.append((function, args)))
+    monkeypatch.setenv("WEATHER_METRICS", str(tmp_path / "metrics.json"))
+    monkeypatch.setenv("WEATHER_PROFILE", " cpu ,")
+    monkeypatch.setenv("WEATHER_PROFILE_DIR", str(tmp_path / "profiles"))
+
+    instrumentation.configure_from_environment()
+    assert exits[0] == (Metrics.export, (str(tmp_path / "metrics.json"),))
+    profiler = exits[1][0].__self__
+    assert (profiler.cpu, profiler.memory, profiler.output_dir) == (True, False, str(tmp_path / "profiles"))
+    assert len(profiler.stop()) == 1
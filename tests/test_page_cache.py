@@ -0,0 +1,81 @@
+""" Tests for the on-disk page cache: freshness of cached months, deduplication and replay. """
+
+import os
+from datetime import date, datetime
+
+from conftest import table_page
+from fetch_engine import FetchEngine
+from page_cache import PageCache
+from scrape_weather import WeatherScraper
+
+
+def june_page(day, mean):
+    """ Returns the bytes of a June 2010 page holding one day. """
+    return table_page([("June", day, 2010, [str(mean + 5), str(mean - 5), str(mean)])]).encode()
+
+
+def backdate(cache, station_id, year, month, fetched_at):
+    """ Rewrites the time a cached month was fetched at. """
+    digest, _ = cache.read_ref(station_id, year, month)
+    PageCache.write_atomic(cache.ref_path(station_id, year, month), f"{digest} {fetched_at.isoformat()}".encode())
+
+
+def test_only_months_fetched_after_they_closed_are_fresh(tmp_path):
+    cache = PageCache(tmp_path)
+    today = date.today()
+    cache.put(1, 2010, 6, b"june")
+    cache.put(1, today.year, today.month, b"current")
+
+    assert cache.is_fresh(1, 2010, 6)
+    assert cache.get_fresh(1, 2010, 6) == b"june"
+    assert not cache.is_fresh(1, today.year, today.month)
+    assert cache.get_fresh(1, today.year, today.month) is None
+    assert not cache.is_fresh(1, 2010, 7)
+
+    # A copy taken while the month was still open may be missing its last days.
+    backdate(cache, 1, 2010, 6, datetime(2010, 6, 20))
+    assert not cache.is_fresh(1, 2010, 6)
+    assert cache.get(1, 2010, 6) == b"june"
+    backdate(cache, 1, 2010, 6, datetime(2010, 7, 1))
+    assert cache.is_fresh(1, 2010, 6, today=date(2010, 7, 1))
+    assert not cache.is_fresh(1, 2010, 6, today=date(2010, 6, 30))
+
+
+def test_identical_pages_are_stored_once_and_stale_copies_pruned(tmp_path):
+    cache = PageCache(tmp_path)
+    cache.put(1, 2010, 6, b"same")
+    cache.put(2, 2010, 6, b"same")
+    cache.put(1, 2010, 7, b"first copy")
+    cache.put(1, 2010, 7, b"second copy")
+
+    objects = [name for _, _, names in os.walk(cache.objects_dir) for name in names]
+    assert len(objects) == 3
+    assert cache.prune() == 1
+    assert cache.get(1, 2010, 7) == b"second copy"
+    assert cache.get(2, 2010, 6) == b"same"
+    assert cache.months(1) == [(2010, 6), (2010, 7)]
+    assert cache.months(3) == []
+
+
+def test_fresh_months_are_served_from_the_cache_without_a_request(tmp_path, http_server):
+    http_server.route("/daily", {"body": june_page(1, 20.0)})
+    scraper = WeatherScraper(base_url=http_server.url("/daily"), cache=PageCache(tmp_path), station_id=1)
+    url = scraper.month_url(2010, 6)
+
+    with FetchEngine() as engine:
+        assert scraper.fetch_month(engine, (2010, 6), url)["2010-06-01"]["Mean"] == 20.0
+        assert scraper.fetch_month(engine, (2010, 6), url)["2010-06-01"]["Mean"] == 20.0
+    assert len(http_server.requests) == 1
+    assert scraper.cache.get(1, 2010, 6) == june_page(1, 20.0)
+
+
+def test_replay_rebuilds_the_weather_data_from_the_cache_alone(tmp_path):
+    cache = PageCache(tmp_path)
+    cache.put(1, 2010, 6, june_page(1, 20.0))
+    cache.put(1, 2010, 5, table_page([("May", 31, 2010, ["15.0", "5.0", "10.0"])]).encode())
+    cache.put(2, 2010, 6, june_page(2, -1.0))
+
+    scraper = WeatherScraper(base_url="http://127.0.0.1:9/unreachable", cache=cache, station_id=1)
+    weather = scraper.replay_weather_data()
+    assert sorted(weather) == ["2010-05-31", "2010-06-01"]
+    assert weather["2010-05-31"] == {"Max": 15.0, "Min": 5.0, "Mean": 10.0}
@@ -0,0 +1,61 @@
+""" Tests for the on-disk plot cache and the cached plot operations in front of it. """
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import days
+from db_operations import DBOperations
+from plot_cache import CachedPlotOperations, PlotCache
+
+
+def cached_files(directory):
+    """ Returns the names and total size of the files in a cache directory. """
+    files = {name: os.path.getsize(os.path.join(root, name))
+             for root, _, names in os.walk(directory) for name in names}
+    return files, sum(files.values())
+
+
+def test_size_limit_holds_across_caches_sharing_a_directory(tmp_path):
+    first, second = PlotCache(tmp_path, max_bytes=250), PlotCache(tmp_path, max_bytes=250)
+    for index in range(6):
+        (first if index % 2 else second).put(PlotCache.key(index, suffix=".png"), bytes(100))
+
+    files, total = cached_files(tmp_path)
+    assert total <= 250
+    assert len(files) == 2 and PlotCache.key(5, suffix=".png") in files
+    assert PlotCache(tmp_path, max_bytes=250).total_bytes == total
+
+
+def test_series_are_cached_without_pickles(db_ops, tmp_path):
+    db_ops.save_data({**days("2020-01", 31), **days("2020-02", 29)}, "A")
+    plots = CachedPlotOperations(db_ops, PlotCache(tmp_path / "cache"))
+
+    stats = plots.boxplot_stats(2020, 2020, "A")
+    series = plots.lineplot_series(2020, 2, "A")
+    files, _ = cached_files(tmp_path / "cache")
+    assert sorted(os.path.splitext(name)[1] for name in files) == [".json", ".npz"]
+
+    cached_stats = plots.boxplot_stats(2020, 2020, "A")
+    cached_series = plots.lineplot_series(2020, 2, "A")
+    assert [month["count"] for month in cached_stats] == [month["count"] for month in stats]
+    for month, expected in zip(cached_stats, stats):
+        assert month["med"] == pytest.approx(expected["med"], nan_ok=True)
+        assert month["fliers"].tolist() == pytest.approx(expected["fliers"].tolist())
+    assert np.array_equal(cached_series[0], series[0])
+    assert np.array_equal(cached_series[1], series[1])
+
+
+def test_a_replaced_database_does_not_reuse_the_old_entries(db_ops, tmp_path):
+    plots = CachedPlotOperations(db_ops, PlotCache(tmp_path / "cache"))
+    before = plots.entry_name("line", "A", 2020, 1, "1.1", ".png")
+    assert plots.entry_name("line", "A", 2020, 1, "1.1", ".png") == before
+
+    shutil.copy(db_ops.db_name, tmp_path / "replacement.sqlite")
+    os.replace(tmp_path / "replacement.sqlite", db_ops.db_name)
+    assert plots.entry_name("line", "A", 2020, 1, "1.1", ".png") != before
+
+    other = CachedPlotOperations(DBOperations(str(tmp_path / "replacement.sqlite")), plots.cache)
+    assert other.entry_name("line", "A", 2020, 1, "1.1", ".png") != before
@@ -0,0 +1,32 @@
+""" Tests for the headless batch plot renderer. """
+
+import os
+
+import matplotlib
+
+from conftest import days
+from plot_renderer import PlotRenderer, expand_spec
+
+
+def test_expand_spec_splits_box_plots_into_spans(tmp_path):
+    jobs = expand_spec({"kind": "box", "location": "Winnipeg, MB", "years": [2000, 2004], "span": 2}, tmp_path)
+    assert [(job.year, job.end_year) for job in jobs] == [(2000, 2001), (2002, 2003), (2004, 2004)]
+    assert os.path.basename(jobs[0].path) == "box_2000-2001.png"
+
+
+def test_single_process_render_leaves_the_matplotlib_backend_alone(db_ops, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("the backend was changed")
+
+    monkeypatch.setattr(matplotlib, "use", fail)
+    db_ops.save_data({**days("2020-01", 31), **days("2020-02", 29)}, "Winnipeg, MB")
+    spec = [{"kind": "line", "years": [2020, 2020], "months": [1, 2, 3], "format": "svg"},
+            {"kind": "box", "years": [2020, 2020]}]
+
+    for cache_dir in (None, str(tmp_path / "cache")):
+        result = PlotRenderer(db_ops.db_name, str(tmp_path / "plots"), processes=1,
+                              cache_dir=cache_dir).render(spec)
+        assert sorted(os.path.basename(path) for path in result["rendered"]) == [
+            "box_2020-2020.png", "line_2020-01.svg", "line_2020-02.svg"]
+        assert result["skipped"] == 1
+        assert all(os.path.getsize(path) for path in result["rendered"])
@@ -0,0 +1,108 @@
+""" Tests for the quantile sketches and the monthly rollups maintained on every write. """
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from aggregation import (decode_sketch, encode_sketch, grouped_boxplot_stats, merge_sketches,
+                         rollup_boxplot_stats)
+from conftest import days
+
+
+def test_sketch_round_trip():
+    values, counts = decode_sketch(encode_sketch([1.5, -2.0, 1.5, 0.1]))
+    assert values.tolist() == [-2.0, 0.1, 1.5]
+    assert counts.tolist() == [1, 1, 2]
+
+
+def test_merged_sketches_equal_the_sketch_of_all_values():
+    first, second = [1.0, 2.0, 2.0, -3.3], [2.0, 7.1]
+    merged = merge_sketches([encode_sketch(first), encode_sketch(second), b""])
+    expected = decode_sketch(encode_sketch(first + second))
+    assert merged[0].tolist() == expected[0].tolist()
+    assert merged[1].tolist() == expected[1].tolist()
+
+
+def test_rollup_boxplot_stats_match_the_raw_values():
+    rng = np.random.default_rng(3)
+    rollups, groups, values = [], [], []
+    for year in range(5):
+        for month in range(1, 13):
+            means = np.round(rng.normal(month, 6, 28), 1)
+            rollups.append((month, len(means), means.sum(), encode_sketch(means)))
+            groups.extend([month - 1] * len(means))
+            values.extend(means)
+
+    stats = rollup_boxplot_stats(rollups)
+    expected = grouped_boxplot_stats(np.array(groups), np.array(values), 12)
+    for month, reference in zip(stats, expected):
+        assert month["count"] == reference["count"]
+        for key in ("mean", "med", "q1", "q3", "whislo", "whishi"):
+            assert month[key] == pytest.approx(reference[key])
+        assert sorted(month["fliers"]) == pytest.approx(sorted(reference["fliers"]))
+
+
+def test_rollups_follow_writes(db_ops):
+    db_ops.save_data(days("2020-01", 10), "A")
+    db_ops.save_data(days("2020-02", 5), "A")
+    first_version = db_ops.fetch_data_version("A", (2020, 1), (2020, 1))
+
+    db_ops.save_data(days("2020-01", 5, start=11), "A")
+    rollups = {row[0]: row for row in db_ops.fetch_monthly_rollups(2020, 2020, "A")}
+    means = [day["Mean"] for day in days("2020-01", 15).values()]
+    month, day_count, mean_sum, sketch = rollups[1]
+    assert day_count == 15
+    assert mean_sum == pytest.approx(sum(means))
+    assert decode_sketch(sketch)[1].sum() == 15
+    assert rollups[2][1] == 5
+    assert db_ops.fetch_data_version("A", (2020, 1), (2020, 1)) != first_version
+
+
+def test_rollups_are_kept_per_location(db_ops):
+    db_ops.save_data(days("2020-01", 10), "A")
+    db_ops.save_data(days("2020-01", 3), "B")
+    assert [row[1] for row in db_ops.fetch_monthly_rollups(2020, 2020, "A")] == [10]
+    assert [row[1] for row in db_ops.fetch_monthly_rollups(2020, 2020, "B")] == [3]
+
+
+def test_rollups_summarized_in_memory_match_a_rebuild_from_the_stored_rows(db_ops):
+    weather = {**days("2021-01", 31, mean=-20.0), **days("2020-12", 31), **days("2020-11", 4, mean=25.0)}
+    weather["2020-12-05"] = {"Max": None, "Min": -5.0, "Mean": None, "Flags": {"Max": "M", "Mean": "M"}}
+    weather["2021-01-09"] = {"Max": 1.0, "Min": None, "Mean": 0.5, "Flags": {"Min": "M"}}
+    db_ops.save_data(weather, "A")
+    db_ops.save_data(days("2021-02", 3), "A")
+
+    def derived_tables():
+        connection = sqlite3.connect(db_ops.db_name)
+        tables = {table: connection.execute(f"select * from {table} order by year, month").fetchall()
+                  for table in ("weather_monthly", "climate_monthly", "weather_coverage")}
+        connection.close()
+        return tables
+
+    in_memory = derived_tables()
+    connection = sqlite3.connect(db_ops.db_name)
+    db_ops.update_rollups(connection.cursor(), "A", ["2020-11", "2020-12", "2021-01", "2021-02"])
+    connection.commit()
+    connection.close()
+
+    rebuilt = derived_tables()
+    assert [len(rows) for rows in rebuilt.values()] == [4, 4, 4]
+    for table, rows in rebuilt.items():
+        assert in_memory[table] == pytest.approx(rows), table
+    november = [day["Mean"] for day in days("2020-11", 4, mean=25.0).values()]
+    assert rebuilt["weather_monthly"][0][-1] == encode_sketch(november)
+
+
+def test_save_data_counts_new_rows_across_statements_and_ignores_duplicates(db_ops):
+    db_ops.save_data(days("2020-01", 10), "A")
+    rows = list(days("2020-01", 31).items()) + list(days("2020-02", 29).items())
+    rows.append(("2020-02-01", {"Max": 50.0, "Min": 40.0, "Mean": 45.0}))
+    for month in range(3, 13):
+        rows.extend(days(f"2020-{month:02d}", 28).items())
+
+    # Rows already stored, and the repeated day, are ignored, so the rollups are read back from the table.
+    assert db_ops.save_data(iter(rows), "A", chunk_size=150) == 21 + 29 + 10 * 28
+    rollups = {row[0]: row for row in db_ops.fetch_monthly_rollups(2020, 2020, "A")}
+    assert [rollups[month][1] for month in range(1, 13)] == [31, 29] + [28] * 10
+    assert rollups[2][2] == pytest.approx(sum(day["Mean"] for day in days("2020-02", 29).values()))
@@ -0,0 +1,92 @@
+""" Tests for the storage backends and the converter between them. """
+
+import os
+
+import numpy as np
+import pytest
+
+from conftest import days
+from data_quality import MISSING
+from db_operations import DBOperations
+from dbcm import ConnectionPool
+from storage import ColumnarBackend, SQLiteBackend, StorageBackend, convert
+from weather_store import WeatherStore
+
+
+def stored_days(db_ops):
+    """ Returns the rows of locations A and B as dictionaries, with temperatures rounded to a tenth
+    as they are once stored in the float32 columns. """
+    return {location: {date: {key: round(value, 1) if isinstance(value, float) else value
+                              for key, value in day.items()}
+                       for date, day in db_ops.fetch_range("0000-01-01", "9999-12-31", location).items()}
+            for location in ("A", "B")}
+
+
+def test_storage_backends_must_implement_every_method():
+    class ReadOnly(StorageBackend):
+        def locations(self):
+            return []
+
+        def read(self, location, start_date=None, end_date=None):
+            return None
+
+    with pytest.raises(TypeError):
+        StorageBackend()
+    with pytest.raises(TypeError):
+        ReadOnly()
+
+
+def test_convert_round_trips_between_sqlite_and_npy_partitions(db_ops, tmp_path):
+    weather = {**days("1999-12", 31), **days("2000-01", 31), **days("2011-05", 3)}
+    weather["2000-01-02"] = {"Max": None, "Min": -12.0, "Mean": None, "Flags": {"Max": MISSING, "Mean": MISSING}}
+    weather["2011-05-01"]["Flags"] = {"Min": "E", "Mean": "†"}
+    db_ops.save_data(weather, "A")
+    db_ops.save_data(days("1985-07", 10, mean=20.0), "B")
+
+    columnar = ColumnarBackend(str(tmp_path / "columnar"))
+    assert convert(SQLiteBackend(db_ops), columnar) == 65 + 10
+    assert columnar.locations() == ["A", "B"]
+    assert columnar.manifest()["A"]["decades"] == [1990, 2000, 2010]
+    assert columnar.version("A") == SQLiteBackend(db_ops).version("A")
+
+    span = columnar.read("A", "1999-12-30", "2000-01-02")
+    assert span.days().tolist() == [30, 31, 1, 2]
+    assert np.isnan(span.mean[-1]) and span.min[-1] == -12.0
+    assert span.quality.tolist() == ["", "", "", "M-M"]
+
+    copy = DBOperations(str(tmp_path / "copy.sqlite"))
+    copy.initialize_db()
+    assert convert(columnar, SQLiteBackend(copy)) == 75
+    assert stored_days(copy) == stored_days(db_ops)
+    assert stored_days(copy)["A"]["2011-05-01"]["Flags"] == {"Min": "E", "Mean": "†"}
+    ConnectionPool.release(copy.db_name)
+
+
+def test_reads_fall_back_to_sqlite_once_a_write_bumps_the_version(db_ops, tmp_path):
+    db_ops.save_data(days("2020-01", 10), "A")
+    columnar_dir = str(tmp_path / "columnar")
+    convert(SQLiteBackend(db_ops), ColumnarBackend(columnar_dir))
+
+    reader = DBOperations(db_ops.db_name, columnar_dir=columnar_dir)
+    assert reader.columnar_backend("A") is not None
+    assert len(reader.fetch_range("2020-01-01", "2020-01-31", "A", columnar=True)) == 10
+
+    db_ops.save_data(days("2020-01", 2, start=11), "A")
+    assert reader.columnar_backend("A") is None
+    assert len(reader.fetch_range("2020-01-01", "2020-01-31", "A", columnar=True)) == 12
+    assert reader.columnar_backend("B") is None
+
+
+def test_a_rewrite_goes_to_a_new_generation_and_leaves_mapped_readers_alone(tmp_path):
+    columnar = ColumnarBackend(str(tmp_path / "columnar"))
+    columnar.write("A", WeatherStore.from_dict(days("2020-01", 5)), version=1)
+    before = columnar.read("A")
+    assert os.listdir(tmp_path / "columnar" / "a") == ["2020.1"]
+
+    columnar.write("A", WeatherStore.from_dict(days("2020-01", 3, mean=5.0)), version=2)
+    assert columnar.manifest()["A"]["generation"] == 2
+    assert os.listdir(tmp_path / "columnar" / "a") == ["2020.2"]
+    assert columnar.read("A").mean.tolist() == pytest.approx([5.1, 5.2, 5.3])
+
+    # The days mapped before the rewrite are still those of the first generation.
+    assert before.mean.tolist() == pytest.approx([-9.9, -9.8, -9.7, -9.6, -9.5])
@@ -0,0 +1,71 @@
+""" Tests for the WeatherService behind the non-interactive CLI and its NDJSON serve mode. """
+
+import io
+import json
+
+import pytest
+
+import weather_cli
+from conftest import days
+from weather_cli import WeatherService
+
+
+@pytest.fixture
+def service(db_ops):
+    """ Returns a WeatherService over the test database, holding January 2020 for location A. """
+    db_ops.save_data(days("2020-01", 31), "A")
+    return WeatherService(db_ops.db_name)
+
+
+def test_query_answers_with_the_operation_result_and_echoes_the_id(service):
+    response = service.query({"op": "stats", "id": 7, "kind": "summary", "location": "A"})
+    assert response == {"id": 7, "ok": True, "location": "A", "days": 31,
+                        "first_date": "2020-01-01", "last_date": "2020-01-31"}
+
+
+@pytest.mark.parametrize("query, error", [
+    ({"op": "delete"}, "Unknown operation: delete"),
+    ({"op": "stats", "kind": "weekly", "location": "A"}, "Unknown stats kind: weekly"),
+    ({"op": "stats", "kind": "daily", "location": "A"}, "Daily stats need a start and an end date."),
+    ({"op": "stats", "location": "A", "colour": "red"}, "unexpected keyword argument 'colour'"),
+    ({"op": "update", "location": "Nowhere"}, "No data stored for Nowhere, run a download first."),
+    ({"op": "plot", "kind": "line", "location": "A"}, "Line plots need a year and a month."),
+])
+def test_query_returns_errors_instead_of_raising(service, query, error):
+    response = service.query({"id": "q", **query})
+    assert response["id"] == "q"
+    assert response["ok"] is False
+    assert error in response["error"]
+
+
+def test_serve_answers_each_line_and_survives_bad_ones(service):
+    lines = ['{"op": "stats", "kind": "summary", "location": "A", "id": 1}\n', "\n",
+             "{not json\n", "[1, 2]\n", '{"op": "stats", "kind": "daily", "location": "A", '
+             '"start": "2020-01-02", "end": "2020-01-03", "id": 2}\n']
+    out = io.StringIO()
+    service.serve(lines, out)
+
+    responses = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [response["ok"] for response in responses] == [True, False, False, True]
+    assert responses[1]["error"].startswith("Invalid query:")
+    assert responses[2]["error"] == "Invalid query: A query must be a JSON object."
+    assert [day["date"] for day in responses[3]["days"]] == ["2020-01-02", "2020-01-03"]
+
+
+def test_store_is_reloaded_only_after_the_data_version_changes(service, db_ops):
+    first = service.store("A")
+    assert service.store("A") is first
+
+    db_ops.save_data(days("2020-02", 3), "A")
+    second = service.store("A")
+    assert second is not first
+    assert (len(first), len(second)) == (31, 34)
+    assert service.store("A") is second
+
+
+def test_main_prints_the_response_and_exits_non_zero_on_errors(service, capsys):
+    assert weather_cli.main(["--db", service.db_ops.db_name, "stats", "--location", "A"]) == 0
+    assert json.loads(capsys.readouterr().out)["days"] == 31
+
+    assert weather_cli.main(["--db", service.db_ops.db_name, "stats", "daily", "--location", "A"]) == 1
+    assert json.loads(capsys.readouterr().out)["ok"] is False
@@ -0,0 +1,141 @@
+""" Tests for the queued JSON logger: per-site rate limits, JSON records, one-time setup and flushing. """
+
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import sys
+
+import pytest
+
+import weather_logger
+from weather_logger import JSONFormatter, RateLimitFilter, WeatherLogger
+
+
+def record(level=logging.INFO, line=10, **extra):
+    """ Returns a log record from one call site, with any extra fields set on it. """
+    return logging.makeLogRecord({"name": "log", "levelno": level, "levelname": logging.getLevelName(level),
+                                  "pathname": "scrape_weather.py", "lineno": line, "msg": "Fetched %s",
+                                  "args": ("2020-01",), **extra})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Returns a list holding the time seen by the rate limit filter, which only moves when a test moves it. """
+    now = [1000.0]
+    monkeypatch.setattr(weather_logger.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    """ Returns the path of a log file written by a freshly configured WeatherLogger,
+    putting the previous configuration back afterwards. """
+    def unconfigure():
+        WeatherLogger.shutdown()
+        for handler in queue_handlers():
+            logging.getLogger("log").removeHandler(handler)
+        WeatherLogger.configured = False
+
+    previous = WeatherLogger.log_file
+    unconfigure()
+    WeatherLogger.log_file = str(tmp_path / "weather.log")
+    yield tmp_path / "weather.log"
+    unconfigure()
+    WeatherLogger.log_file = previous
+
+
+def queue_handlers():
+    """ Returns the queue handlers attached to the application's logger. """
+    return [handler for handler in logging.getLogger("log").handlers
+            if isinstance(handler, logging.handlers.QueueHandler)]
+
+
+def logged(path):
+    """ Returns the JSON records in a log file. """
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def log_from_child(message):
+    """ Logs a message from a forked child process, which leaves without running atexit. """
+    WeatherLogger().get_logger().info(message)
+
+
+def test_a_call_site_is_dropped_once_its_burst_is_used_but_warnings_pass(clock):
+    rate_limit = RateLimitFilter(rate=1.0, burst=3)
+    assert [rate_limit.filter(record()) for _ in range(5)] == [True, True, True, False, False]
+    assert not rate_limit.filter(record(logging.DEBUG))
+    assert rate_limit.filter(record(logging.WARNING))
+    assert rate_limit.filter(record(logging.ERROR))
+
+    # Other call sites have buckets of their own.
+    assert rate_limit.filter(record(line=11))
+
+
+def test_the_next_record_let_through_counts_the_suppressed_ones(clock):
+    rate_limit = RateLimitFilter(rate=2.0, burst=1)
+    assert rate_limit.filter(record())
+    for _ in range(4):
+        assert not rate_limit.filter(record())
+
+    clock[0] += 0.5
+    passed = record()
+    assert rate_limit.filter(passed)
+    assert passed.suppressed == 4
+
+    clock[0] += 0.5
+    following = record()
+    assert rate_limit.filter(following)
+    assert not hasattr(following, "suppressed")
+
+
+def test_json_records_carry_the_extra_fields():
+    try:
+        raise ValueError("bad cell")
+    except ValueError:
+        failed = record(logging.ERROR, exc_info=sys.exc_info(), station=27174, month="2020-01")
+
+    entry = json.loads(JSONFormatter().format(failed))
+    assert entry["level"] == "ERROR"
+    assert entry["message"] == "Fetched 2020-01"
+    assert (entry["station"], entry["month"]) == (27174, "2020-01")
+    assert (entry["logger"], entry["line"]) == ("log", 10)
+    assert "ValueError: bad cell" in entry["exception"]
+    assert "exc_info" not in entry and "args" not in entry
+
+
+def test_handlers_are_attached_once_however_many_loggers_are_created(log_file):
+    WeatherLogger()
+    handlers = queue_handlers()
+    assert len(handlers) == 1
+
+    WeatherLogger()
+    WeatherLogger()
+    assert queue_handlers() == handlers
+    assert len(WeatherLogger.listener.handlers) == 2
+
+
+def test_queued_records_are_written_on_shutdown(log_file):
+    logger = WeatherLogger().get_logger()
+    for index in range(WeatherLogger.burst + 5):
+        logger.info("Row %d", index, extra={"row": index})
+    logger.warning("Done")
+    WeatherLogger.shutdown()
+
+    entries = logged(log_file)
+    assert [entry["row"] for entry in entries[:-1]] == list(range(WeatherLogger.burst))
+    assert entries[-1]["message"] == "Done"
+    assert WeatherLogger.listener is None
+
+
+def test_a_forked_child_flushes_its_queued_records_when_it_exits(log_file):
+    WeatherLogger().get_logger().info("From the parent")
+    child = multiprocessing.get_context("fork").Process(target=log_from_child, args=("From the child",))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    WeatherLogger.shutdown()
+
+    entries = logged(log_file)
+    assert sorted(entry["message"] for entry in entries) == ["From the child", "From the parent"]
+    assert len({entry["process"] for entry in entries}) == 2
@@ -0,0 +1,78 @@
+""" Tests for the lazy start of the interactive WeatherProcessor. """
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import days
+from db_operations import DBOperations
+from dbcm import ConnectionPool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+START_SCRIPT = """
+import json, sys
+from unittest import mock
+from weather_logger import WeatherLogger
+WeatherLogger.log_file = "test.log"
+import db_operations
+with mock.patch.object(db_operations.DBOperations, "fetch_data") as fetch_data, \\
+        mock.patch.object(db_operations.DBOperations, "initialize_db") as initialize_db:
+    import weather_processor
+    processor = weather_processor.WeatherProcessor()
+loaded = sorted({name.split(".")[0] for name in sys.modules}
+                & {"matplotlib", "scrape_weather", "plot_operations", "weather_store", "numpy"})
+print(json.dumps({"loaded": loaded, "fetch_data": fetch_data.called, "initialize_db": initialize_db.called,
+                  "last_date": processor.last_date, "options": len(processor.options)}))
+"""
+
+
+@pytest.fixture
+def database_dir(tmp_path):
+    """ Returns a directory holding a weather_data.sqlite with a few days of Winnipeg data. """
+    db_ops = DBOperations(str(tmp_path / "weather_data.sqlite"))
+    db_ops.initialize_db()
+    db_ops.save_data(days("2020-01", 5), "Winnipeg, MB")
+    ConnectionPool.release(db_ops.db_name)
+    return tmp_path
+
+
+def start(cwd):
+    """ Constructs a WeatherProcessor in a fresh interpreter and returns what its start loaded. """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get("PYTHONPATH")))))
+    output = subprocess.run([sys.executable, "-c", START_SCRIPT], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_the_menu_is_built_without_the_scraper_plotting_dataset_or_migrations(database_dir):
+    started = start(database_dir)
+    assert started["loaded"] == []
+    assert not started["fetch_data"]
+    assert not started["initialize_db"]
+    assert (started["last_date"], started["options"]) == ("2020-01-05", 5)
+
+
+def test_an_empty_directory_starts_with_only_the_download_option(tmp_path):
+    started = start(tmp_path)
+    assert started["loaded"] == []
+    assert (started["last_date"], started["options"]) == (None, 2)
+
+
+def test_the_database_is_initialized_once_on_first_use(database_dir, monkeypatch):
+    import weather_processor
+
+    monkeypatch.chdir(database_dir)
+    calls = []
+    monkeypatch.setattr(DBOperations, "initialize_db", lambda db_ops: calls.append(db_ops.db_name))
+    processor = weather_processor.WeatherProcessor()
+    assert calls == []
+
+    assert len(processor.weather_data) == 5
+    assert len(processor.weather_data) == 5
+    processor.initialize_db()
+    assert calls == ["weather_data.sqlite"]
+    ConnectionPool.release(processor.db_ops.db_name)
@@ -0,0 +1,103 @@
+""" Tests for the asyncio HTTP query service and its version-checked response cache. """
+
+import asyncio
+import http.client
+import json
+import threading
+
+import pytest
+
+from conftest import days
+from weather_service import HTTPError, WeatherHTTPService
+
+
+@pytest.fixture
+def service(db_ops, tmp_path):
+    """ Returns a WeatherHTTPService listening on a free port in a background event loop,
+    over a database holding January 2020 for location A. """
+    db_ops.save_data(days("2020-01", 31), "A")
+    service = WeatherHTTPService(db_ops.db_name, port=0, threads=2, plot_cache_dir=str(tmp_path / "plots"))
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start())
+    service.port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    yield service
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+    service.close()
+
+
+def request(conn, target, method="GET"):
+    """ Sends a request and returns its status, content type and body. """
+    conn.request(method, target)
+    response = conn.getresponse()
+    return response.status, response.getheader("Content-Type"), response.read()
+
+
+def test_queries_round_trip_over_one_keep_alive_connection(service):
+    conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=10)
+
+    status, content_type, body = request(conn, "/range?location=A&start=2020-01-02&end=2020-01-03")
+    assert (status, content_type) == (200, "application/json")
+    assert json.loads(body) == {"location": "A", "days": [
+        {"date": "2020-01-02", "min": -14.8, "max": -4.8, "mean": -9.8},
+        {"date": "2020-01-03", "min": -14.7, "max": -4.7, "mean": -9.7}]}
+
+    status, _, body = request(conn, "/yearly?location=A")
+    assert status == 200
+    assert [year["year"] for year in json.loads(body)["years"]] == [2020]
+
+    status, content_type, body = request(conn, "/plot/line?location=A&year=2020&month=1&format=svg")
+    assert (status, content_type) == (200, "image/svg+xml")
+    assert b"<svg" in body
+    conn.close()
+
+
+@pytest.mark.parametrize("target, status, error", [
+    ("/nowhere", 404, "No such endpoint: /nowhere"),
+    ("/range?location=A&start=2020-01-01", 400, "Query parameters start and end are required."),
+    ("/range?location=A&start=soon&end=later", 400, "Malformed query"),
+    ("/yearly?start_year=last", 400, "Query parameter start_year must be an integer."),
+    ("/plot/box?start_year=2020&end_year=2020&format=gif", 400, "Unsupported format: gif"),
+    ("/plot/line?location=A&year=2019&month=1", 404, "There is no data to plot."),
+])
+def test_bad_queries_are_answered_with_json_errors(service, target, status, error):
+    conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=10)
+    response_status, content_type, body = request(conn, target)
+    assert (response_status, content_type) == (status, "application/json")
+    assert error in json.loads(body)["error"]
+
+    # The connection stays usable after an error response.
+    assert request(conn, "/yearly?location=A")[0] == 200
+    conn.close()
+
+
+def test_other_methods_are_refused_and_the_connection_closed(service):
+    conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=10)
+    conn.request("POST", "/range", body=b"{}")
+    response = conn.getresponse()
+    assert response.status == 405
+    assert response.getheader("Connection") == "close"
+    conn.close()
+
+
+def test_cached_responses_are_rebuilt_once_the_data_version_changes(service, db_ops):
+    target = "/yearly?location=A"
+    first = service.answer(target)
+    assert service.answer(target) is first
+    assert (service.cache.hits, service.cache.misses) == (1, 1)
+
+    db_ops.save_data(days("2021-01", 2), "A")
+    rebuilt = service.answer(target)
+    assert rebuilt is not first
+    assert [year["year"] for year in json.loads(rebuilt[1])["years"]] == [2020, 2021]
+
+    with pytest.raises(HTTPError) as error:
+        service.answer("/monthly?start_year=x")
+    assert error.value.status == 400
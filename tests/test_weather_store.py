@@ -0,0 +1,58 @@
+""" Tests for the columnar WeatherStore and the columnar reads which build it. """
+
+import math
+
+import pytest
+
+from conftest import days
+from weather_store import WeatherStore
+
+
+def test_from_rows_sorts_by_date_and_keeps_missing_values_as_nan():
+    store = WeatherStore.from_rows([
+        ("2020-01-03", -5.0, 1.0, -2.0),
+        ("2019-12-31", None, 2.5, None),
+        ("2020-01-01", -8.0, -1.0, -4.5),
+    ])
+    assert (store.first_date, store.last_date) == ("2019-12-31", "2020-01-03")
+    assert store.days().tolist() == [31, 1, 3]
+    assert math.isnan(store.min[0]) and math.isnan(store.mean[0])
+    assert store.max.tolist() == [2.5, -1.0, 1.0]
+    assert len(WeatherStore.from_rows([])) == 0
+
+
+def test_upsert_overwrites_existing_days_and_inserts_new_ones_in_order():
+    store = WeatherStore.from_dict(days("2020-01", 5, start=2))
+    store.upsert({
+        "2020-01-03": {"Min": -30.0, "Max": -20.0, "Mean": -25.0},
+        "2020-01-01": {"Min": 1.0, "Max": 2.0, "Mean": 1.5},
+        "2020-01-09": {"Min": None, "Max": 3.0, "Mean": None, "Flags": {"Min": "M", "Mean": "M"}},
+    })
+    assert store.days().tolist() == [1, 2, 3, 4, 5, 6, 9]
+    data = store.to_dict()
+    assert data["2020-01-03"] == {"Min": -30.0, "Max": -20.0, "Mean": -25.0}
+    assert data["2020-01-01"] == {"Min": 1.0, "Max": 2.0, "Mean": 1.5}
+    assert data["2020-01-09"] == {"Min": None, "Max": 3.0, "Mean": None, "Flags": {"Min": "M", "Mean": "M"}}
+    assert store.quality.tolist() == ["", "", "", "", "", "", "-MM"]
+    assert list(data)[0] == "2020-01-09"
+
+
+def test_slice_and_month_are_inclusive_of_both_ends():
+    store = WeatherStore.from_dict({**days("2020-01", 31), **days("2020-02", 29), **days("2020-03", 2)})
+    assert len(store.slice("2020-01-31", "2020-02-02")) == 3
+    assert len(store.slice("2019-01-01", "2019-12-31")) == 0
+    february = store.month(2020, 2)
+    assert (february.first_date, february.last_date, len(february)) == ("2020-02-01", "2020-02-29", 29)
+    assert len(store.month(2020, 12)) == 0
+    assert len(store.year_span(2020, 2020)) == 62
+
+
+def test_fetch_data_reads_only_the_given_location(db_ops):
+    db_ops.save_data(days("2020-01", 10), "A")
+    db_ops.save_data(days("2020-01", 3, mean=5.0), "B")
+
+    store = db_ops.fetch_data("B", columnar=True)
+    assert len(store) == 3
+    assert store.mean.tolist() == pytest.approx([5.1, 5.2, 5.3])
+    assert len(db_ops.fetch_data("A")) == 10
+    assert len(db_ops.fetch_data("C", columnar=True)) == 0
@@ -0,0 +1,287 @@
+"""
+This module contains the WeatherService class and the command line interface of the application,
+which runs downloads, updates, statistics queries and plots without the interactive menu
+and prints the results as JSON.
+The serve command keeps the datasets loaded and answers newline-delimited JSON queries
+read from stdin, one JSON response per line, so many queries share a single startup.
+"""
+
+import argparse
+import json
+import math
+import sys
+from db_operations import DBOperations
+from stations import StationRegistry
+from weather_logger import WeatherLogger
+
+def to_json(value):
+    """ Converts NumPy values and arrays to plain JSON values, with NaN as null. """
+    if hasattr(value, "tolist"):
+        value = value.tolist()
+    if isinstance(value, float):
+        return None if math.isnan(value) else round(value, 2)
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    return value
+
+
+class WeatherService:
+    """ Represents the operations of the application behind a request/response interface.
+    Each location's dataset is loaded on first use and kept in memory
+    until the data version of the location changes. """
+    OPERATIONS = ("download", "update", "stats", "plot")
+
+    def __init__(self, db_name="weather_data.sqlite", registry=None, plot_cache_dir=None):
+        """ Initializes an instance of the WeatherService class.
+        If plot_cache_dir is given, rendered plots are served from a PlotCache in that directory. """
+        self.db_ops = DBOperations(db_name)
+        self.db_ops.initialize_db()
+        self.registry = registry or StationRegistry()
+        self.plot_cache_dir = plot_cache_dir
+        self.stores = {}
+        self._cached_plots = None
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    def station(self, location):
+        """ Returns the registered station stored under a location. """
+        station = self.registry.by_location(location)
+        if station is None:
+            raise ValueError(f"Unknown location: {location}")
+        return station
+
+    def scraper(self, location):
+        """ Returns a scraper for the station of a location, with the stored page validators. """
+        from scrape_weather import WeatherScraper
+        from page_cache import PageCache
+
+        scraper = WeatherScraper(cache=PageCache(), station_id=self.station(location).station_id)
+        scraper.validators = self.db_ops.fetch_validators()
+        return scraper
+
+    def store(self, location):
+        """ Returns the WeatherStore of a location, reloading it if its data has changed since it was loaded. """
+        with self.db_ops.snapshot():
+            version = self.db_ops.fetch_data_version(location, (0, 1), (9999, 12))
+            loaded = self.stores.get(location)
+            if loaded is None or loaded[0] != version:
+                store = self.db_ops.fetch_range("0000-01-01", "9999-12-31", location, columnar=True)
+                self.stores[location] = loaded = (version, store)
+        return loaded[1]
+
+    def download(self, location="Winnipeg, MB"):
+        """ Downloads the full history of a location, resuming an interrupted download. """
+        from checkpointed_download import CheckpointedDownload
+
+        scraper = self.scraper(location)
+        station = self.station(location)
+        rows = CheckpointedDownload(scraper, self.db_ops, location, station.first_year).run()
+        self.db_ops.save_validators(scraper.validators)
+        return {"location": location, "rows": rows}
+
+    def update(self, location="Winnipeg, MB"):
+        """ Fetches the months since the last stored date of a location and writes the changed rows. """
+        most_recent_date = self.db_ops.latest_dates().get(location)
+        if most_recent_date is None:
+            raise ValueError(f"No data stored for {location}, run a download first.")
+
+        scraper = self.scraper(location)
+        changed = self.db_ops.upsert_data(scraper.get_new_weather_data(most_recent_date=most_recent_date),
+                                          location, validators=scraper.validators)
+        return {"location": location, "changed": len(changed),
+                "last_date": self.db_ops.latest_dates().get(location)}
+
+    def stats(self, kind="summary", location="Winnipeg, MB", years=None, start=None, end=None, window=None):
+        """ Returns statistics of a location. Kind is one of:
+        summary (date bounds and day count), monthly (box plot statistics per calendar month over years),
+        yearly (mean, minimum and maximum per year), daily (the rows between the start and end dates),
+        normals (climate normals per calendar month over years, 1991-2020 by default),
+        anomalies (daily anomalies from those normals between the start and end dates),
+        rolling (trailing window-day means between the start and end dates, 30 days by default)
+        or degree-days (heating and cooling degree days per year). """
+        from aggregation import rollup_boxplot_stats, yearly_summary
+        from climate_stats import ClimateStats, NORMAL_PERIOD
+
+        def records(columns):
+            """ Turns a dictionary of arrays into a list of dictionaries, with dates as strings. """
+            import numpy as np
+
+            columns = {key: np.datetime_as_string(values) if key == "date" else values
+                       for key, values in columns.items()}
+            return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+        if kind == "summary":
+            store = self.store(location)
+            if not len(store):
+                return {"location": location, "days": 0, "first_date": None, "last_date": None}
+            return {"location": location, "days": len(store),
+                    "first_date": store.first_date, "last_date": store.last_date}
+
+        if kind == "monthly":
+            first_year, last_year = years or (0, 9999)
+            stats = rollup_boxplot_stats(self.db_ops.fetch_monthly_rollups(first_year, last_year, location))
+            return {"location": location, "months": [
+                {key: month[key] for key in ("label", "count", "mean", "q1", "med", "q3", "whislo", "whishi")}
+                for month in stats]}
+
+        if kind == "yearly":
+            store = self.store(location)
+            if years:
+                store = store.year_span(*years)
+            summary = yearly_summary(store)
+            return {"location": location, "years": [dict(zip(summary, values))
+                                                    for values in zip(*summary.values())]}
+
+        if kind == "daily":
+            if not start or not end:
+                raise ValueError("Daily stats need a start and an end date.")
+            span = self.store(location).slice(start, end)
+            return {"location": location, "days": [
+                {"date": date, "min": day["Min"], "max": day["Max"], "mean": day["Mean"]}
+                for date, day in reversed(span.to_dict().items())]}
+
+        climate = ClimateStats(self.db_ops)
+        if kind == "normals":
+            period = tuple(years or NORMAL_PERIOD)
+            return {"location": location, "period": period, "months": records(climate.normals(location, period))}
+
+        if kind == "degree-days":
+            first_year, last_year = years or (0, 9999)
+            return {"location": location, "years": records(climate.degree_days(location, first_year, last_year))}
+
+        if kind in ("anomalies", "rolling"):
+            if not start or not end:
+                raise ValueError(f"{kind.capitalize()} need a start and an end date.")
+            if kind == "anomalies":
+                return {"location": location, "days": records(climate.anomalies(location, start, end))}
+            return {"location": location, "window": window or 30,
+                    "days": records(climate.rolling_mean(location, start, end, window or 30))}
+
+        raise ValueError(f"Unknown stats kind: {kind}")
+
+    def plot(self, kind="box", output=None, location="Winnipeg, MB", years=None, year=None, month=None,
+             fmt=None):
+        """ Renders a box plot of a span of years, or a line plot of one month, to an image file
+        and returns its path. The format is taken from the output file's extension if not given. """
+        from plot_renderer import PlotJob, render_cached, render_job
+
+        if kind == "box":
+            if not years:
+                raise ValueError("Box plots need a span of years.")
+            job = PlotJob("box", location, years[0], None, years[1], None)
+            default_name = f"box_{years[0]:04d}-{years[1]:04d}"
+        elif kind == "line":
+            if not year or not month:
+                raise ValueError("Line plots need a year and a month.")
+            job = PlotJob("line", location, year, month, None, None)
+            default_name = f"line_{year:04d}-{month:02d}"
+        else:
+            raise ValueError(f"Unknown plot kind: {kind}")
+
+        job = job._replace(path=output or f"{default_name}.{fmt or 'png'}")
+        if fmt and not job.path.endswith(f".{fmt}"):
+            raise ValueError(f"The output file {job.path} does not match the format {fmt}.")
+
+        if self.plot_cache_dir:
+            path = render_cached(job, self.cached_plots())
+        else:
+            path = render_job(job, self.db_ops)
+        if path is None:
+            raise ValueError("There is no data to plot.")
+        return {"path": path}
+
+    def cached_plots(self):
+        """ Returns the plot cache front end, creating it on first use. """
+        if self._cached_plots is None:
+            from plot_cache import CachedPlotOperations, PlotCache
+
+            self._cached_plots = CachedPlotOperations(self.db_ops, PlotCache(self.plot_cache_dir))
+        return self._cached_plots
+
+    def query(self, request):
+        """ Answers a query dictionary such as {"op": "stats", "kind": "yearly"} and returns a response
+        dictionary with "ok" set, echoing the query's "id" if it has one. Errors are returned, not raised. """
+        response = {"id": request["id"]} if "id" in request else {}
+        try:
+            arguments = {key: value for key, value in request.items() if key not in ("op", "id")}
+            operation = request.get("op")
+            if operation not in self.OPERATIONS:
+                raise ValueError(f"Unknown operation: {operation}")
+            response.update(ok=True, **to_json(getattr(self, operation)(**arguments)))
+        except Exception as e:
+            self.logger.error("Query %s failed. Error: %s", request, e)
+            response.update(ok=False, error=str(e))
+        return response
+
+    def serve(self, lines, out):
+        """ Answers newline-delimited JSON queries from an iterable of lines,
+        writing one JSON response per line to out. """
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("A query must be a JSON object.")
+            except ValueError as e:
+                response = {"ok": False, "error": f"Invalid query: {e}"}
+            else:
+                response = self.query(request)
+            out.write(json.dumps(response) + "\n")
+            out.flush()
+
+
+def parse_args(argv=None):
+    """ Parses the command line of the non-interactive interface. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="weather_data.sqlite")
+    parser.add_argument("--registry", help="JSON station registry; defaults to the built-in stations")
+    parser.add_argument("--plot-cache", help="plot cache directory for rendered plots")
+    commands = parser.add_subparsers(dest="op", required=True)
+
+    for name in ("download", "update"):
+        command = commands.add_parser(name)
+        command.add_argument("--location", default="Winnipeg, MB")
+
+    stats = commands.add_parser("stats")
+    stats.add_argument("kind", nargs="?", default="summary", choices=("summary", "monthly", "yearly", "daily", "normals", "anomalies", "rolling", "degree-days"))
+    stats.add_argument("--location", default="Winnipeg, MB")
+    stats.add_argument("--years", type=int, nargs=2, metavar=("FIRST", "LAST"))
+    stats.add_argument("--start", help="first date of daily stats, YYYY-MM-DD")
+    stats.add_argument("--end", help="last date of daily stats, YYYY-MM-DD")
+    stats.add_argument("--window", type=int, help="days in each rolling mean")
+
+    plot = commands.add_parser("plot")
+    plot.add_argument("kind", choices=("box", "line"))
+    plot.add_argument("--location", default="Winnipeg, MB")
+    plot.add_argument("--years", type=int, nargs=2, metavar=("FIRST", "LAST"))
+    plot.add_argument("--year", type=int)
+    plot.add_argument("--month", type=int)
+    plot.add_argument("--format", dest="fmt", choices=("png", "svg"))
+    plot.add_argument("--output", help="image file to write")
+
+    commands.add_parser("serve", help="answer newline-delimited JSON queries from stdin")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """ Runs one command and prints its JSON response, or serves queries from stdin.
+    Returns the process exit code. """
+    args = parse_args(argv)
+    registry = StationRegistry.load(args.registry) if args.registry else None
+    service = WeatherService(args.db, registry, args.plot_cache)
+
+    if args.op == "serve":
+        service.serve(sys.stdin, sys.stdout)
+        return 0
+
+    request = {key: value for key, value in vars(args).items()
+               if key not in ("db", "registry", "plot_cache") and value is not None}
+    response = service.query(request)
+    print(json.dumps(response, indent=2))
+    return 0 if response["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
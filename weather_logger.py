@@ -1,19 +1,113 @@
 """
 This module contains the WeatherLogger class,
 which returns a formatted logger for logging data in this application.
+Records are handed to a background thread through a queue, so the scraping and database
+hot paths never wait on file I/O, and each call site is rate limited so per-row and per-page
+messages cannot flood the log. The log file holds one JSON object per record.
 """
 
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JSONFormatter(logging.Formatter):
+    """ Represents a formatter which renders each record as a single line of JSON.
+    Values passed through a logging call's extra argument become fields of the record. """
+    def format(self, record):
+        """ Returns the record as a JSON string. """
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                    + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """ Represents a filter which lets each call site log at most burst records at once
+    and rate records per second after that, using a token bucket per call site.
+    Warnings and errors are never dropped. The next record let through from a call site
+    carries the number of records dropped before it in its suppressed field. """
+    def __init__(self, rate=5.0, burst=20, min_level=logging.WARNING):
+        """ Initializes an instance of the RateLimitFilter class. """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.min_level = min_level
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        """ Returns True if the record should be logged. """
+        if record.levelno >= self.min_level:
+            return True
+
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, suppressed = self.buckets.get(site, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets[site] = (tokens, now, suppressed + 1)
+                return False
+            self.buckets[site] = (tokens - 1, now, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
 
 class WeatherLogger:
-    """ Represents a formatted logging object. """
+    """ Represents a formatted logging object.
+    Handlers are attached to the shared 'log' logger only once per process,
+    however many instances are created. The class attributes can be changed before
+    the first instance is created to configure the log file, its format and the rate limit. """
+    configured = False
+    lock = threading.Lock()
+    listener = None
+    log_file = 'weather_processor.log'
+    json_format = True
+    rate = 5.0
+    burst = 20
+
     def __init__(self):
         """ Initializes an instance of the WeatherLogger class. """
         self.logger = logging.getLogger('log')
+
+        with WeatherLogger.lock:
+            if not WeatherLogger.configured:
+                self.configure()
+                WeatherLogger.configured = True
+
+    def configure(self):
+        """ Attaches a queue handler to the logger and starts a listener thread
+        which passes the queued records on to the file and console handlers. """
         self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
 
         # File handler for low-level logs
-        file_handler = logging.FileHandler('weather_processor.log')
+        file_handler = logging.FileHandler(WeatherLogger.log_file)
         file_handler.setLevel(logging.DEBUG)
 
         # Console handler is given higher log level
@@ -24,12 +118,54 @@ class WeatherLogger:
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         console_handler.setFormatter(formatter)
-        file_handler.setFormatter(formatter)
+        file_handler.setFormatter(JSONFormatter() if WeatherLogger.json_format else formatter)
+
+        # Records are queued by the logging thread and written by the listener thread
+        records = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(records)
+        queue_handler.addFilter(RateLimitFilter(WeatherLogger.rate, WeatherLogger.burst))
+        self.logger.addHandler(queue_handler)
+
+        WeatherLogger.listener = logging.handlers.QueueListener(
+            records, file_handler, console_handler, respect_handler_level=True)
+        WeatherLogger.listener.start()
 
-        # add the handlers to logger
-        self.logger.addHandler(console_handler)
-        self.logger.addHandler(file_handler)
+    @classmethod
+    def shutdown(cls):
+        """ Stops the listener thread once every queued record has been written. """
+        with cls.lock:
+            if cls.listener is not None:
+                cls.listener.stop()
+                for handler in cls.listener.handlers:
+                    handler.close()
+                cls.listener = None
+
+    @classmethod
+    def reset_after_fork(cls):
+        """ Reconfigures logging in a forked child process, as the parent's listener thread
+        does not exist in the child and records queued there would never be written.
+        Multiprocessing children leave through os._exit, which skips atexit, so the child's
+        listener is stopped by a multiprocessing finalizer instead, writing its last records. """
+        import multiprocessing.util
+
+        logger = logging.getLogger('log')
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        cls.lock = threading.Lock()
+        cls.listener = None
+        if cls.configured:
+            cls.configured = False
+            WeatherLogger()
+            # Process._bootstrap clears the finalizers registered before it runs, so the finalizer is
+            # registered from its after-fork callbacks.
+            multiprocessing.util.register_after_fork(
+                cls, lambda _: multiprocessing.util.Finalize(None, cls.shutdown, exitpriority=0))
 
     def get_logger(self):
         """ Returns the formatted logger. """
-        return self.logger
\ No newline at end of file
+        return self.logger
+
+
+atexit.register(WeatherLogger.shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=WeatherLogger.reset_after_fork)
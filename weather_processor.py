@@ -3,37 +3,88 @@ This module contains the WeatherProcessor class,
 which shows the user a menu for interfacing with the functions of this application.
 WeatherProcessor contains functions for starting a scraping of weather data,
 prompting a database update, and generating box and line plots.
+The scraper, the plotting backend and the full dataset are loaded, and the database schema
+is brought up to date, the first time a menu action needs them, so the menu appears quickly.
+Given command line arguments, it runs the non-interactive interface in weather_cli instead.
 """
 
+import sys
 from menu import Menu
 from db_operations import DBOperations
-from scrape_weather import WeatherScraper
-from plot_operations import PlotOperations
 
 
 class WeatherProcessor:
     """Represents the user interface of the application,
     and includes functions to invoke the various functions of the app."""
 
-    def __init__(self):
+    def __init__(self, fast_start=True):
         """Initializes an instance of the WeatherProcessor class
-        and constructs a menu of options to present to the user."""
+        and constructs a menu of options to present to the user.
+        Only the date bounds are read before the menu is drawn; migrations and rollup backfills
+        run on first use of the database. Unless fast_start is set, the database is initialized
+        and the scraper, plotting and dataset are loaded up front."""
         self.main = None
         self.db_ops = DBOperations()
-        self.weather_scraper = WeatherScraper()
-        self.plot_operations = PlotOperations()
-        self.weather_data = self.db_ops.fetch_data()
+        self.db_initialized = False
+        self._weather_scraper = None
+        self._plot_operations = None
+        self._weather_data = None
         self.first_date = ""
         self.last_date = ""
         self.db_state = ""
         self.main_title = ""
         self.options = []
-        self.db_present = True if self.weather_data is not None else False
+        self.db_present = False
         self.get_first_and_last_date()
         self.update_options()
 
+        if not fast_start:
+            self.load_all()
+
         self.main = Menu(title=self.main_title, prompt=">>", options=self.options)
 
+    def load_all(self):
+        """Loads the scraper, the plotting backend and the dataset immediately."""
+        return self.weather_scraper, self.plot_operations, self.weather_data
+
+    def initialize_db(self):
+        """Initializes the database on its first use, running any pending migrations and rollup backfills."""
+        if not self.db_initialized:
+            self.db_ops.initialize_db()
+            self.db_initialized = True
+
+    @property
+    def weather_scraper(self):
+        """Returns the weather scraper, creating it on first use."""
+        if self._weather_scraper is None:
+            from scrape_weather import WeatherScraper
+            from page_cache import PageCache
+
+            self._weather_scraper = WeatherScraper(cache=PageCache())
+        return self._weather_scraper
+
+    @property
+    def plot_operations(self):
+        """Returns the plot operations, importing the plotting backend on first use."""
+        if self._plot_operations is None:
+            from plot_operations import PlotOperations
+
+            self._plot_operations = PlotOperations()
+        return self._plot_operations
+
+    @property
+    def weather_data(self):
+        """Returns the full dataset as a WeatherStore, loading it on first use."""
+        if self._weather_data is None:
+            self.initialize_db()
+            self._weather_data = self.db_ops.fetch_data("Winnipeg, MB", columnar=True)
+        return self._weather_data
+
+    @weather_data.setter
+    def weather_data(self, weather_data):
+        """Replaces the loaded dataset."""
+        self._weather_data = weather_data
+
     def download_weather_data(self):
         """Prompts the user to confirm scraping,
         or go back to the main menu."""
@@ -41,10 +92,17 @@ class WeatherProcessor:
         def begin_scraping(self, sub):
             """Initiates the process of scraping the Winnipeg weather site,
             going from most recent to oldest."""
-            self.weather_data = self.weather_scraper.scrape_weather_data()
-            self.db_ops.initialize_db()
-            self.db_ops.purge_data()
-            self.db_ops.save_data(self.weather_data, "Winnipeg, MB")
+            from checkpointed_download import CheckpointedDownload
+
+            try:
+                self.initialize_db()
+                CheckpointedDownload(self.weather_scraper, self.db_ops, "Winnipeg, MB").run()
+            except Exception as e:
+                print(f"Download interrupted ({e}). Run it again to resume where it stopped.")
+                sub.close()
+                return
+            self.db_ops.save_validators(self.weather_scraper.validators)
+            self.weather_data = None
             self.get_first_and_last_date()
             self.db_present = True
             self.update_options()
@@ -71,11 +129,22 @@ class WeatherProcessor:
         def begin_updating(self, sub):
             """Initiates the process of updating the weather data database,
             checking the date of the last record and scraping only the missing dates."""
+            self.initialize_db()
+            self.weather_scraper.validators = self.db_ops.fetch_validators()
+            most_recent_date = self.db_ops.latest_dates().get("Winnipeg, MB", self.last_date)
             new_weather_data = self.weather_scraper.get_new_weather_data(
-                self.weather_data
+                most_recent_date=most_recent_date
             )
-            self.db_ops.save_data(new_weather_data)
-            self.weather_data = self.db_ops.fetch_data()
+            try:
+                changed = self.db_ops.upsert_data(
+                    new_weather_data, "Winnipeg, MB", validators=self.weather_scraper.validators
+                )
+            except Exception as e:
+                print(f"Update failed ({e}). Run it again to fetch the missing days.")
+                sub.close()
+                return
+            if self._weather_data is not None:
+                self._weather_data.upsert(changed)
             self.get_first_and_last_date()
 
             sub.close()
@@ -143,8 +212,12 @@ class WeatherProcessor:
             except EndGreaterThanStartError as e:
                 print(e)
 
-        self.plot_operations.create_boxplot(
-            self.weather_data, boxplot_start_year, boxplot_end_year
+        from aggregation import rollup_boxplot_stats
+
+        self.initialize_db()
+        rollups = self.db_ops.fetch_monthly_rollups(boxplot_start_year, boxplot_end_year)
+        self.plot_operations.plot_boxplot_summary(
+            rollup_boxplot_stats(rollups), boxplot_start_year, boxplot_end_year
         )
 
     def generate_line_plot(self):
@@ -184,15 +257,24 @@ class WeatherProcessor:
             except YearOutOfRangeError as e:
                 print(e)
 
-        self.plot_operations.create_lineplot(
-            self.weather_data, lineplot_year, lineplot_month
-        )
+        self.initialize_db()
+        if not self.db_ops.covered_months("Winnipeg, MB", (lineplot_year, lineplot_month),
+                                          (lineplot_year, lineplot_month)):
+            print(f"No temperatures are stored for {lineplot_year:04d}-{lineplot_month:02d}.")
+            return
+
+        if self._weather_data is not None:
+            month_data = self._weather_data.month(lineplot_year, lineplot_month)
+        else:
+            month_data = self.db_ops.fetch_month(lineplot_year, lineplot_month, columnar=True)
+        self.plot_operations.create_lineplot(month_data, lineplot_year, lineplot_month)
 
     def get_first_and_last_date(self):
         """Gets the first and last stored dates in the database to display to the user."""
         try:
-            self.first_date = str(list(self.weather_data.keys())[-1])
-            self.last_date = str(list(self.weather_data.keys())[0])
+            self.first_date, self.last_date = self.db_ops.fetch_date_bounds()
+            if self.last_date is None:
+                raise ValueError("The database is empty.")
             self.db_state = f"\n\nLast recorded date: {self.last_date}"
             self.main_title = f"Welcome to WeatherProcessor. Please select a function to execute. {self.db_state}"
             self.db_present = True
@@ -240,4 +322,9 @@ class EndGreaterThanStartError(Exception):
     """Custom exception class raised when user selects an end year less than the start"""
 
 
-WeatherProcessor().run()
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from weather_cli import main
+
+        sys.exit(main())
+    WeatherProcessor().run()
@@ -0,0 +1,318 @@
+"""
+This module contains the WeatherHTTPService class,
+a small asyncio HTTP service which serves daily temperatures, monthly and yearly aggregates
+and rendered plots from the database managed by DBOperations.
+Requests are parsed on the event loop, while SQLite reads and plot rendering run on a thread pool
+over pooled read-only connections. JSON responses are cached in memory until the data version
+of the months they cover changes.
+
+Endpoints (all GET, location defaults to Winnipeg, MB):
+    /range?start=YYYY-MM-DD&end=YYYY-MM-DD      daily min, max and mean temperatures
+    /monthly?start_year=&end_year=              box plot statistics per calendar month
+    /yearly?start_year=&end_year=               mean, minimum and maximum per year
+    /plot/box?start_year=&end_year=&format=png  rendered box plot
+    /plot/line?year=&month=&format=png          rendered line plot
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+from db_operations import DBOperations
+from dbcm import ConnectionPool
+from weather_cli import to_json
+from weather_logger import WeatherLogger
+
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  500: "Internal Server Error"}
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+class HTTPError(Exception):
+    """ Custom exception class raised to answer a request with an error status. """
+    def __init__(self, status, message):
+        """ Initializes an instance of the HTTPError class. """
+        super().__init__(message)
+        self.status = status
+
+
+class ResponseCache:
+    """ Represents a bounded, least recently used cache of response bodies,
+    each stored with the data version it was built from. """
+    def __init__(self, max_entries=1024):
+        """ Initializes an instance of the ResponseCache class. """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """ Returns the cached (content_type, body) pair for a key if it was built from the given version. """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, response):
+        """ Stores a (content_type, body) pair built from the given version. """
+        with self.lock:
+            self.entries[key] = (version, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class WeatherHTTPService:
+    """ Represents the HTTP query service. """
+    def __init__(self, db_name="weather_data.sqlite", host="127.0.0.1", port=8765, threads=8,
+                 cache_entries=1024, plot_cache_dir="plot_cache"):
+        """ Initializes an instance of the WeatherHTTPService class.
+        Threads is the size of the thread pool running queries, and of its read-only connection pool. """
+        self.db_name = db_name
+        self.host = host
+        self.port = port
+        DBOperations(db_name).initialize_db()
+        self.db_ops = DBOperations(db_name, read_only=True)
+        ConnectionPool.get(db_name, read_only=True).max_size = threads
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="weather-query")
+        self.cache = ResponseCache(cache_entries)
+        self.plot_cache_dir = plot_cache_dir
+        self._cached_plots = None
+        self.plots_lock = threading.Lock()
+        self.server = None
+        self.routes = {
+            "/range": self.get_range,
+            "/monthly": self.get_monthly,
+            "/yearly": self.get_yearly,
+            "/plot/box": self.get_box_plot,
+            "/plot/line": self.get_line_plot,
+        }
+
+        logger = WeatherLogger()
+        self.logger = logger.get_logger()
+
+    @staticmethod
+    def int_param(params, name, default=None):
+        """ Returns an integer query parameter, raising a 400 error if it is missing or malformed. """
+        value = params.get(name, default)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise HTTPError(400, f"Query parameter {name} must be an integer.")
+
+    @staticmethod
+    def json_response(value):
+        """ Returns a (content_type, body) pair holding a value as JSON. """
+        return "application/json", json.dumps(to_json(value)).encode()
+
+    def get_range(self, params, location):
+        """ Returns the daily rows of a location between two dates. """
+        start, end = params.get("start"), params.get("end")
+        if not start or not end:
+            raise HTTPError(400, "Query parameters start and end are required.")
+        version = self.db_ops.fetch_data_version(location, (int(start[:4]), int(start[5:7] or 1)),
+                                                 (int(end[:4]), int(end[5:7] or 12)))
+
+        def build():
+            rows = self.db_ops.fetch_range(start, end, location)
+            return self.json_response({"location": location, "days": [
+                {"date": date, "min": day["Min"], "max": day["Max"], "mean": day["Mean"]}
+                for date, day in rows.items()]})
+        return version, build
+
+    def get_monthly(self, params, location):
+        """ Returns box plot statistics per calendar month over a span of years. """
+        from aggregation import rollup_boxplot_stats
+
+        start_year = self.int_param(params, "start_year", 0)
+        end_year = self.int_param(params, "end_year", 9999)
+        version = self.db_ops.fetch_data_version(location, (start_year, 1), (end_year, 12))
+
+        def build():
+            stats = rollup_boxplot_stats(self.db_ops.fetch_monthly_rollups(start_year, end_year, location))
+            return self.json_response({"location": location, "months": [
+                {key: month[key] for key in ("label", "count", "mean", "q1", "med", "q3", "whislo", "whishi")}
+                for month in stats]})
+        return version, build
+
+    def get_yearly(self, params, location):
+        """ Returns the mean, minimum and maximum temperature of each year in a span. """
+        from aggregation import yearly_summary
+
+        start_year = self.int_param(params, "start_year", 0)
+        end_year = self.int_param(params, "end_year", 9999)
+        version = self.db_ops.fetch_data_version(location, (start_year, 1), (end_year, 12))
+
+        def build():
+            summary = yearly_summary(self.db_ops.fetch_years(start_year, end_year, location, columnar=True))
+            return self.json_response({"location": location, "years": [
+                dict(zip(summary, values)) for values in zip(*summary.values())]})
+        return version, build
+
+    def cached_plots(self):
+        """ Returns the plot cache front end, creating it on first use. """
+        with self.plots_lock:
+            if self._cached_plots is None:
+                from plot_cache import CachedPlotOperations, PlotCache
+
+                self._cached_plots = CachedPlotOperations(self.db_ops, PlotCache(self.plot_cache_dir))
+            return self._cached_plots
+
+    def plot_response(self, image, fmt):
+        """ Returns a (content_type, body) pair holding a rendered plot. """
+        if image is None:
+            raise HTTPError(404, "There is no data to plot.")
+        return CONTENT_TYPES[fmt], image
+
+    def plot_format(self, params):
+        """ Returns the requested image format. """
+        fmt = params.get("format", "png")
+        if fmt not in CONTENT_TYPES:
+            raise HTTPError(400, f"Unsupported format: {fmt}")
+        return fmt
+
+    def get_box_plot(self, params, location):
+        """ Returns a rendered box plot of a span of years. Plots are cached on disk by the plot cache. """
+        start_year = self.int_param(params, "start_year")
+        end_year = self.int_param(params, "end_year")
+        fmt = self.plot_format(params)
+        return None, lambda: self.plot_response(
+            self.cached_plots().boxplot_image(start_year, end_year, location, fmt), fmt)
+
+    def get_line_plot(self, params, location):
+        """ Returns a rendered line plot of a month. Plots are cached on disk by the plot cache. """
+        year = self.int_param(params, "year")
+        month = self.int_param(params, "month")
+        fmt = self.plot_format(params)
+        return None, lambda: self.plot_response(
+            self.cached_plots().lineplot_image(year, month, location, fmt), fmt)
+
+    def answer(self, target):
+        """ Answers a request target such as "/yearly?start_year=1990", returning a (content_type, body)
+        pair. Runs on the thread pool: it checks the data version, then serves or rebuilds the response. """
+        parts = urlsplit(target)
+        handler = self.routes.get(parts.path)
+        if handler is None:
+            raise HTTPError(404, f"No such endpoint: {parts.path}")
+
+        params = dict(parse_qsl(parts.query))
+        location = params.pop("location", "Winnipeg, MB")
+        try:
+            version, build = handler(params, location)
+        except (ValueError, IndexError) as e:
+            raise HTTPError(400, f"Malformed query: {e}")
+
+        key = (parts.path, location, tuple(sorted(params.items())))
+        if version is not None:
+            response = self.cache.get(key, version)
+            if response is not None:
+                return response
+
+        response = build()
+        if version is not None:
+            self.cache.put(key, version, response)
+        return response
+
+    async def handle_connection(self, reader, writer):
+        """ Serves the requests of one keep-alive connection until the client closes it. """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, "text/plain", b"Malformed request line.", False)
+                    break
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                if method != "GET":
+                    # Any request body is left unread, so the connection cannot be reused.
+                    keep_alive = False
+                    status, content_type, body = 405, "text/plain", b"Only GET is supported."
+                else:
+                    try:
+                        content_type, body = await loop.run_in_executor(self.executor, self.answer, target)
+                        status = 200
+                    except HTTPError as e:
+                        status, content_type, body = e.status, "application/json", json.dumps(
+                            {"error": str(e)}).encode()
+                    except Exception as e:
+                        self.logger.error("Request %s failed. Error: %s", target, e)
+                        status, content_type, body = 500, "application/json", json.dumps(
+                            {"error": "Internal error."}).encode()
+
+                await self.respond(writer, status, content_type, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer, status, content_type, body, keep_alive):
+        """ Writes an HTTP/1.1 response. """
+        head = (f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def start(self):
+        """ Starts listening and returns the asyncio server. """
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.logger.info("Weather service listening on http://%s:%s", self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        """ Serves requests until the task is cancelled. """
+        server = await self.start()
+        print(f"Serving on http://{self.host}:{self.port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """ Shuts down the thread pool. """
+        self.executor.shutdown(wait=False)
+
+
+def main():
+    """ Runs the service until interrupted. """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="weather_data.sqlite")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--plot-cache", default="plot_cache")
+    args = parser.parse_args()
+
+    service = WeatherHTTPService(args.db, args.host, args.port, args.threads, plot_cache_dir=args.plot_cache)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+This module contains the WeatherStore class,
+a compact columnar container for daily weather data backed by NumPy arrays.
+"""
+
+from datetime import date
+import numpy as np
+from data_quality import decode_flags, encode_flags
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+QUALITY_DTYPE = "U3"
+
+class WeatherStore:
+    """ Represents daily weather data as parallel columns sorted by date:
+    int32 day ordinals and float32 min, max and mean temperatures, with NaN for missing values,
+    and the quality flag code of each day (see data_quality.encode_flags), empty for days without flags. """
+    def __init__(self, ordinals=None, min_temps=None, max_temps=None, mean_temps=None, quality=None):
+        """ Initializes an instance of the WeatherStore class.
+        The columns are sorted by date if they are not already. """
+        self.ordinals = np.asarray(ordinals if ordinals is not None else [], dtype=np.int32)
+        self.min = np.asarray(min_temps if min_temps is not None else [], dtype=np.float32)
+        self.max = np.asarray(max_temps if max_temps is not None else [], dtype=np.float32)
+        self.mean = np.asarray(mean_temps if mean_temps is not None else [], dtype=np.float32)
+        self.quality = (np.asarray(quality, dtype=QUALITY_DTYPE) if quality is not None
+                        else np.zeros(len(self.ordinals), dtype=QUALITY_DTYPE))
+
+        if len(self.ordinals) > 1 and np.any(np.diff(self.ordinals) < 0):
+            order = np.argsort(self.ordinals, kind="stable")
+            self.ordinals = self.ordinals[order]
+            self.min = self.min[order]
+            self.max = self.max[order]
+            self.mean = self.mean[order]
+            self.quality = self.quality[order]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Builds a store from an iterable of (date, min, max, mean, quality) rows,
+        where date is an ISO formatted string and missing values and quality codes are None.
+        The quality column may be left out. """
+        rows = list(rows)
+        if not rows:
+            return cls()
+
+        dates, min_temps, max_temps, mean_temps, *quality = zip(*rows)
+        return cls(cls.to_ordinals(dates),
+                   np.array(min_temps, dtype=np.float64),
+                   np.array(max_temps, dtype=np.float64),
+                   np.array(mean_temps, dtype=np.float64),
+                   [code or "" for code in quality[0]] if quality else None)
+
+    @classmethod
+    def from_dict(cls, weather_data):
+        """ Builds a store from a dictionary of date: {'Min', 'Max', 'Mean', 'Flags'} pairs. """
+        return cls.from_rows((date, data.get('Min'), data.get('Max'), data.get('Mean'),
+                              encode_flags(data.get('Flags')))
+                             for date, data in weather_data.items())
+
+    @staticmethod
+    def to_ordinals(dates):
+        """ Converts ISO formatted date strings to an array of day ordinals. """
+        days = np.array(dates, dtype="datetime64[D]").astype(np.int64)
+        return (days + EPOCH_ORDINAL).astype(np.int32)
+
+    @staticmethod
+    def to_ordinal(value):
+        """ Converts an ISO formatted date string or a date to a day ordinal. """
+        if isinstance(value, str):
+            value = date.fromisoformat(value)
+        return value.toordinal()
+
+    def __len__(self):
+        """ Returns the number of days in the store. """
+        return len(self.ordinals)
+
+    @property
+    def nbytes(self):
+        """ Returns the number of bytes used by the columns. """
+        return (self.ordinals.nbytes + self.min.nbytes + self.max.nbytes + self.mean.nbytes
+                + self.quality.nbytes)
+
+    @property
+    def first_date(self):
+        """ Returns the earliest date in the store as an ISO formatted string. """
+        return date.fromordinal(int(self.ordinals[0])).isoformat()
+
+    @property
+    def last_date(self):
+        """ Returns the latest date in the store as an ISO formatted string. """
+        return date.fromordinal(int(self.ordinals[-1])).isoformat()
+
+    def dates(self):
+        """ Returns the dates in the store as an array of datetime64 days. """
+        return (self.ordinals.astype(np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
+
+    def years(self):
+        """ Returns the year of each day in the store. """
+        return self.dates().astype("datetime64[Y]").astype(np.int64) + 1970
+
+    def months(self):
+        """ Returns the month (1-12) of each day in the store. """
+        return self.dates().astype("datetime64[M]").astype(np.int64) % 12 + 1
+
+    def days(self):
+        """ Returns the day of the month of each day in the store. """
+        dates = self.dates()
+        return (dates - dates.astype("datetime64[M]")).astype(np.int64) + 1
+
+    def take(self, index):
+        """ Returns a new store holding the rows selected by a slice or index array. """
+        return WeatherStore(self.ordinals[index], self.min[index], self.max[index], self.mean[index],
+                            self.quality[index])
+
+    def slice(self, start_date, end_date):
+        """ Returns the days between two dates (inclusive) using a binary search on the sorted ordinals. """
+        start = np.searchsorted(self.ordinals, self.to_ordinal(start_date), side="left")
+        end = np.searchsorted(self.ordinals, self.to_ordinal(end_date), side="right")
+        return self.take(slice(start, end))
+
+    def month(self, year, month):
+        """ Returns the days of a single month. """
+        last_day = date(year + month // 12, month % 12 + 1, 1).toordinal() - 1
+        return self.slice(date(year, month, 1), date.fromordinal(last_day))
+
+    def year_span(self, start_year, end_year):
+        """ Returns the days of a span of years. """
+        return self.slice(date(start_year, 1, 1), date(end_year, 12, 31))
+
+    def upsert(self, weather_data):
+        """ Patches the store in place with a dictionary of date: {'Min', 'Max', 'Mean', 'Flags'} pairs,
+        overwriting existing days and inserting new ones in date order. """
+        if not weather_data:
+            return
+
+        patch = WeatherStore.from_dict(weather_data)
+        positions = np.searchsorted(self.ordinals, patch.ordinals)
+        existing = positions < len(self.ordinals)
+        existing[existing] = self.ordinals[positions[existing]] == patch.ordinals[existing]
+
+        for column, values in ((self.min, patch.min), (self.max, patch.max), (self.mean, patch.mean),
+                               (self.quality, patch.quality)):
+            column[positions[existing]] = values[existing]
+
+        new = ~existing
+        if new.any():
+            at = positions[new]
+            self.ordinals = np.insert(self.ordinals, at, patch.ordinals[new])
+            self.min = np.insert(self.min, at, patch.min[new])
+            self.max = np.insert(self.max, at, patch.max[new])
+            self.mean = np.insert(self.mean, at, patch.mean[new])
+            self.quality = np.insert(self.quality, at, patch.quality[new])
+
+    def to_dict(self):
+        """ Returns the data as a dictionary of date: {'Min', 'Max', 'Mean'} pairs, newest first,
+        with the 'Flags' of flagged days. """
+        def value(number):
+            return None if np.isnan(number) else round(float(number), 1)
+
+        weather_data = {}
+        for ordinal, min_temp, max_temp, mean_temp, code in zip(
+                self.ordinals[::-1], self.min[::-1], self.max[::-1], self.mean[::-1], self.quality[::-1]):
+            day = weather_data[date.fromordinal(int(ordinal)).isoformat()] = {
+                'Min': value(min_temp), 'Max': value(max_temp), 'Mean': value(mean_temp)}
+            if code:
+                day['Flags'] = decode_flags(code)
+        return weather_data